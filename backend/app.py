@@ -1,158 +1,1040 @@
-from flask import Flask, request, jsonify, g, send_from_directory
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
+from flask import Flask, Response, request, jsonify, g, send_from_directory, send_file
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt, get_jwt_identity
 from flask_cors import CORS
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
 import sqlite3
 import os
+import base64
+import csv
+import hashlib
+import io
+import json
+import mimetypes
+import multiprocessing
+import queue
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import timedelta
 import datetime
-from werkzeug.utils import secure_filename
+import gzip
+import click
+from werkzeug.exceptions import NotFound, RequestedRangeNotSatisfiable, RequestEntityTooLarge
+from werkzeug.utils import safe_join, secure_filename
 import pandas as pd
 import openpyxl
 
+try:
+    import brotli  # 可选依赖，未安装时只使用gzip压缩
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps  # 生成缩略图；未安装时 size 参数返回原图
+except ImportError:
+    Image = None
+
 app = Flask(__name__)
 
-# 创建上传文件目录
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# 运行配置：均可通过环境变量覆盖，生产环境必须设置 JWT_SECRET_KEY
+DEFAULT_JWT_SECRET_KEY = 'your-secret-key'
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')  # 上传目录在 init_app 中创建
 
-app.config['JWT_SECRET_KEY'] = 'your-secret-key'  # 在生产环境中使用更安全的密钥
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)  # Token有效期1天
+app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', DEFAULT_JWT_SECRET_KEY)
+app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=int(os.environ.get('JWT_ACCESS_TOKEN_HOURS', 24)))  # Token默认有效期1天
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 jwt = JWTManager(app)
 
 # 数据库配置
-DATABASE = 'database.sqlite'
+DATABASE = os.environ.get('DATABASE_PATH', 'database.sqlite')
+
+# 上传文件配置
+UPLOAD_HASH_CHUNK_SIZE = 64 * 1024
+UPLOAD_GC_GRACE_SECONDS = int(os.environ.get('UPLOAD_GC_GRACE_SECONDS', 24 * 3600))
+
+# 图片缩略图配置：尺寸名 -> 最长边像素
+DERIVATIVE_SIZES = {'thumb': 160, 'medium': 800}
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+DERIVATIVE_TIMEOUT = float(os.environ.get('DERIVATIVE_TIMEOUT', 30))  # 秒；请求时按需生成的最长等待时间
+DERIVATIVE_QUALITY = int(os.environ.get('DERIVATIVE_QUALITY', 85))
+DERIVATIVE_FAILED_SUFFIX = '.failed'  # 无法生成缩略图（不是图片或Pillow无法解码）时在目标路径旁写入的标记文件
+
+# 上传文件的缓存和发送配置
+UPLOAD_IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # 按内容哈希命名的文件内容永不改变
+UPLOAD_MAX_AGE = int(os.environ.get('UPLOAD_MAX_AGE', 24 * 3600))  # 旧文件名及回退返回原图时的缓存秒数
+# 由前端Web服务器发送文件：''（Python直接发送）、'x-accel'（nginx）或 'x-sendfile'（Apache、lighttpd）
+UPLOAD_SENDFILE = os.environ.get('UPLOAD_SENDFILE', '')
+# nginx中指向上传目录的 internal location
+UPLOAD_ACCEL_PREFIX = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+app.config['USE_X_SENDFILE'] = UPLOAD_SENDFILE == 'x-sendfile'
+
+# 请求体大小上限：超过时在读取请求体之前直接返回413
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+
+# 上传配置：各类文件的大小上限（普通上传与分块上传共用）、分块大小范围和未完成会话的保留时间
+UPLOAD_SIZE_LIMITS = {
+    'image': int(os.environ.get('UPLOAD_IMAGE_MAX_SIZE', 10 * 1024 * 1024)),
+    'import': int(os.environ.get('UPLOAD_IMPORT_MAX_SIZE', 5 * 1024 * 1024))
+}
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MIN_CHUNK_SIZE = 64 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))
+
+# 密码哈希配置：修改后，旧参数的哈希在用户下次登录成功时自动重新计算
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+# 哈希计算在独立的线程池中进行，排队加运行中的任务超过上限时直接返回503。
+# 等待哈希结果的登录请求会占用处理请求的线程，上限必须小于每个进程的请求线程数（WEB_THREADS），
+# 至少留出一个线程处理其他接口
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 4))
+PASSWORD_HASH_MAX_PENDING = max(1, min(int(os.environ.get('PASSWORD_HASH_MAX_PENDING', WEB_THREADS - 1)),
+                                       WEB_THREADS - 1))
+PASSWORD_HASH_WORKERS = min(int(os.environ.get('PASSWORD_HASH_WORKERS', 2)), PASSWORD_HASH_MAX_PENDING)
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))  # 秒
+
+# 登录限流：时间窗口内每个IP、每个用户名的登录失败次数上限（成功的登录不计数）
+# 在nginx等反向代理之后运行时需要在 wsgi.py 中设置 TRUSTED_PROXIES，否则所有请求都来自代理的IP
+LOGIN_THROTTLE_WINDOW = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 300))  # 秒
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', 50))
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', 5))
+
+# 连接池配置（可通过环境变量调整）
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # 等待空闲连接的最长秒数
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16 * 1024))
+
+class ConnectionPool:
+    """SQLite连接池：连接在请求之间复用，打开时统一设置WAL等PRAGMA"""
+
+    def __init__(self, database, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        # LIFO使最近归还的（缓存最热的）连接优先被复用
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._metrics = {
+            'checkouts': 0,
+            'checkout_timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'in_use': 0
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False  # 连接会在线程间传递，但同一时间只被一个请求持有
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+        with self._lock:
+            self._metrics['connections_created'] += 1
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._metrics['connections_discarded'] += 1
+
+    def acquire(self):
+        start = time.perf_counter()
+        while True:
+            conn = None
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                else:
+                    remaining = self.timeout - (time.perf_counter() - start)
+                    try:
+                        conn = self._idle.get(timeout=max(remaining, 0))
+                    except queue.Empty:
+                        with self._lock:
+                            self._metrics['checkout_timeouts'] += 1
+                        raise RuntimeError('数据库连接池已耗尽，等待超时')
+
+            if self._is_healthy(conn):
+                break
+            self._discard(conn)
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['in_use'] += 1
+            self._metrics['wait_time_total_ms'] += wait_ms
+            self._metrics['wait_time_max_ms'] = max(self._metrics['wait_time_max_ms'], wait_ms)
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self._metrics['in_use'] -= 1
+        try:
+            # 归还前回滚未提交的事务，避免把锁带给下一个请求
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['size'] = self.size
+            stats['open_connections'] = self._created
+        stats['idle'] = self._idle.qsize()
+        checkouts = stats['checkouts']
+        stats['wait_time_avg_ms'] = stats['wait_time_total_ms'] / checkouts if checkouts else 0.0
+        return stats
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """返回当前进程的连接池；fork出的worker进程会重新创建自己的连接池"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(DATABASE)
+                _pool_pid = os.getpid()
+    return _pool
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        g.db = get_pool().acquire()
     return g.db
 
 @app.teardown_appcontext
 def close_db(error):
-    if hasattr(g, 'db'):
-        g.db.close()
+    db = g.pop('db', None)
+    if db is not None:
+        get_pool().release(db)
 
-# 创建测试用户和初始化数据库
-def init_db():
-    print("开始初始化数据库...")
-    try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        # 创建users表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL
-            )
+# 数据库迁移：每个版本按顺序只执行一次，已执行的版本记录在schema_version表中
+def _migration_initial_schema(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            student_id TEXT UNIQUE NOT NULL,
+            grade TEXT NOT NULL,
+            class TEXT,
+            photo_url TEXT,
+            address TEXT,
+            emergency_contact TEXT,
+            emergency_phone TEXT,
+            notes TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS behavior_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS behaviors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            behavior_type TEXT NOT NULL,
+            description TEXT,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            image_url TEXT,
+            FOREIGN KEY (student_id) REFERENCES students (id),
+            FOREIGN KEY (behavior_type) REFERENCES behavior_types (name)
+        )
+    ''')
+
+def _migration_query_indexes(cur):
+    # 学生列表按学生统计行为数：student_id定位，behavior_type用于关联行为类型
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_behaviors_student_type ON behaviors (student_id, behavior_type)')
+    # 行为列表按日期倒序、统计按日期范围筛选
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_behaviors_date ON behaviors (date, behavior_type, student_id)')
+    # 按行为类型筛选
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_behaviors_type_date ON behaviors (behavior_type, date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_behavior_types_category ON behavior_types (category, name)')
+    # 统计按年级筛选
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_students_grade_class ON students (grade, class)')
+
+def _migration_student_behavior_counts(cur):
+    # 每个学生按行为类别的计数汇总，由触发器保持与behaviors表一致
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS student_behavior_counts (
+            student_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, category)
+        ) WITHOUT ROWID
+    ''')
+    # executescript会先提交当前事务，这里逐条执行以保持迁移的原子性
+    triggers = [
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_behaviors_counts_insert
+        AFTER INSERT ON behaviors
+        BEGIN
+            INSERT INTO student_behavior_counts (student_id, category, count)
+            SELECT NEW.student_id, bt.category, 1 FROM behavior_types bt WHERE bt.name = NEW.behavior_type
+            ON CONFLICT (student_id, category) DO UPDATE SET count = count + 1;
+        END;
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_behaviors_counts_delete
+        AFTER DELETE ON behaviors
+        BEGIN
+            UPDATE student_behavior_counts SET count = count - 1
+            WHERE student_id = OLD.student_id
+              AND category = (SELECT category FROM behavior_types WHERE name = OLD.behavior_type);
+        END;
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_behaviors_counts_update
+        AFTER UPDATE OF student_id, behavior_type ON behaviors
+        BEGIN
+            UPDATE student_behavior_counts SET count = count - 1
+            WHERE student_id = OLD.student_id
+              AND category = (SELECT category FROM behavior_types WHERE name = OLD.behavior_type);
+            INSERT INTO student_behavior_counts (student_id, category, count)
+            SELECT NEW.student_id, bt.category, 1 FROM behavior_types bt WHERE bt.name = NEW.behavior_type
+            ON CONFLICT (student_id, category) DO UPDATE SET count = count + 1;
+        END;
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_behavior_types_counts_insert
+        AFTER INSERT ON behavior_types
+        BEGIN
+            INSERT INTO student_behavior_counts (student_id, category, count)
+            SELECT student_id, NEW.category, COUNT(*) FROM behaviors WHERE behavior_type = NEW.name
+            GROUP BY student_id
+            ON CONFLICT (student_id, category) DO UPDATE SET count = count + excluded.count;
+        END;
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_behavior_types_counts_delete
+        AFTER DELETE ON behavior_types
+        BEGIN
+            UPDATE student_behavior_counts
+            SET count = count - (SELECT COUNT(*) FROM behaviors b
+                                 WHERE b.student_id = student_behavior_counts.student_id
+                                   AND b.behavior_type = OLD.name)
+            WHERE category = OLD.category;
+        END;
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_behavior_types_counts_update
+        AFTER UPDATE OF name, category ON behavior_types
+        BEGIN
+            UPDATE student_behavior_counts
+            SET count = count - (SELECT COUNT(*) FROM behaviors b
+                                 WHERE b.student_id = student_behavior_counts.student_id
+                                   AND b.behavior_type = OLD.name)
+            WHERE category = OLD.category;
+            INSERT INTO student_behavior_counts (student_id, category, count)
+            SELECT student_id, NEW.category, COUNT(*) FROM behaviors WHERE behavior_type = NEW.name
+            GROUP BY student_id
+            ON CONFLICT (student_id, category) DO UPDATE SET count = count + excluded.count;
+        END;
+        '''
+    ]
+    for trigger in triggers:
+        cur.execute(trigger)
+    cur.execute('''
+        INSERT INTO student_behavior_counts (student_id, category, count)
+        SELECT b.student_id, bt.category, COUNT(*)
+        FROM behaviors b
+        JOIN behavior_types bt ON b.behavior_type = bt.name
+        GROUP BY b.student_id, bt.category
+    ''')
+
+def _migration_keyset_indexes(cur):
+    # 列表分页按 (date, id) / (student_id, date, id) 做键集分页，rowid隐含在索引末尾。
+    # 迁移2的 (date, behavior_type, student_id) 在同一天内不按id排序，改为只含date，
+    # 同时用于日期范围筛选，不再额外建一个以date开头的索引
+    cur.execute('DROP INDEX IF EXISTS idx_behaviors_date')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_behaviors_date ON behaviors (date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_behaviors_student_date ON behaviors (student_id, date)')
+
+def _rollup_upsert(select_sql):
+    return f'''
+            INSERT INTO behavior_daily_rollup (day, grade, class, behavior_type, category, count)
+            {select_sql}
+            ON CONFLICT (day, grade, class, behavior_type, category) DO UPDATE SET count = count + excluded.count;'''
+
+def _rollup_students_upsert(select_sql):
+    return f'''
+            INSERT INTO behavior_daily_students (day, grade, class, category, student_id, count)
+            {select_sql}
+            ON CONFLICT (day, category, grade, class, student_id) DO UPDATE SET count = count + excluded.count;'''
+
+def _rollup_behavior_delta(ref, sign):
+    """单条行为记录（NEW/OLD）对两张汇总表的增减"""
+    return (
+        _rollup_upsert(f'''SELECT substr({ref}.date, 1, 10), s.grade, COALESCE(s.class, ''), bt.name, bt.category, {sign}1
+            FROM students s JOIN behavior_types bt ON bt.name = {ref}.behavior_type
+            WHERE s.id = {ref}.student_id''') +
+        _rollup_students_upsert(f'''SELECT substr({ref}.date, 1, 10), s.grade, COALESCE(s.class, ''), bt.category, s.id, {sign}1
+            FROM students s JOIN behavior_types bt ON bt.name = {ref}.behavior_type
+            WHERE s.id = {ref}.student_id''')
+    )
+
+def _rollup_student_delta(ref, sign):
+    """某个学生（NEW/OLD）的全部行为记录对两张汇总表的增减"""
+    return (
+        _rollup_upsert(f'''SELECT substr(b.date, 1, 10), {ref}.grade, COALESCE({ref}.class, ''), bt.name, bt.category, {sign}COUNT(*)
+            FROM behaviors b JOIN behavior_types bt ON bt.name = b.behavior_type
+            WHERE b.student_id = {ref}.id
+            GROUP BY substr(b.date, 1, 10), bt.name''') +
+        _rollup_students_upsert(f'''SELECT substr(b.date, 1, 10), {ref}.grade, COALESCE({ref}.class, ''), bt.category, {ref}.id, {sign}COUNT(*)
+            FROM behaviors b JOIN behavior_types bt ON bt.name = b.behavior_type
+            WHERE b.student_id = {ref}.id
+            GROUP BY substr(b.date, 1, 10), bt.category''')
+    )
+
+def _rollup_type_delta(ref, sign):
+    """某个行为类型（NEW/OLD）的全部行为记录对两张汇总表的增减"""
+    return (
+        _rollup_upsert(f'''SELECT substr(b.date, 1, 10), s.grade, COALESCE(s.class, ''), {ref}.name, {ref}.category, {sign}COUNT(*)
+            FROM behaviors b JOIN students s ON s.id = b.student_id
+            WHERE b.behavior_type = {ref}.name
+            GROUP BY substr(b.date, 1, 10), s.grade, COALESCE(s.class, '')''') +
+        _rollup_students_upsert(f'''SELECT substr(b.date, 1, 10), s.grade, COALESCE(s.class, ''), {ref}.category, s.id, {sign}COUNT(*)
+            FROM behaviors b JOIN students s ON s.id = b.student_id
+            WHERE b.behavior_type = {ref}.name
+            GROUP BY substr(b.date, 1, 10), s.id''')
+    )
+
+def _migration_daily_rollup(cur):
+    # 按 (日期, 年级, 班级, 行为类型, 类别) 汇总的行为计数，供统计接口使用
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS behavior_daily_rollup (
+            day TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            class TEXT NOT NULL,
+            behavior_type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, grade, class, behavior_type, category)
+        ) WITHOUT ROWID
+    ''')
+    # 每天每个分组内出现过的学生，用于精确统计去重学生数（支持删除，不使用近似算法）
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS behavior_daily_students (
+            day TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            class TEXT NOT NULL,
+            category TEXT NOT NULL,
+            student_id INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category, grade, class, student_id)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_rollup_grade_day ON behavior_daily_rollup (grade, day)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_rollup_students_student ON behavior_daily_students (student_id)')
+
+    # 清理计数归零的汇总行
+    day_cleanup = '''
+            DELETE FROM behavior_daily_rollup WHERE day = substr(OLD.date, 1, 10) AND count = 0;
+            DELETE FROM behavior_daily_students WHERE day = substr(OLD.date, 1, 10) AND count = 0;'''
+    student_cleanup = '''
+            DELETE FROM behavior_daily_rollup WHERE grade = OLD.grade AND class = COALESCE(OLD.class, '') AND count = 0;
+            DELETE FROM behavior_daily_students WHERE student_id = OLD.id AND count = 0;'''
+    type_cleanup = '''
+            DELETE FROM behavior_daily_rollup WHERE behavior_type = OLD.name AND count = 0;
+            DELETE FROM behavior_daily_students WHERE category = OLD.category AND count = 0;'''
+    triggers = [
+        ('trg_behaviors_rollup_insert', 'AFTER INSERT ON behaviors',
+         _rollup_behavior_delta('NEW', '+')),
+        ('trg_behaviors_rollup_delete', 'AFTER DELETE ON behaviors',
+         _rollup_behavior_delta('OLD', '-') + day_cleanup),
+        ('trg_behaviors_rollup_update',
+         'AFTER UPDATE OF student_id, behavior_type, date ON behaviors '
+         'WHEN OLD.student_id IS NOT NEW.student_id OR OLD.behavior_type IS NOT NEW.behavior_type '
+         'OR substr(OLD.date, 1, 10) IS NOT substr(NEW.date, 1, 10)',
+         _rollup_behavior_delta('OLD', '-') + _rollup_behavior_delta('NEW', '+') + day_cleanup),
+        ('trg_students_rollup_insert', 'AFTER INSERT ON students',
+         _rollup_student_delta('NEW', '+')),
+        ('trg_students_rollup_delete', 'AFTER DELETE ON students',
+         _rollup_student_delta('OLD', '-') + student_cleanup),
+        ('trg_students_rollup_update',
+         'AFTER UPDATE OF grade, class ON students '
+         'WHEN OLD.grade IS NOT NEW.grade OR OLD.class IS NOT NEW.class',
+         _rollup_student_delta('OLD', '-') + _rollup_student_delta('NEW', '+') + student_cleanup),
+        ('trg_behavior_types_rollup_insert', 'AFTER INSERT ON behavior_types',
+         _rollup_type_delta('NEW', '+')),
+        ('trg_behavior_types_rollup_delete', 'AFTER DELETE ON behavior_types',
+         _rollup_type_delta('OLD', '-') + type_cleanup),
+        ('trg_behavior_types_rollup_update',
+         'AFTER UPDATE OF name, category ON behavior_types '
+         'WHEN OLD.name IS NOT NEW.name OR OLD.category IS NOT NEW.category',
+         _rollup_type_delta('OLD', '-') + _rollup_type_delta('NEW', '+') + type_cleanup),
+    ]
+    for name, event, body in triggers:
+        cur.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+    cur.execute('''
+        INSERT INTO behavior_daily_rollup (day, grade, class, behavior_type, category, count)
+        SELECT substr(b.date, 1, 10), s.grade, COALESCE(s.class, ''), bt.name, bt.category, COUNT(*)
+        FROM behaviors b
+        JOIN students s ON b.student_id = s.id
+        JOIN behavior_types bt ON b.behavior_type = bt.name
+        GROUP BY substr(b.date, 1, 10), s.grade, COALESCE(s.class, ''), bt.name
+    ''')
+    cur.execute('''
+        INSERT INTO behavior_daily_students (day, grade, class, category, student_id, count)
+        SELECT substr(b.date, 1, 10), s.grade, COALESCE(s.class, ''), bt.category, s.id, COUNT(*)
+        FROM behaviors b
+        JOIN students s ON b.student_id = s.id
+        JOIN behavior_types bt ON b.behavior_type = bt.name
+        GROUP BY substr(b.date, 1, 10), bt.category, s.id
+    ''')
+
+def _migration_normalize_behaviors(cur):
+    # 重建behaviors表：行为类型改为整数外键，增加由date生成的day列（ISO日期）
+    # 先删除所有依赖behaviors表的触发器，重建表后按新结构重新创建
+    for (name,) in cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        cur.execute(f'DROP TRIGGER {name}')
+
+    cur.execute('''
+        CREATE TABLE behaviors_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            behavior_type_id INTEGER,
+            description TEXT,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            image_url TEXT,
+            day TEXT GENERATED ALWAYS AS (substr(date, 1, 10)) STORED,
+            FOREIGN KEY (student_id) REFERENCES students (id),
+            FOREIGN KEY (behavior_type_id) REFERENCES behavior_types (id)
+        )
+    ''')
+    # 找不到对应行为类型的记录保留为NULL（原来在关联查询中同样不可见）
+    cur.execute('''
+        INSERT INTO behaviors_new (id, student_id, behavior_type_id, description, date, image_url)
+        SELECT b.id, b.student_id, bt.id, b.description, b.date, b.image_url
+        FROM behaviors b
+        LEFT JOIN behavior_types bt ON bt.name = b.behavior_type
+    ''')
+    # 保留自增序列，避免已删除记录的ID被重新使用
+    old_seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'behaviors'").fetchone()
+    cur.execute('DROP TABLE behaviors')
+    cur.execute('ALTER TABLE behaviors_new RENAME TO behaviors')
+    if old_seq:
+        cur.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'behaviors'", (old_seq[0],))
+
+    cur.execute('CREATE INDEX idx_behaviors_student_type ON behaviors (student_id, behavior_type_id)')
+    cur.execute('CREATE INDEX idx_behaviors_student_date ON behaviors (student_id, date)')
+    cur.execute('CREATE INDEX idx_behaviors_date ON behaviors (date)')
+    cur.execute('CREATE INDEX idx_behaviors_type_day ON behaviors (behavior_type_id, day)')
+    cur.execute('CREATE INDEX idx_behaviors_day ON behaviors (day, behavior_type_id, student_id)')
+
+    # 汇总表改为按行为类型ID统计，重命名行为类型时无需改写任何汇总行
+    cur.execute('DROP TABLE behavior_daily_rollup')
+    cur.execute('''
+        CREATE TABLE behavior_daily_rollup (
+            day TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            class TEXT NOT NULL,
+            behavior_type_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, grade, class, behavior_type_id, category)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('CREATE INDEX idx_rollup_grade_day ON behavior_daily_rollup (grade, day)')
+
+    for name, event, body in behavior_summary_triggers():
+        cur.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+    rebuild_student_behavior_counts(cur)
+    rebuild_behavior_daily_rollup(cur)
+
+def _summary_upserts(rollup_select, students_select):
+    return f'''
+            INSERT INTO behavior_daily_rollup (day, grade, class, behavior_type_id, category, count)
+            {rollup_select}
+            ON CONFLICT (day, grade, class, behavior_type_id, category) DO UPDATE SET count = count + excluded.count;
+            INSERT INTO behavior_daily_students (day, grade, class, category, student_id, count)
+            {students_select}
+            ON CONFLICT (day, category, grade, class, student_id) DO UPDATE SET count = count + excluded.count;'''
+
+def _summary_behavior_delta(ref, sign):
+    """单条行为记录（NEW/OLD）对学生计数和每日汇总的增减"""
+    return f'''
+            INSERT INTO student_behavior_counts (student_id, category, count)
+            SELECT {ref}.student_id, bt.category, {sign}1 FROM behavior_types bt WHERE bt.id = {ref}.behavior_type_id
+            ON CONFLICT (student_id, category) DO UPDATE SET count = count + excluded.count;''' + _summary_upserts(
+        f'''SELECT {ref}.day, s.grade, COALESCE(s.class, ''), bt.id, bt.category, {sign}1
+            FROM students s JOIN behavior_types bt ON bt.id = {ref}.behavior_type_id
+            WHERE s.id = {ref}.student_id''',
+        f'''SELECT {ref}.day, s.grade, COALESCE(s.class, ''), bt.category, s.id, {sign}1
+            FROM students s JOIN behavior_types bt ON bt.id = {ref}.behavior_type_id
+            WHERE s.id = {ref}.student_id'''
+    )
+
+def _summary_student_delta(ref, sign):
+    """某个学生（NEW/OLD）的全部行为记录对每日汇总的增减"""
+    return _summary_upserts(
+        f'''SELECT b.day, {ref}.grade, COALESCE({ref}.class, ''), bt.id, bt.category, {sign}COUNT(*)
+            FROM behaviors b JOIN behavior_types bt ON bt.id = b.behavior_type_id
+            WHERE b.student_id = {ref}.id
+            GROUP BY b.day, bt.id''',
+        f'''SELECT b.day, {ref}.grade, COALESCE({ref}.class, ''), bt.category, {ref}.id, {sign}COUNT(*)
+            FROM behaviors b JOIN behavior_types bt ON bt.id = b.behavior_type_id
+            WHERE b.student_id = {ref}.id
+            GROUP BY b.day, bt.category'''
+    )
+
+def _summary_type_delta(ref, sign):
+    """某个行为类型（NEW/OLD）的全部行为记录对学生计数和每日汇总的增减"""
+    return f'''
+            INSERT INTO student_behavior_counts (student_id, category, count)
+            SELECT student_id, {ref}.category, {sign}COUNT(*) FROM behaviors WHERE behavior_type_id = {ref}.id
+            GROUP BY student_id
+            ON CONFLICT (student_id, category) DO UPDATE SET count = count + excluded.count;''' + _summary_upserts(
+        f'''SELECT b.day, s.grade, COALESCE(s.class, ''), {ref}.id, {ref}.category, {sign}COUNT(*)
+            FROM behaviors b JOIN students s ON s.id = b.student_id
+            WHERE b.behavior_type_id = {ref}.id
+            GROUP BY b.day, s.grade, COALESCE(s.class, '')''',
+        f'''SELECT b.day, s.grade, COALESCE(s.class, ''), {ref}.category, s.id, {sign}COUNT(*)
+            FROM behaviors b JOIN students s ON s.id = b.student_id
+            WHERE b.behavior_type_id = {ref}.id
+            GROUP BY b.day, s.id'''
+    )
+
+def behavior_summary_triggers():
+    """保持 student_behavior_counts 与每日汇总表和behaviors表一致的触发器"""
+    # 清理计数归零的汇总行
+    day_cleanup = '''
+            DELETE FROM behavior_daily_rollup WHERE day = OLD.day AND count = 0;
+            DELETE FROM behavior_daily_students WHERE day = OLD.day AND count = 0;'''
+    student_cleanup = '''
+            DELETE FROM behavior_daily_rollup WHERE grade = OLD.grade AND class = COALESCE(OLD.class, '') AND count = 0;
+            DELETE FROM behavior_daily_students WHERE student_id = OLD.id AND count = 0;'''
+    type_cleanup = '''
+            DELETE FROM behavior_daily_rollup WHERE behavior_type_id = OLD.id AND count = 0;
+            DELETE FROM behavior_daily_students WHERE category = OLD.category AND count = 0;'''
+    # 行为类型ID由AUTOINCREMENT分配，新建的类型不会有已存在的行为记录，因此不需要插入触发器
+    return [
+        ('trg_behaviors_summary_insert', 'AFTER INSERT ON behaviors',
+         _summary_behavior_delta('NEW', '+')),
+        ('trg_behaviors_summary_delete', 'AFTER DELETE ON behaviors',
+         _summary_behavior_delta('OLD', '-') + day_cleanup),
+        ('trg_behaviors_summary_update',
+         'AFTER UPDATE OF student_id, behavior_type_id, date ON behaviors '
+         'WHEN OLD.student_id IS NOT NEW.student_id OR OLD.behavior_type_id IS NOT NEW.behavior_type_id '
+         'OR OLD.day IS NOT NEW.day',
+         _summary_behavior_delta('OLD', '-') + _summary_behavior_delta('NEW', '+') + day_cleanup),
+        ('trg_students_summary_insert', 'AFTER INSERT ON students',
+         _summary_student_delta('NEW', '+')),
+        ('trg_students_summary_delete', 'AFTER DELETE ON students',
+         _summary_student_delta('OLD', '-') + student_cleanup),
+        ('trg_students_summary_update',
+         'AFTER UPDATE OF grade, class ON students '
+         'WHEN OLD.grade IS NOT NEW.grade OR OLD.class IS NOT NEW.class',
+         _summary_student_delta('OLD', '-') + _summary_student_delta('NEW', '+') + student_cleanup),
+        ('trg_behavior_types_summary_delete', 'AFTER DELETE ON behavior_types',
+         _summary_type_delta('OLD', '-') + type_cleanup),
+        ('trg_behavior_types_summary_update',
+         'AFTER UPDATE OF category ON behavior_types '
+         'WHEN OLD.category IS NOT NEW.category',
+         _summary_type_delta('OLD', '-') + _summary_type_delta('NEW', '+') + type_cleanup),
+    ]
+
+def rebuild_student_behavior_counts(cur):
+    """根据behaviors表重新计算student_behavior_counts"""
+    cur.execute('DELETE FROM student_behavior_counts')
+    cur.execute('''
+        INSERT INTO student_behavior_counts (student_id, category, count)
+        SELECT b.student_id, bt.category, COUNT(*)
+        FROM behaviors b
+        JOIN behavior_types bt ON b.behavior_type_id = bt.id
+        GROUP BY b.student_id, bt.category
+    ''')
+
+def rebuild_behavior_daily_rollup(cur):
+    """根据behaviors表重新计算每日汇总表"""
+    cur.execute('DELETE FROM behavior_daily_rollup')
+    cur.execute('DELETE FROM behavior_daily_students')
+    cur.execute('''
+        INSERT INTO behavior_daily_rollup (day, grade, class, behavior_type_id, category, count)
+        SELECT b.day, s.grade, COALESCE(s.class, ''), bt.id, bt.category, COUNT(*)
+        FROM behaviors b
+        JOIN students s ON b.student_id = s.id
+        JOIN behavior_types bt ON b.behavior_type_id = bt.id
+        GROUP BY b.day, s.grade, COALESCE(s.class, ''), bt.id
+    ''')
+    cur.execute('''
+        INSERT INTO behavior_daily_students (day, grade, class, category, student_id, count)
+        SELECT b.day, s.grade, COALESCE(s.class, ''), bt.category, s.id, COUNT(*)
+        FROM behaviors b
+        JOIN students s ON b.student_id = s.id
+        JOIN behavior_types bt ON b.behavior_type_id = bt.id
+        GROUP BY b.day, bt.category, s.id
+    ''')
+
+def _migration_change_log(cur):
+    # 变更日志：每次行变更记录一个单调递增的版本号，供客户端增量同步
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for table in CHANGE_LOG_TABLES:
+        for event, ref in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            cur.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_changes_{event}
+                AFTER {event.upper()} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, operation) VALUES ('{table}', {ref}.id, '{event}');
+                END
+            ''')
+
+# 记录变更日志的表
+CHANGE_LOG_TABLES = ('students', 'behaviors', 'behavior_types')
+
+# 引用上传文件的列：(表, 列)
+UPLOAD_REFERENCES = (('behaviors', 'image_url'), ('students', 'photo_url'))
+
+def upload_name_sql(column):
+    """从图片URL（/api/uploads/<name> 或完整URL）中取出上传文件名的SQL表达式"""
+    return (f"CASE WHEN instr({column}, '/api/uploads/') > 0 "
+            f"THEN substr({column}, instr({column}, '/api/uploads/') + 13) ELSE {column} END")
+
+def _migration_uploads(cur):
+    # 按内容（SHA-256）存储的上传文件；ref_count 为引用该文件的学生照片和行为图片数
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            hash TEXT PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mimetype TEXT,
+            original_name TEXT,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            touched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_uploads_orphans ON uploads (ref_count, touched_at)')
+    for table, column in UPLOAD_REFERENCES:
+        new_name = upload_name_sql(f'NEW.{column}')
+        old_name = upload_name_sql(f'OLD.{column}')
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_uploads_insert
+            AFTER INSERT ON {table} WHEN NEW.{column} IS NOT NULL
+            BEGIN
+                UPDATE uploads SET ref_count = ref_count + 1 WHERE name = {new_name};
+            END
         ''')
-        print("users表创建成功")
-        
-        # 创建students表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS students (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                student_id TEXT UNIQUE NOT NULL,
-                grade TEXT NOT NULL,
-                class TEXT,
-                photo_url TEXT,
-                address TEXT,
-                emergency_contact TEXT,
-                emergency_phone TEXT,
-                notes TEXT
-            )
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_uploads_delete
+            AFTER DELETE ON {table} WHEN OLD.{column} IS NOT NULL
+            BEGIN
+                UPDATE uploads SET ref_count = ref_count - 1 WHERE name = {old_name};
+            END
         ''')
-        print("students表创建成功")
-        
-        # 创建behavior_types表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS behavior_types (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                category TEXT NOT NULL,
-                description TEXT
-            )
+        cur.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_uploads_update
+            AFTER UPDATE OF {column} ON {table} WHEN OLD.{column} IS NOT NEW.{column}
+            BEGIN
+                UPDATE uploads SET ref_count = ref_count - 1 WHERE name = {old_name};
+                UPDATE uploads SET ref_count = ref_count + 1 WHERE name = {new_name};
+            END
         ''')
-        print("behavior_types表创建成功")
-        
-        # 创建behaviors表
-        cursor.execute(''' SELECT count(name) FROM sqlite_master WHERE type='table' AND name='behaviors' ''')
-        if cursor.fetchone()[0] == 0:
-            print("创建behaviors表...")
-            cursor.execute('''
-                CREATE TABLE behaviors (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    student_id INTEGER NOT NULL,
-                    behavior_type TEXT NOT NULL,
-                    description TEXT,
-                    date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    image_url TEXT,
-                    FOREIGN KEY (student_id) REFERENCES students (id),
-                    FOREIGN KEY (behavior_type) REFERENCES behavior_types (name)
-                )
-            ''')
-            print("behaviors表创建成功")
-            
-            # 添加测试行为记录
-            test_behaviors = [
-                (1, '帮助同学', '主动帮助同学复习功课', None),
-                (2, '迟到', '上午第一节课迟到5分钟', None),
-                (3, '获奖', '在数学竞赛中获得一等奖', None)
-            ]
-            cursor.executemany('''
-                INSERT INTO behaviors (student_id, behavior_type, description, image_url)
-                VALUES (?, ?, ?, ?)
-            ''', test_behaviors)
-        
-        # 检查是否需要插入测试数据
-        cursor.execute('SELECT COUNT(*) FROM users')
-        if cursor.fetchone()[0] == 0:
-            print("插入测试用户数据...")
-            # 创建测试用户
-            test_password = 'admin123'
-            hashed_password = generate_password_hash(test_password)
-            cursor.execute('''
-                INSERT INTO users (username, password, role)
-                VALUES (?, ?, ?)
-            ''', ('admin', hashed_password, 'admin'))
-            
-            print("插入测试学生数据...")
-            # 添加测试学生数据
-            test_students = [
-                ('张三', 'S001', '高一', '1班', None, '北京市海淀区', '张父', '13800138000', '品学兼优'),
-                ('李四', 'S002', '高二', '2班', None, '北京市朝阳区', '李母', '13900139000', '积极向上'),
-                ('王五', 'S003', '高三', '3班', None, '北京市西城区', '王父', '13700137000', '认真负责')
-            ]
-            cursor.executemany('''
-                INSERT INTO students (name, student_id, grade, class, photo_url, address, emergency_contact, emergency_phone, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', test_students)
-            
-            print("插入测试行为类型数据...")
-            # 添加测试行为类型数据
-            test_types = [
-                ('迟到', '违纪', '上课迟到'),
-                ('早退', '违纪', '未经许可提前离开'),
-                ('打架', '违纪', '与他人发生肢体冲突'),
-                ('帮助同学', '优秀', '主动帮助有困难的同学'),
-                ('志愿服务', '优秀', '参与学校志愿服务活动'),
-                ('获奖', '优秀', '在比赛或竞赛中获奖')
-            ]
-            cursor.executemany('''
-                INSERT INTO behavior_types (name, category, description)
-                VALUES (?, ?, ?)
-            ''', test_types)
-        
+
+def rebuild_upload_ref_counts(cur):
+    """根据学生照片和行为图片重新计算上传文件的引用数"""
+    references = ' UNION ALL '.join(
+        f'SELECT {upload_name_sql(column)} as name FROM {table} WHERE {column} IS NOT NULL'
+        for table, column in UPLOAD_REFERENCES
+    )
+    cur.execute(f'''
+        UPDATE uploads SET ref_count = (
+            SELECT COUNT(*) FROM ({references}) r WHERE r.name = uploads.name
+        )
+    ''')
+
+def _migration_upload_sessions(cur):
+    # 分块上传会话：会话和已收到的分块保存在数据库中，多个worker进程都能继续同一次上传
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            total_chunks INTEGER NOT NULL,
+            created_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS upload_session_chunks (
+            session_id TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            PRIMARY KEY (session_id, chunk_index)
+        ) WITHOUT ROWID
+    ''')
+
+def _migration_import_jobs(cur):
+    # 导入任务状态保存在数据库中，任意worker进程都能查询进度和取消任务
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            created_by TEXT,
+            status TEXT NOT NULL,
+            message TEXT,
+            total_rows INTEGER,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            error_messages TEXT NOT NULL DEFAULT '[]',
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            owner_pid INTEGER,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+
+def _migration_token_revocations(cur):
+    # 令牌吊销记录：退出登录的令牌（jti），保留到令牌本身过期为止；id 供各进程增量同步
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS token_revocations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            jti TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_token_revocations_jti ON token_revocations (jti)')
+
+def _migration_change_log_dependents(cur):
+    # 列表行中还包含来自其他表的字段：行为记录的学生姓名、年级、班级和行为类型名称，
+    # 学生的违纪、优秀计数。这些字段变化时同时为受影响的行记录变更，客户端才能同步到最新值
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_students_changes_dependents
+        AFTER UPDATE OF name, grade, class ON students
+        WHEN OLD.name IS NOT NEW.name OR OLD.grade IS NOT NEW.grade OR OLD.class IS NOT NEW.class
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation)
+            SELECT 'behaviors', id, 'update' FROM behaviors WHERE student_id = NEW.id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_behavior_types_changes_dependents
+        AFTER UPDATE OF name, category ON behavior_types
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation)
+            SELECT 'behaviors', id, 'update' FROM behaviors
+            WHERE behavior_type_id = NEW.id AND OLD.name IS NOT NEW.name;
+            INSERT INTO change_log (table_name, row_id, operation)
+            SELECT DISTINCT 'students', student_id, 'update' FROM behaviors
+            WHERE behavior_type_id = NEW.id AND OLD.category IS NOT NEW.category;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_behaviors_changes_student_insert
+        AFTER INSERT ON behaviors
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation) VALUES ('students', NEW.student_id, 'update');
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_behaviors_changes_student_delete
+        AFTER DELETE ON behaviors
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation) VALUES ('students', OLD.student_id, 'update');
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_behaviors_changes_student_update
+        AFTER UPDATE OF student_id, behavior_type_id ON behaviors
+        WHEN OLD.student_id IS NOT NEW.student_id OR OLD.behavior_type_id IS NOT NEW.behavior_type_id
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation) VALUES ('students', NEW.student_id, 'update');
+            INSERT INTO change_log (table_name, row_id, operation)
+            SELECT 'students', OLD.student_id, 'update' WHERE OLD.student_id IS NOT NEW.student_id;
+        END
+    ''')
+
+MIGRATIONS = [
+    (1, '创建基础表结构', _migration_initial_schema),
+    (2, '添加查询和统计索引', _migration_query_indexes),
+    (3, '添加学生行为计数汇总表', _migration_student_behavior_counts),
+    (4, '添加列表分页索引', _migration_keyset_indexes),
+    (5, '添加每日行为汇总表', _migration_daily_rollup),
+    (6, '行为记录改用行为类型ID和日期列', _migration_normalize_behaviors),
+    (7, '添加变更日志', _migration_change_log),
+    (8, '添加按内容存储的上传文件表', _migration_uploads),
+    (9, '添加分块上传会话表', _migration_upload_sessions),
+    (10, '添加学生导入任务表', _migration_import_jobs),
+    (11, '添加令牌吊销记录表', _migration_token_revocations),
+    (12, '变更日志记录关联字段的变化', _migration_change_log_dependents),
+]
+
+def get_schema_version(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return cur.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate_db(db):
+    cur = db.cursor()
+    latest = MIGRATIONS[-1][0]
+    if get_schema_version(cur) >= latest:
+        return False
+
+    # 获取写锁后再次读取版本，多个进程同时启动时只有一个会执行迁移（并插入测试数据）
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        current = get_schema_version(cur)
+        if current >= latest:
+            db.commit()
+            return False
+        for version, description, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            print(f"执行数据库迁移 {version}: {description}")
+            migration(cur)
+            cur.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                        (version, description))
         db.commit()
-        print("数据库初始化完成")
-        
+    except Exception:
+        db.rollback()
+        raise
+    return True
+
+def seed_db(db):
+    cur = db.cursor()
+    # 检查是否需要插入测试数据
+    cur.execute('SELECT COUNT(*) FROM users')
+    if cur.fetchone()[0] > 0:
+        return
+
+    print("插入测试用户数据...")
+    # 创建测试用户
+    test_password = 'admin123'
+    hashed_password = generate_password_hash(test_password, PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH)
+    cur.execute('''
+        INSERT INTO users (username, password, role)
+        VALUES (?, ?, ?)
+    ''', ('admin', hashed_password, 'admin'))
+
+    print("插入测试学生数据...")
+    # 添加测试学生数据
+    test_students = [
+        ('张三', 'S001', '高一', '1班', None, '北京市海淀区', '张父', '13800138000', '品学兼优'),
+        ('李四', 'S002', '高二', '2班', None, '北京市朝阳区', '李母', '13900139000', '积极向上'),
+        ('王五', 'S003', '高三', '3班', None, '北京市西城区', '王父', '13700137000', '认真负责')
+    ]
+    cur.executemany('''
+        INSERT INTO students (name, student_id, grade, class, photo_url, address, emergency_contact, emergency_phone, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', test_students)
+
+    print("插入测试行为类型数据...")
+    # 添加测试行为类型数据
+    test_types = [
+        ('迟到', '违纪', '上课迟到'),
+        ('早退', '违纪', '未经许可提前离开'),
+        ('打架', '违纪', '与他人发生肢体冲突'),
+        ('帮助同学', '优秀', '主动帮助有困难的同学'),
+        ('志愿服务', '优秀', '参与学校志愿服务活动'),
+        ('获奖', '优秀', '在比赛或竞赛中获奖')
+    ]
+    cur.executemany('''
+        INSERT INTO behavior_types (name, category, description)
+        VALUES (?, ?, ?)
+    ''', test_types)
+
+    # 添加测试行为记录（仅在全新的空数据库中）
+    cur.execute('SELECT COUNT(*) FROM behaviors')
+    if cur.fetchone()[0] == 0:
+        test_behaviors = [
+            (1, '帮助同学', '主动帮助同学复习功课', None),
+            (2, '迟到', '上午第一节课迟到5分钟', None),
+            (3, '获奖', '在数学竞赛中获得一等奖', None)
+        ]
+        cur.executemany('''
+            INSERT INTO behaviors (student_id, behavior_type_id, description, image_url)
+            VALUES (?, (SELECT id FROM behavior_types WHERE name = ?), ?, ?)
+        ''', test_behaviors)
+
+    db.commit()
+
+# 初始化数据库：已是最新版本时只做一次版本检查
+def init_db():
+    db = None
+    try:
+        db = get_db()
+        if migrate_db(db):
+            seed_db(db)
+            print("数据库初始化完成")
+
     except Exception as e:
         print("数据库初始化失败:", str(e))
         import traceback
@@ -161,63 +1043,708 @@ def init_db():
             db.rollback()
         raise e
 
-# 初始化数据库
-with app.app_context():
-    # 删除旧的数据库文件（如果存在）
-    if os.path.exists(DATABASE):
-        os.remove(DATABASE)
-        print(f"已删除旧的数据库文件: {DATABASE}")
-    
-    init_db()
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_app():
+    """创建上传目录并迁移数据库，每个进程只执行一次
+
+    导入模块时不再做任何初始化。gunicorn 使用 preload_app 时在主进程中执行一次，
+    worker 直接继承；各进程分别初始化时由 migrate_db 的写锁保证只迁移一次。
+    """
+    global _initialized, _pool, _pool_pid
+    with _init_lock:
+        if _initialized:
+            return
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        with app.app_context():
+            init_db()
+        # 关闭初始化时打开的连接：SQLite连接不能跨 fork 使用，worker 进程各自创建连接池
+        with _pool_lock:
+            if _pool is not None:
+                _pool.close_all()
+                _pool = None
+                _pool_pid = None
+        _initialized = True
+
+def create_app():
+    """WSGI应用工厂：配置在导入时从环境变量读取，这里完成一次性初始化后返回应用"""
+    if app.config['JWT_SECRET_KEY'] == DEFAULT_JWT_SECRET_KEY:
+        print('警告: 未设置 JWT_SECRET_KEY 环境变量，正在使用默认密钥，请勿在生产环境中使用')
+    init_app()
+    return app
+
+def shutdown_app():
+    """进程退出前调用：等待后台任务完成并关闭数据库连接"""
+    import_executor.shutdown(wait=True)
+    password_hasher.shutdown()
+    if _derivative_executor is not None and _derivative_executor_pid == os.getpid():
+        _derivative_executor.shutdown(wait=True)
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close_all()
+
+@app.cli.command('rebuild-counts')
+def rebuild_counts_command():
+    """重建学生行为计数汇总表"""
+    init_app()
+    db = get_db()
+    rebuild_student_behavior_counts(db.cursor())
+    db.commit()
+    print("学生行为计数已重建")
+
+@app.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """重建每日行为汇总表"""
+    init_app()
+    db = get_db()
+    rebuild_behavior_daily_rollup(db.cursor())
+    db.commit()
+    print("每日行为汇总已重建")
+
+@app.cli.command('gc-uploads')
+@click.option('--grace', default=UPLOAD_GC_GRACE_SECONDS, show_default=True,
+              help='未被引用的文件至少保留的秒数（刚上传、尚未保存记录的文件）')
+def gc_uploads_command(grace):
+    """重新计算上传文件的引用数，并删除不再被任何学生或行为记录引用的文件"""
+    init_app()
+    db = get_db()
+    removed, freed = collect_orphan_uploads(db, grace)
+    print(f"已删除 {removed} 个未被引用的上传文件，释放 {freed} 字节")
+
+@app.cli.command('prune-changes')
+@click.option('--keep', default=100000, show_default=True, help='保留最近的变更记录条数')
+def prune_changes_command(keep):
+    """清理旧的变更日志；版本号早于保留范围的客户端需要重新加载完整数据"""
+    init_app()
+    db = get_db()
+    cur = db.cursor()
+    cur.execute('DELETE FROM change_log WHERE version <= ?', (get_change_version(db) - keep,))
+    db.commit()
+    print(f"已清理 {cur.rowcount} 条变更记录")
+
+# 统计结果缓存配置
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get('STATS_CACHE_MAX_ENTRIES', 256))
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 300))  # 秒；缓存条目的最长保留时间
+
+class ResultCache:
+    """进程内的LRU + TTL结果缓存，条目绑定计算时的变更日志版本号
+
+    变更日志由触发器维护，任何进程的写入都会使版本号增加，缓存的结果随即失效。
+    """
+
+    def __init__(self, max_entries=STATS_CACHE_MAX_ENTRIES, ttl=STATS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key, current_version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, expires_at, value = entry
+                if version == current_version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._metrics['hits'] += 1
+                    return True, value
+                del self._entries[key]
+                self._metrics['invalidations'] += 1
+            self._metrics['misses'] += 1
+            return False, None
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+
+    def get_or_compute(self, endpoint, params, compute):
+        # 去掉空参数并排序，使等价的查询共用同一个缓存条目
+        key = (endpoint, tuple(sorted((k, v) for k, v in params.items() if v not in (None, ''))))
+        # 先读取版本号再计算，计算期间发生写入时结果不会被当作最新数据
+        version = get_change_version(get_db())
+        hit, value = self.get(key, version)
+        if hit:
+            return value
+        value = compute()
+        self.set(key, version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['entries'] = len(self._entries)
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        return stats
+
+stats_cache = ResultCache()
+
+def normalize_day(value):
+    """统计接口的日期筛选按天生效，缓存键只保留日期部分"""
+    return value[:10] if value else None
+
+# 参考数据缓存配置
+REFERENCE_CACHE_TTL = float(os.environ.get('REFERENCE_CACHE_TTL', 60))  # 秒；其他进程修改行为类型后的最长延迟
+
+class ReferenceCache:
+    """进程内的行为类型缓存，供行为类型列表接口使用
+
+    本进程修改行为类型后立即失效，其他进程的修改在TTL后整体刷新时生效。
+    """
+
+    def __init__(self, ttl=REFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._types = None  # (按id排序的行为类型列表, ETag)
+        self._types_loaded_at = 0
+
+    def _load_types(self, db):
+        types = [dict(row) for row in db.execute('SELECT * FROM behavior_types ORDER BY id')]
+        etag = hashlib.sha256(json.dumps(types, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+        snapshot = (types, etag)
+        with self._lock:
+            self._types = snapshot
+            self._types_loaded_at = time.monotonic()
+        return snapshot
+
+    def behavior_types(self, db):
+        """返回 (行为类型列表, ETag)"""
+        # 先取出当前快照再判断，避免其他线程同时失效缓存
+        snapshot = self._types
+        if snapshot is None or time.monotonic() - self._types_loaded_at >= self.ttl:
+            snapshot = self._load_types(db)
+        return snapshot
+
+    def invalidate_types(self):
+        with self._lock:
+            self._types = None
+
+reference_cache = ReferenceCache()
+
+def behavior_reference_error(db, student_id):
+    """带引用校验的写入没有生效时，返回缺少的是学生还是行为类型"""
+    if not db.execute('SELECT 1 FROM students WHERE id = ?', (student_id,)).fetchone():
+        return '学生不存在'
+    # 行为类型已被其他进程删除，刷新行为类型列表的缓存
+    reference_cache.invalidate_types()
+    return '行为类型不存在'
+
+# 令牌吊销配置
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_SYNC_INTERVAL', 5))  # 秒；其他进程的吊销生效的最长延迟
+
+class TokenBlocklist:
+    """令牌吊销记录，供 token_in_blocklist_loader 在每个请求中检查
+
+    退出登录时按jti吊销单个令牌，记录保留到令牌本身过期为止。
+    吊销记录写入 token_revocations 表，各worker进程在内存中保留一份副本，
+    每隔 sync_interval 秒增量读取其他进程新增的记录，其余请求只检查内存。
+    """
+
+    def __init__(self, sync_interval=TOKEN_REVOCATION_SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._tokens = {}  # jti -> 令牌过期时间（unix秒）
+        self._last_id = 0
+        self._last_sync = None
+
+    def _prune(self, now):
+        expired = [jti for jti, exp in self._tokens.items() if exp <= now]
+        for jti in expired:
+            del self._tokens[jti]
+
+    def revoke_token(self, db, jti, expires_at):
+        now = time.time()
+        db.execute('DELETE FROM token_revocations WHERE expires_at <= ?', (now,))
+        # 同一令牌并发退出两次时只记录一次
+        db.execute('INSERT OR IGNORE INTO token_revocations (jti, expires_at) VALUES (?, ?)', (jti, expires_at))
+        db.commit()
+        with self._lock:
+            self._prune(now)
+            self._tokens[jti] = expires_at
+
+    def sync_due(self):
+        return self._last_sync is None or time.monotonic() - self._last_sync >= self.sync_interval
+
+    def sync(self, db):
+        """读取其他进程新增的吊销记录；距离上次读取不足 sync_interval 秒时直接返回"""
+        if not self.sync_due():
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return  # 其他线程正在读取
+        try:
+            now = time.time()
+            rows = db.execute(
+                'SELECT id, jti, expires_at FROM token_revocations '
+                'WHERE id > ? AND expires_at > ? ORDER BY id',
+                (self._last_id, now)
+            ).fetchall()
+            with self._lock:
+                self._prune(now)
+                for row in rows:
+                    self._tokens[row['jti']] = row['expires_at']
+                    self._last_id = max(self._last_id, row['id'])
+            self._last_sync = time.monotonic()
+        finally:
+            self._sync_lock.release()
+
+    def is_revoked(self, payload):
+        with self._lock:
+            return payload.get('jti') in self._tokens
+
+    def stats(self):
+        with self._lock:
+            return {'revoked_tokens': len(self._tokens)}
+
+token_blocklist = TokenBlocklist()
+
+@jwt.token_in_blocklist_loader
+def check_token_revoked(jwt_header, jwt_payload):
+    # 两次同步之间只检查内存，不占用连接池中的连接
+    if token_blocklist.sync_due():
+        token_blocklist.sync(get_db())
+    return token_blocklist.is_revoked(jwt_payload)
+
+class PasswordHasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    """在有界线程池中计算和校验密码哈希，避免慢速的KDF占满处理请求的线程
+
+    排队加运行中的任务数超过 max_pending 时立即抛出 PasswordHasherBusy，
+    登录高峰时多余的请求快速失败，而不是堵住其他接口。
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH,
+                 workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING,
+                 timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._dummy_hash = None
+        self._metrics = {'verified': 0, 'hashed': 0, 'rehashed': 0, 'rejected': 0, 'timeouts': 0}
+        # pbkdf2 省略迭代次数时 Werkzeug 使用默认值，存储的哈希中总是带有迭代次数
+        parts = method.split(':')
+        if parts[0] == 'pbkdf2' and len(parts) < 3:
+            parts = ['pbkdf2', parts[1] if len(parts) > 1 else 'sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+        self._method_prefix = ':'.join(parts)
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # 超时后任务仍在运行，完成时才归还名额
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            self._count('timeouts')
+            raise PasswordHasherBusy()
+
+    def hash(self, password):
+        result = self._wait(self._submit(generate_password_hash, password, self.method, self.salt_length))
+        self._count('hashed')
+        return result
+
+    def verify(self, stored_hash, password):
+        if stored_hash is None:
+            # 用户不存在时同样计算一次哈希，响应时间不暴露用户名是否存在
+            self._wait(self._submit(lambda: check_password_hash(self._get_dummy_hash(), password)))
+            return False
+        result = self._wait(self._submit(check_password_hash, stored_hash, password))
+        self._count('verified')
+        return result
+
+    def _get_dummy_hash(self):
+        if self._dummy_hash is None:
+            self._dummy_hash = generate_password_hash(uuid.uuid4().hex, self.method, self.salt_length)
+        return self._dummy_hash
+
+    def needs_rehash(self, stored_hash):
+        method, _, rest = stored_hash.partition('$')
+        salt = rest.partition('$')[0]
+        return method != self._method_prefix or len(salt) != self.salt_length
+
+    def rehash_in_background(self, username, stored_hash, password):
+        """按当前参数重新计算哈希并写回；线程池繁忙时跳过，下次登录再试"""
+        def rehash():
+            new_hash = generate_password_hash(password, self.method, self.salt_length)
+            db = get_pool().acquire()
+            try:
+                # 只在密码未被其他请求修改时写回
+                db.execute('UPDATE users SET password = ? WHERE username = ? AND password = ?',
+                           (new_hash, username, stored_hash))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print('重新计算密码哈希失败:', str(e))
+                return
+            finally:
+                get_pool().release(db)
+            self._count('rehashed')
+        try:
+            self._submit(rehash)
+        except PasswordHasherBusy:
+            pass
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['method'] = self._method_prefix
+        return stats
+
+password_hasher = PasswordHasher()
+
+class LoginThrottle:
+    """登录限流：滑动时间窗口内限制每个IP和每个用户名的登录失败次数
+
+    只统计失败：同一出口IP（学校NAT、反向代理）后的大量正常登录不会被拦截。
+    用户名被限流后只拒绝窗口内有过失败的IP，其他IP仍可验证密码，正确的密码照常登录并清零失败记录，
+    他人用错误密码无法把正常用户锁定在外。计数只存在于当前进程。
+    """
+
+    def __init__(self, window=LOGIN_THROTTLE_WINDOW, max_failures_per_ip=LOGIN_MAX_FAILURES_PER_IP,
+                 max_failures_per_user=LOGIN_MAX_FAILURES_PER_USER):
+        self.window = window
+        self.max_failures_per_ip = max_failures_per_ip
+        self.max_failures_per_user = max_failures_per_user
+        self._ip_failures = {}  # ip -> deque(时间戳)
+        self._user_failures = {}  # username -> deque(时间戳)
+        self._lock = threading.Lock()
+        self._metrics = {'throttled_ip': 0, 'throttled_user': 0}
+        self._last_prune = time.monotonic()
+
+    def _trim(self, events, now):
+        while events and events[0] <= now - self.window:
+            events.popleft()
+
+    def _prune(self, now):
+        # 定期清理整个窗口内没有记录的键，限制内存占用
+        if now - self._last_prune < self.window:
+            return
+        self._last_prune = now
+        for table in (self._ip_failures, self._user_failures):
+            for key in [key for key, events in table.items() if not events or events[-1] <= now - self.window]:
+                del table[key]
+
+    def _retry_after(self, events, now):
+        return max(1, int(events[0] + self.window - now) + 1)
+
+    def _over_limit(self, table, key, limit, now):
+        failures = table.get(key)
+        if failures is None:
+            return None
+        self._trim(failures, now)
+        return failures if len(failures) >= limit else None
+
+    def check(self, ip, username):
+        """验证密码之前调用：IP失败次数超过限制，或用户名已被限流且该IP窗口内有过失败时，返回需要等待的秒数，否则返回None"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            failures = self._over_limit(self._ip_failures, ip, self.max_failures_per_ip, now)
+            if failures is not None:
+                self._metrics['throttled_ip'] += 1
+                return self._retry_after(failures, now)
+            failures = self._over_limit(self._user_failures, username, self.max_failures_per_user, now)
+            if failures is not None and self._ip_failures.get(ip):
+                self._metrics['throttled_user'] += 1
+                return self._retry_after(failures, now)
+        return None
+
+    def check_user(self, username):
+        """密码错误并记录失败之后调用：用户名失败次数超过限制时返回需要等待的秒数，否则返回None"""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._over_limit(self._user_failures, username, self.max_failures_per_user, now)
+            if failures is None:
+                return None
+            self._metrics['throttled_user'] += 1
+            return self._retry_after(failures, now)
+
+    def record_failure(self, ip, username):
+        now = time.monotonic()
+        with self._lock:
+            self._ip_failures.setdefault(ip, deque()).append(now)
+            self._user_failures.setdefault(username, deque()).append(now)
+
+    def record_success(self, username):
+        with self._lock:
+            self._user_failures.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['tracked_ips'] = len(self._ip_failures)
+            stats['tracked_users'] = len(self._user_failures)
+        return stats
+
+login_throttle = LoginThrottle()
+
+# 列表分页配置
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('无效的分页游标')
+    # 游标值直接作为SQL参数绑定：排序值只能是字符串或整数，最后一个必须是整数ID
+    if (not isinstance(values, list) or len(values) != 2
+            or not all(isinstance(value, (str, int)) and not isinstance(value, bool) for value in values)
+            or not isinstance(values[1], int)):
+        raise ValueError('无效的分页游标')
+    return values
+
+def parse_sort(sort, allowed, default):
+    """解析 sort 参数（如 '-date'），返回 (列名, 是否倒序)"""
+    sort = sort or default
+    desc = sort.startswith('-')
+    key = sort.lstrip('-')
+    if key not in allowed:
+        raise ValueError(f'不支持的排序字段: {key}')
+    return allowed[key], desc
+
+def parse_fields(fields, columns, required=()):
+    """解析 fields 参数（如 'id,name'），返回只包含所需列的 SELECT 列表"""
+    if not fields:
+        names = list(columns)
+    else:
+        requested = {name.strip() for name in fields.split(',') if name.strip()}
+        unknown = requested - set(columns)
+        if unknown:
+            raise ValueError(f"不支持的字段: {', '.join(sorted(unknown))}")
+        # 分页游标需要的列总是返回
+        requested.update(required)
+        names = [name for name in columns if name in requested]
+    return ', '.join(f'{columns[name]} as {name}' for name in names)
+
+def is_paginated_request():
+    return 'limit' in request.args or 'cursor' in request.args
+
+def keyset_query(base_query, where_conditions, query_params, sort_column, id_column, desc):
+    """为列表查询追加筛选、键集游标条件、排序和LIMIT，返回 (sql, params, limit)"""
+    where_conditions = list(where_conditions)
+    query_params = list(query_params)
+    limit = None
+    if is_paginated_request():
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError('无效的分页大小')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        cursor = request.args.get('cursor')
+        if cursor:
+            where_conditions.append(f"({sort_column}, {id_column}) {'<' if desc else '>'} (?, ?)")
+            query_params.extend(decode_cursor(cursor))
+
+    sql = base_query
+    if where_conditions:
+        sql += " WHERE " + " AND ".join(where_conditions)
+    direction = 'DESC' if desc else 'ASC'
+    sql += f" ORDER BY {sort_column} {direction}, {id_column} {direction}"
+    if limit is not None:
+        # 多取一行用于判断是否还有下一页
+        sql += " LIMIT ?"
+        query_params.append(limit + 1)
+    return sql, query_params, limit
+
+def paginated_response(rows, limit, cursor_key, count_query=None, count_params=()):
+    """无分页参数时保持原有的数组响应；否则返回 items / next_cursor / total"""
+    if limit is None:
+        return jsonify(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last[cursor_key], last['id']])
+    result = {'items': rows, 'next_cursor': next_cursor}
+    if count_query and request.args.get('include_total') in ('1', 'true'):
+        result['total'] = get_db().execute(count_query, count_params).fetchone()[0]
+    return jsonify(result)
+
+# 响应压缩配置
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # 小于该字节数的响应不压缩
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv'}
+
+# 紧凑的JSON输出：不缩进，中文直接按UTF-8输出而不是 \uXXXX 转义
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+app.config['JSON_AS_ASCII'] = False
+
+class ResponseMetrics:
+    """按接口统计响应体大小和压缩效果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, raw_size, sent_size, encoding=None):
+        with self._lock:
+            metrics = self._endpoints.setdefault(endpoint, {
+                'responses': 0,
+                'compressed': 0,
+                'raw_bytes': 0,
+                'sent_bytes': 0
+            })
+            metrics['responses'] += 1
+            metrics['raw_bytes'] += raw_size
+            metrics['sent_bytes'] += sent_size
+            if encoding:
+                metrics['compressed'] += 1
+
+    def stats(self):
+        with self._lock:
+            endpoints = {name: dict(metrics) for name, metrics in self._endpoints.items()}
+        for metrics in endpoints.values():
+            metrics['avg_sent_bytes'] = metrics['sent_bytes'] // metrics['responses']
+        return endpoints
+
+response_metrics = ResponseMetrics()
+
+def choose_encoding():
+    """根据 Accept-Encoding 选择压缩方式，优先br"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+@app.after_request
+def compress_response(response):
+    # 文件下载（direct_passthrough）和流式响应不在这里处理
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    data = response.get_data()
+    encoding = None
+    if (len(data) >= COMPRESS_MIN_SIZE
+            and 200 <= response.status_code < 300
+            and response.mimetype in COMPRESS_MIMETYPES
+            and 'Content-Encoding' not in response.headers):
+        encoding = choose_encoding()
+        response.vary.add('Accept-Encoding')
+    if encoding:
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=min(COMPRESS_LEVEL, 11))
+        else:
+            compressed = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # 压缩后的内容与原内容字节不同，强ETag降为弱ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        response_metrics.record(request.endpoint or 'unknown', len(data), len(compressed), encoding)
+    else:
+        response_metrics.record(request.endpoint or 'unknown', len(data), len(data))
+    return response
 
 # 测试路由
 @app.route('/api/test', methods=['GET'])
 def test():
     return jsonify({'message': 'API is working!'})
 
+# 运行指标路由
+@app.route('/api/metrics', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    return jsonify({
+        'db_pool': get_pool().stats(),
+        'stats_cache': stats_cache.stats(),
+        'responses': response_metrics.stats(),
+        'token_blocklist': token_blocklist.stats(),
+        'password_hasher': password_hasher.stats(),
+        'login_throttle': login_throttle.stats()
+    })
+
 # 登录路由
+def login_throttled_response(retry_after):
+    response = jsonify({'message': '登录尝试过于频繁，请稍后重试'})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
 @app.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
-        print('收到登录请求数据:', data)  # 调试日志
         
         if not data:
-            print('请求数据为空')  # 调试日志
             return jsonify({'message': '无效的请求数据'}), 400
             
         username = data.get('username')
         password = data.get('password')
         
-        print(f'尝试登录: 用户名={username}, 密码长度={len(password) if password else 0}')  # 调试日志
-        
         if not username or not password:
-            print('用户名或密码为空')  # 调试日志
             return jsonify({'message': '用户名和密码不能为空'}), 400
+
+        retry_after = login_throttle.check(request.remote_addr, username)
+        if retry_after is not None:
+            return login_throttled_response(retry_after)
         
         cur = get_db().cursor()
-        user = cur.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        user = cur.execute('SELECT id, username, password, role FROM users WHERE username = ?', (username,)).fetchone()
+        stored_password = user['password'] if user else None
         
-        if user:
-            print(f'找到用户: {dict(user)}')  # 调试日志
-            stored_password = user['password']
-            print(f'存储的密码哈希: {stored_password}')  # 调试日志
-            
-            is_valid = check_password_hash(stored_password, password)
-            print(f'密码验证结果: {is_valid}')  # 调试日志
+        try:
+            is_valid = password_hasher.verify(stored_password, password)
+        except PasswordHasherBusy:
+            response = jsonify({'message': '登录人数较多，请稍后重试'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
             
-            if is_valid:
-                access_token = create_access_token(identity=username)
-                return jsonify({
-                    'token': access_token,
-                    'userInfo': {
-                        'username': user['username'],
-                        'role': user['role']
-                    }
-                })
-        else:
-            print(f'未找到用户: {username}')  # 调试日志
-        
+        if is_valid:
+            login_throttle.record_success(username)
+            if password_hasher.needs_rehash(stored_password):
+                password_hasher.rehash_in_background(username, stored_password, password)
+            # 角色和用户id写入令牌声明，之后的请求无需再查询用户表
+            access_token = create_access_token(
+                identity=username,
+                additional_claims={'role': user['role'], 'uid': user['id']}
+            )
+            return jsonify({
+                'token': access_token,
+                'userInfo': {
+                    'username': user['username'],
+                    'role': user['role']
+                }
+            })
+
+        login_throttle.record_failure(request.remote_addr, username)
+        print(f'登录失败: 用户名={username}')
+        retry_after = login_throttle.check_user(username)
+        if retry_after is not None:
+            return login_throttled_response(retry_after)
         return jsonify({'message': '用户名或密码错误'}), 401
             
     except Exception as e:
@@ -230,9 +1757,18 @@ def login():
 @jwt_required()
 def verify_token():
     try:
-        current_user = get_jwt_identity()
-        cur = get_db().cursor()
-        user = cur.execute('SELECT username, role FROM users WHERE username = ?', (current_user,)).fetchone()
+        claims = get_jwt()
+        if 'role' in claims:
+            return jsonify({
+                'valid': True,
+                'userInfo': {
+                    'username': get_jwt_identity(),
+                    'role': claims['role']
+                }
+            })
+        # 升级前签发的令牌没有角色声明，从数据库读取
+        user = get_db().execute('SELECT username, role FROM users WHERE username = ?',
+                                (get_jwt_identity(),)).fetchone()
         if user:
             return jsonify({
                 'valid': True,
@@ -246,23 +1782,73 @@ def verify_token():
         print('Token验证失败:', str(e))
         return jsonify({'valid': False}), 401
 
+# 退出登录：吊销当前令牌
+@app.route('/api/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    claims = get_jwt()
+    token_blocklist.revoke_token(get_db(), claims['jti'], claims['exp'])
+    return jsonify({'message': '已退出登录'})
+
+# 学生列表可选择返回的字段（fields 参数）及对应的SQL表达式
+STUDENT_FIELDS = {
+    'id': 's.id',
+    'name': 's.name',
+    'student_id': 's.student_id',
+    'grade': 's.grade',
+    'class': 's.class',
+    'photo_url': 's.photo_url',
+    'address': 's.address',
+    'emergency_contact': 's.emergency_contact',
+    'emergency_phone': 's.emergency_phone',
+    'notes': 's.notes',
+    'violation_count': 'COALESCE(v.count, 0)',
+    'excellent_count': 'COALESCE(e.count, 0)'
+}
+
+STUDENT_FROM = '''
+    FROM students s
+    LEFT JOIN student_behavior_counts v ON v.student_id = s.id AND v.category = '违纪'
+    LEFT JOIN student_behavior_counts e ON e.student_id = s.id AND e.category = '优秀'
+'''
+
 @app.route('/api/students', methods=['GET'])
 @jwt_required()
 def get_students():
     try:
-        cur = get_db().cursor()
-        students = cur.execute('''
-            SELECT 
-                s.*,
-                (SELECT COUNT(*) FROM behaviors b 
-                 JOIN behavior_types bt ON b.behavior_type = bt.name 
-                 WHERE b.student_id = s.id AND bt.category = '违纪') as violation_count,
-                (SELECT COUNT(*) FROM behaviors b 
-                 JOIN behavior_types bt ON b.behavior_type = bt.name 
-                 WHERE b.student_id = s.id AND bt.category = '优秀') as excellent_count
-            FROM students s
-        ''').fetchall()
-        return jsonify([dict(row) for row in students])
+        sort_column, desc = parse_sort(request.args.get('sort'), {
+            'id': 's.id',
+            'student_id': 's.student_id',
+            'name': 's.name'
+        }, 'id')
+
+        where_conditions = []
+        query_params = []
+        if request.args.get('grade'):
+            where_conditions.append("s.grade = ?")
+            query_params.append(request.args['grade'])
+        if request.args.get('class'):
+            where_conditions.append("s.class = ?")
+            query_params.append(request.args['class'])
+
+        select = parse_fields(request.args.get('fields'), STUDENT_FIELDS,
+                              required=('id', sort_column.split('.')[-1]))
+        sql, params, limit = keyset_query(f'SELECT {select}{STUDENT_FROM}',
+                                          where_conditions, query_params, sort_column, 's.id', desc)
+
+        db = get_db()
+        # 先取变更版本号再查询，客户端从该版本开始增量同步不会漏掉查询期间的写入
+        change_version = get_change_version(db)
+        students = [dict(row) for row in db.execute(sql, params).fetchall()]
+
+        count_query = 'SELECT COUNT(*) FROM students s'
+        if where_conditions:
+            count_query += " WHERE " + " AND ".join(where_conditions)
+        response = paginated_response(students, limit, sort_column.split('.')[-1], count_query, query_params)
+        response.headers['X-Change-Version'] = str(change_version)
+        return response
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         print('获取学生列表失败:', str(e))
         return jsonify({'message': '获取学生列表失败'}), 500
@@ -296,7 +1882,7 @@ def add_student():
         
         # 返回新创建的学生信息
         new_student = cur.execute('SELECT * FROM students WHERE id = ?', (cur.lastrowid,)).fetchone()
-        return jsonify(new_student)
+        return jsonify(dict(new_student))
     except Exception as e:
         print('添加学生失败:', str(e))
         return jsonify({'message': '添加学生失败'}), 500
@@ -333,7 +1919,9 @@ def update_student(id):
         
         # 返回更新后的学生信息
         updated_student = cur.execute('SELECT * FROM students WHERE id = ?', (id,)).fetchone()
-        return jsonify(updated_student)
+        if not updated_student:
+            return jsonify({'message': '学生不存在'}), 404
+        return jsonify(dict(updated_student))
     except Exception as e:
         print('更新学生信息失败:', str(e))
         return jsonify({'message': '更新学生信息失败'}), 500
@@ -350,29 +1938,90 @@ def delete_student(id):
         print('删除学生失败:', str(e))
         return jsonify({'message': '删除学生失败'}), 500
 
+# 行为记录可选择返回的字段（fields 参数）；按行为类型ID关联出类型名称，接口中仍以名称返回
+BEHAVIOR_FIELDS = {
+    'id': 'b.id',
+    'student_id': 'b.student_id',
+    'behavior_type': 'bt.name',
+    'behavior_type_id': 'b.behavior_type_id',
+    'description': 'b.description',
+    'date': 'b.date',
+    'image_url': 'b.image_url',
+    'student_name': 's.name',
+    'grade': 's.grade',
+    'class': 's.class'
+}
+
+BEHAVIOR_FROM = '''
+    FROM behaviors b
+    JOIN students s ON b.student_id = s.id
+    LEFT JOIN behavior_types bt ON b.behavior_type_id = bt.id
+'''
+
+BEHAVIOR_SELECT = f'SELECT {parse_fields(None, BEHAVIOR_FIELDS)}{BEHAVIOR_FROM}'
+
+def behavior_to_dict(row):
+    behavior_dict = dict(row)
+    if behavior_dict.get('image_url'):
+        # 确保返回完整的URL路径
+        if not behavior_dict['image_url'].startswith('/api/'):
+            behavior_dict['image_url'] = f"/api/uploads/{behavior_dict['image_url'].split('/')[-1]}"
+    return behavior_dict
+
 @app.route('/api/behaviors', methods=['GET'])
 @jwt_required()
 def get_behaviors():
     try:
-        cur = get_db().cursor()
-        behaviors = cur.execute('''
-            SELECT b.*, s.name as student_name, s.grade, s.class
-            FROM behaviors b
-            JOIN students s ON b.student_id = s.id
-            ORDER BY b.date DESC
-        ''').fetchall()
+        sort_column, desc = parse_sort(request.args.get('sort'), {
+            'date': 'b.date',
+            'id': 'b.id'
+        }, '-date')
+
+        # 构建筛选条件
+        where_conditions = []
+        query_params = []
+        if request.args.get('grade'):
+            where_conditions.append("s.grade = ?")
+            query_params.append(request.args['grade'])
+        if request.args.get('class'):
+            where_conditions.append("s.class = ?")
+            query_params.append(request.args['class'])
+        if request.args.get('student_id'):
+            where_conditions.append("b.student_id = ?")
+            query_params.append(request.args['student_id'])
+        if request.args.get('behavior_type'):
+            where_conditions.append("b.behavior_type_id = (SELECT id FROM behavior_types WHERE name = ?)")
+            query_params.append(request.args['behavior_type'])
+        if request.args.get('category'):
+            where_conditions.append("b.behavior_type_id IN (SELECT id FROM behavior_types WHERE category = ?)")
+            query_params.append(request.args['category'])
+        # 与统计和导出接口相同：日期筛选按天（含首尾两天），使用带索引的 day 列
+        if request.args.get('start_date'):
+            where_conditions.append("b.day >= substr(?, 1, 10)")
+            query_params.append(request.args['start_date'])
+        if request.args.get('end_date'):
+            where_conditions.append("b.day <= substr(?, 1, 10)")
+            query_params.append(request.args['end_date'])
+
+        select = parse_fields(request.args.get('fields'), BEHAVIOR_FIELDS,
+                              required=('id', sort_column.split('.')[-1]))
+        sql, params, limit = keyset_query(f'SELECT {select}{BEHAVIOR_FROM}', where_conditions, query_params, sort_column, 'b.id', desc)
+
+        db = get_db()
+        change_version = get_change_version(db)
+        behaviors = db.execute(sql, params).fetchall()
         
         # 转换为列表并处理图片URL
-        result = []
-        for behavior in behaviors:
-            behavior_dict = dict(behavior)
-            if behavior_dict.get('image_url'):
-                # 确保返回完整的URL路径
-                if not behavior_dict['image_url'].startswith('/api/'):
-                    behavior_dict['image_url'] = f"/api/uploads/{behavior_dict['image_url'].split('/')[-1]}"
-            result.append(behavior_dict)
-            
-        return jsonify(result)
+        result = [behavior_to_dict(behavior) for behavior in behaviors]
+
+        count_query = 'SELECT COUNT(*) FROM behaviors b JOIN students s ON b.student_id = s.id'
+        if where_conditions:
+            count_query += " WHERE " + " AND ".join(where_conditions)
+        response = paginated_response(result, limit, sort_column.split('.')[-1], count_query, query_params)
+        response.headers['X-Change-Version'] = str(change_version)
+        return response
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         print('获取行为记录失败:', str(e))
         return jsonify({'message': '获取行为记录失败'}), 500
@@ -409,44 +2058,31 @@ def add_behavior():
         cur = db.cursor()
         
         try:
-            # 验证学生是否存在
-            student = cur.execute('SELECT id FROM students WHERE id = ?', (student_id,)).fetchone()
-            if not student:
-                print(f"错误: 学生ID {student_id} 不存在")
-                return jsonify({'message': '学生不存在'}), 400
-            print(f"学生验证成功: {student_id}")
-            
-            # 验证行为类型是否存在
-            behavior_type = cur.execute('SELECT name FROM behavior_types WHERE name = ?', 
-                                      (data['behavior_type'],)).fetchone()
-            if not behavior_type:
-                print(f"错误: 行为类型 {data['behavior_type']} 不存在")
-                return jsonify({'message': '行为类型不存在'}), 400
-            print(f"行为类型验证成功: {data['behavior_type']}")
-            
-            # 插入行为记录
+            # 插入行为记录：学生和行为类型在同一条语句中校验，不存在时不插入
             print("开始插入行为记录...")
             cur.execute('''
-                INSERT INTO behaviors (student_id, behavior_type, description, date, image_url)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO behaviors (student_id, behavior_type_id, description, date, image_url)
+                SELECT ?, bt.id, ?, ?, ? FROM behavior_types bt
+                WHERE bt.name = ? AND EXISTS (SELECT 1 FROM students WHERE id = ?)
             ''', (
                 student_id,
-                data['behavior_type'],
                 data['description'],
                 data['date'],
-                data.get('image_url')
+                data.get('image_url'),
+                data['behavior_type'],
+                student_id
             ))
+            if cur.rowcount == 0:
+                db.rollback()
+                error = behavior_reference_error(db, student_id)
+                print(f"错误: {error}")
+                return jsonify({'message': error}), 400
             db.commit()
             print("行为记录插入成功")
             
             # 获取新插入的记录
             print("开始获取新插入的记录...")
-            new_behavior = cur.execute('''
-                SELECT b.*, s.name as student_name, s.grade, s.class
-                FROM behaviors b
-                JOIN students s ON b.student_id = s.id
-                WHERE b.id = last_insert_rowid()
-            ''').fetchone()
+            new_behavior = cur.execute(BEHAVIOR_SELECT + ' WHERE b.id = ?', (cur.lastrowid,)).fetchone()
             
             if not new_behavior:
                 print("错误: 无法获取新创建的记录")
@@ -470,6 +2106,132 @@ def add_behavior():
     finally:
         print("=== 处理添加行为记录请求结束 ===\n")
 
+# 批量记录行为的最大条数
+MAX_BATCH_SIZE = 1000
+
+@app.route('/api/behaviors/batch', methods=['POST'])
+@jwt_required()
+def add_behaviors_batch():
+    """批量添加行为记录
+
+    请求体可以是 {"records": [{student_id, behavior_type, description, date, image_url}, ...]}，
+    也可以是 {"student_ids": [...], "behavior_type", "description", "date", "image_url"}
+    （同一行为应用到多个学生）。有效记录在一个事务中插入，返回逐条结果。
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'message': '无效的请求数据'}), 400
+
+        if 'records' in data:
+            records = data['records']
+        elif 'student_ids' in data:
+            if not isinstance(data['student_ids'], list):
+                return jsonify({'message': 'student_ids 必须是数组'}), 400
+            shared = {field: data.get(field) for field in ('behavior_type', 'description', 'date', 'image_url')}
+            records = [dict(shared, student_id=student_id) for student_id in data['student_ids']]
+        else:
+            return jsonify({'message': 'records 或 student_ids 是必填项'}), 400
+
+        if not isinstance(records, list) or not records:
+            return jsonify({'message': '没有需要添加的记录'}), 400
+        if len(records) > MAX_BATCH_SIZE:
+            return jsonify({'message': f'单次最多添加 {MAX_BATCH_SIZE} 条记录'}), 400
+
+        # 逐条校验必填字段和学生ID格式
+        results = [None] * len(records)
+        candidates = []
+        required_fields = ['student_id', 'behavior_type', 'description', 'date']
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                results[index] = {'index': index, 'success': False, 'message': '无效的记录'}
+                continue
+            missing = next((field for field in required_fields if not record.get(field)), None)
+            if missing:
+                results[index] = {'index': index, 'success': False, 'message': f'{missing} 是必填项'}
+                continue
+            try:
+                student_id = int(record['student_id'])
+            except (ValueError, TypeError):
+                results[index] = {'index': index, 'success': False, 'message': '无效的学生ID'}
+                continue
+            if not isinstance(record['behavior_type'], str):
+                results[index] = {'index': index, 'success': False, 'message': '无效的行为类型'}
+                continue
+            # 数组或对象无法绑定为SQL参数，会使整批插入失败
+            invalid = next((field for field in ('description', 'date') if not isinstance(record[field], str)), None)
+            if invalid is None and not isinstance(record.get('image_url'), (str, type(None))):
+                invalid = 'image_url'
+            if invalid:
+                results[index] = {'index': index, 'success': False, 'message': f'{invalid} 必须是字符串'}
+                continue
+            candidates.append((index, student_id, record))
+
+        db = get_db()
+        cur = db.cursor()
+
+        # 获取写锁后再做集合校验，保证校验结果和插入之间没有其他写入
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            student_ids = sorted({student_id for _, student_id, _ in candidates})
+            type_names = sorted({record['behavior_type'] for _, _, record in candidates})
+            existing_students = set()
+            existing_types = {}
+            for i in range(0, len(student_ids), IMPORT_CHUNK_SIZE):
+                chunk = student_ids[i:i + IMPORT_CHUNK_SIZE]
+                existing_students.update(row[0] for row in cur.execute(
+                    f"SELECT id FROM students WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+            for i in range(0, len(type_names), IMPORT_CHUNK_SIZE):
+                chunk = type_names[i:i + IMPORT_CHUNK_SIZE]
+                existing_types.update((row['name'], row['id']) for row in cur.execute(
+                    f"SELECT id, name FROM behavior_types WHERE name IN ({','.join('?' * len(chunk))})", chunk))
+
+            valid = []
+            for index, student_id, record in candidates:
+                if student_id not in existing_students:
+                    results[index] = {'index': index, 'success': False, 'message': '学生不存在'}
+                elif record['behavior_type'] not in existing_types:
+                    results[index] = {'index': index, 'success': False, 'message': '行为类型不存在'}
+                else:
+                    valid.append((index, (
+                        student_id,
+                        existing_types[record['behavior_type']],
+                        record['description'],
+                        record['date'],
+                        record.get('image_url')
+                    )))
+
+            if valid:
+                # AUTOINCREMENT在持有写锁时按顺序分配ID，据此得到每条新记录的ID
+                last_id = cur.execute('''
+                    SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'behaviors'), 0),
+                               COALESCE((SELECT MAX(id) FROM behaviors), 0))
+                ''').fetchone()[0]
+                cur.executemany('''
+                    INSERT INTO behaviors (student_id, behavior_type_id, description, date, image_url)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [row for _, row in valid])
+                for offset, (index, _) in enumerate(valid, 1):
+                    results[index] = {'index': index, 'success': True, 'id': last_id + offset}
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            print(f"批量添加行为记录数据库错误: {str(e)}")
+            return jsonify({'message': f'数据库操作失败: {str(e)}'}), 500
+
+        success_count = len(valid)
+        return jsonify({
+            'success_count': success_count,
+            'error_count': len(records) - success_count,
+            'results': results
+        })
+
+    except Exception as e:
+        import traceback
+        print(f"批量添加行为记录失败: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'message': f'服务器内部错误: {str(e)}'}), 500
+
 @app.route('/api/behaviors/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_behavior(id):
@@ -512,50 +2274,38 @@ def update_behavior(id):
         cur = db.cursor()
         
         try:
-            # 验证行为记录是否存在
-            behavior = cur.execute('SELECT id FROM behaviors WHERE id = ?', (id,)).fetchone()
-            if not behavior:
-                print(f"错误: 行为记录ID {id} 不存在")
-                return jsonify({'message': '行为记录不存在'}), 404
-                
-            # 验证学生是否存在
-            student = cur.execute('SELECT id FROM students WHERE id = ?', (student_id,)).fetchone()
-            if not student:
-                print(f"错误: 学生ID {student_id} 不存在")
-                return jsonify({'message': '学生不存在'}), 400
-                
-            # 验证行为类型是否存在
-            behavior_type = cur.execute('SELECT name FROM behavior_types WHERE name = ?', 
-                                      (data['behavior_type'],)).fetchone()
-            if not behavior_type:
-                print(f"错误: 行为类型 {data['behavior_type']} 不存在")
-                return jsonify({'message': '行为类型不存在'}), 400
-            
-            # 更新行为记录
+            # 更新行为记录：学生和行为类型在同一条语句中校验，不存在时不更新
             print("开始更新行为记录...")
             cur.execute('''
                 UPDATE behaviors 
-                SET student_id = ?, behavior_type = ?, description = ?, date = ?, image_url = ?
-                WHERE id = ?
+                SET student_id = ?, behavior_type_id = (SELECT id FROM behavior_types WHERE name = ?),
+                    description = ?, date = ?, image_url = ?
+                WHERE id = ? AND EXISTS (SELECT 1 FROM behavior_types WHERE name = ?)
+                    AND EXISTS (SELECT 1 FROM students WHERE id = ?)
             ''', (
                 student_id,
                 data['behavior_type'],
                 data['description'],
                 data['date'],
                 data.get('image_url'),
-                id
+                id,
+                data['behavior_type'],
+                student_id
             ))
+            if cur.rowcount == 0:
+                db.rollback()
+                if not db.execute('SELECT 1 FROM behaviors WHERE id = ?', (id,)).fetchone():
+                    print(f"错误: 行为记录ID {id} 不存在")
+                    return jsonify({'message': '行为记录不存在'}), 404
+                error = behavior_reference_error(db, student_id)
+                print(f"错误: {error}")
+                return jsonify({'message': error}), 400
             db.commit()
             print("行为记录更新成功")
             
             # 获取更新后的记录
             print("获取更新后的记录...")
-            updated_behavior = cur.execute('''
-                SELECT b.*, s.name as student_name, s.grade, s.class
-                FROM behaviors b
-                JOIN students s ON b.student_id = s.id
-                WHERE b.id = ?
-            ''', (id,)).fetchone()
+            updated_behavior = cur.execute(BEHAVIOR_SELECT + ' WHERE b.id = ?', (id,)).fetchone()
             
             if not updated_behavior:
                 print("错误: 无法获取更新后的记录")
@@ -583,9 +2333,12 @@ def update_behavior(id):
 @jwt_required()
 def get_behavior_types():
     try:
-        cur = get_db().cursor()
-        behavior_types = cur.execute('SELECT * FROM behavior_types').fetchall()
-        return jsonify([dict(row) for row in behavior_types])
+        behavior_types, etag = reference_cache.behavior_types(get_db())
+        response = jsonify(behavior_types)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         print('获取行为类型失败:', str(e))
         return jsonify({'message': '获取行为类型失败'}), 500
@@ -610,10 +2363,11 @@ def add_behavior_type():
             data['description']
         ))
         get_db().commit()
+        reference_cache.invalidate_types()
         
         # 返回新创建的行为类型
         new_type = cur.execute('SELECT * FROM behavior_types WHERE id = ?', (cur.lastrowid,)).fetchone()
-        return jsonify(new_type)
+        return jsonify(dict(new_type))
     except Exception as e:
         print('添加行为类型失败:', str(e))
         return jsonify({'message': '添加行为类型失败'}), 500
@@ -640,10 +2394,13 @@ def update_behavior_type(id):
             id
         ))
         get_db().commit()
+        reference_cache.invalidate_types()
         
         # 返回更新后的行为类型
         updated_type = cur.execute('SELECT * FROM behavior_types WHERE id = ?', (id,)).fetchone()
-        return jsonify(updated_type)
+        if not updated_type:
+            return jsonify({'message': '行为类型不存在'}), 404
+        return jsonify(dict(updated_type))
     except Exception as e:
         print('更新行为类型失败:', str(e))
         return jsonify({'message': '更新行为类型失败'}), 500
@@ -655,11 +2412,109 @@ def delete_behavior_type(id):
         cur = get_db().cursor()
         cur.execute('DELETE FROM behavior_types WHERE id = ?', (id,))
         get_db().commit()
+        reference_cache.invalidate_types()
         return jsonify({'message': '删除成功'})
     except Exception as e:
         print('删除行为类型失败:', str(e))
         return jsonify({'message': '删除行为类型失败'}), 500
 
+def rollup_filter(grade=None, start_date=None, end_date=None, alias='r'):
+    """统计查询在汇总表上的 WHERE 子句和参数；日期筛选按天（含首尾两天）"""
+    query_params = []
+    where_conditions = []
+
+    # 添加筛选条件
+    if grade:
+        where_conditions.append(f"{alias}.grade = ?")
+        query_params.append(grade)
+
+    if start_date:
+        where_conditions.append(f"{alias}.day >= substr(?, 1, 10)")
+        query_params.append(start_date)
+
+    if end_date:
+        where_conditions.append(f"{alias}.day <= substr(?, 1, 10)")
+        query_params.append(end_date)
+
+    sql = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    return sql, query_params
+
+def compute_statistics(cur, grade=None, start_date=None, end_date=None):
+    where, query_params = rollup_filter(grade, start_date, end_date)
+
+    # 按类别统计总数
+    totals = {}
+    for row in cur.execute(f'''
+        SELECT r.category, SUM(r.count) as total
+        FROM behavior_daily_rollup r{where}
+        GROUP BY r.category
+    ''', query_params):
+        totals[row['category']] = row['total']
+
+    # 按类别统计涉及的学生数
+    students = {}
+    student_where = where + (" AND " if where else " WHERE ") + "r.count > 0"
+    for row in cur.execute(f'''
+        SELECT r.category, COUNT(DISTINCT r.student_id) as students
+        FROM behavior_daily_students r{student_where}
+        GROUP BY r.category
+    ''', query_params):
+        students[row['category']] = row['students']
+
+    # 行为类型分布
+    behavior_type_distribution = [
+        {'name': row['name'], 'value': row['value']}
+        for row in cur.execute(f'''
+            SELECT bt.name as name, SUM(r.count) as value
+            FROM behavior_daily_rollup r
+            JOIN behavior_types bt ON bt.id = r.behavior_type_id{where}
+            GROUP BY r.behavior_type_id
+            HAVING value > 0
+            ORDER BY value DESC, name
+        ''', query_params)
+    ]
+
+    # 年级行为趋势
+    grade_counts = {}
+    for row in cur.execute(f'''
+        SELECT r.grade, r.category, SUM(r.count) as total
+        FROM behavior_daily_rollup r{where}
+        GROUP BY r.grade, r.category
+    ''', query_params):
+        grade_counts[(row['grade'], row['category'])] = row['total']
+    grades = ['高一', '高二', '高三']
+    grade_violations = [grade_counts.get((g, '违纪'), 0) for g in grades]
+    grade_excellent = [grade_counts.get((g, '优秀'), 0) for g in grades]
+
+    # 时间趋势：按日期分组统计（非违纪类别都计入优秀表现）
+    violation_trend = []
+    excellent_trend = []
+    for row in cur.execute(f'''
+        SELECT r.day,
+               SUM(CASE WHEN r.category = '违纪' THEN r.count ELSE 0 END) as violations,
+               SUM(CASE WHEN r.category <> '违纪' THEN r.count ELSE 0 END) as excellent
+        FROM behavior_daily_rollup r{where}
+        GROUP BY r.day
+        HAVING SUM(r.count) > 0
+        ORDER BY r.day
+    ''', query_params):
+        violation_trend.append([row['day'], row['violations']])
+        excellent_trend.append([row['day'], row['excellent']])
+
+    return {
+        'total_violations': totals.get('违纪', 0),
+        'total_excellent': totals.get('优秀', 0),
+        'violation_students': students.get('违纪', 0),
+        'excellent_students': students.get('优秀', 0),
+        'behavior_type_distribution': behavior_type_distribution,
+        'grade_violations': grade_violations,
+        'grade_excellent': grade_excellent,
+        'time_trend': {
+            'violations': violation_trend,
+            'excellent': excellent_trend
+        }
+    }
+
 @app.route('/api/statistics', methods=['GET'])
 @jwt_required()
 def get_statistics():
@@ -668,105 +2523,349 @@ def get_statistics():
         grade = request.args.get('grade')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+
+        result = stats_cache.get_or_compute(
+            'statistics',
+            {'grade': grade, 'start_date': normalize_day(start_date), 'end_date': normalize_day(end_date)},
+            lambda: compute_statistics(get_db().cursor(), grade, start_date, end_date)
+        )
+        return jsonify(result)
         
-        # 构建基础查询
-        behaviors_query = '''
-            SELECT b.*, s.grade, s.name as student_name, bt.name as behavior_type, bt.category
+    except Exception as e:
+        print('统计数据获取失败:', str(e))
+        return jsonify({'message': '获取统计数据失败'}), 500
+
+# 行为记录导出：列标题及对应的SQL表达式
+EXPORT_COLUMNS = [
+    ('记录ID', 'b.id'),
+    ('学号', 's.student_id'),
+    ('姓名', 's.name'),
+    ('年级', 's.grade'),
+    ('班级', 's.class'),
+    ('行为类型', 'bt.name'),
+    ('类别', 'bt.category'),
+    ('描述', 'b.description'),
+    ('时间', 'b.date'),
+    ('图片', 'b.image_url')
+]
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FILE_CHUNK_SIZE = 64 * 1024
+
+def export_rows(grade=None, start_date=None, end_date=None):
+    """按统计接口的筛选条件逐批读取行为记录，只持有一批数据"""
+    # 与统计接口相同：日期筛选按天（含首尾两天）
+    where_conditions = []
+    query_params = []
+    if grade:
+        where_conditions.append("s.grade = ?")
+        query_params.append(grade)
+    if start_date:
+        where_conditions.append("b.day >= substr(?, 1, 10)")
+        query_params.append(start_date)
+    if end_date:
+        where_conditions.append("b.day <= substr(?, 1, 10)")
+        query_params.append(end_date)
+    where = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    # 导出可能持续较长时间，单独借用连接，在生成器结束时归还
+    db = get_pool().acquire()
+    try:
+        cur = db.execute(f'''
+            SELECT {', '.join(column for _, column in EXPORT_COLUMNS)}
             FROM behaviors b
             JOIN students s ON b.student_id = s.id
-            JOIN behavior_types bt ON b.behavior_type = bt.name
-        '''
-        
-        query_params = []
-        where_conditions = []
-        
-        # 添加筛选条件
-        if grade:
-            where_conditions.append("s.grade = ?")
-            query_params.append(grade)
-        
-        if start_date:
-            where_conditions.append("b.date >= ?")
-            query_params.append(start_date)
-        
-        if end_date:
-            where_conditions.append("b.date <= ?")
-            query_params.append(end_date)
-        
-        if where_conditions:
-            behaviors_query += " WHERE " + " AND ".join(where_conditions)
-        
-        # 执行查询
-        cur = get_db().cursor()
-        behaviors = [dict(row) for row in cur.execute(behaviors_query, query_params).fetchall()]
-        
-        # 统计数据
-        violation_behaviors = [b for b in behaviors if b['category'] == '违纪']
-        excellent_behaviors = [b for b in behaviors if b['category'] == '优秀']
-        
-        # 获取违纪和优秀学生的唯一ID
-        violation_students = len(set(b['student_id'] for b in violation_behaviors))
-        excellent_students = len(set(b['student_id'] for b in excellent_behaviors))
-        
-        # 行为类型分布
-        behavior_type_count = {}
-        for behavior in behaviors:
-            type_name = behavior['behavior_type']
-            behavior_type_count[type_name] = behavior_type_count.get(type_name, 0) + 1
-        
-        behavior_type_distribution = [
-            {'name': type_name, 'value': count}
-            for type_name, count in behavior_type_count.items()
-        ]
-        
-        # 年级行为趋势
-        grades = ['高一', '高二', '高三']
-        grade_violations = []
-        grade_excellent = []
-        
-        for g in grades:
-            grade_violations.append(len([b for b in violation_behaviors if b['grade'] == g]))
-            grade_excellent.append(len([b for b in excellent_behaviors if b['grade'] == g]))
-        
-        # 时间趋势
-        violation_trend = []
-        excellent_trend = []
-        
-        if behaviors:
-            # 按日期分组统计
-            date_stats = {}
-            for behavior in behaviors:
-                date = behavior['date'].split('T')[0]  # 只取日期部分
-                if date not in date_stats:
-                    date_stats[date] = {'violations': 0, 'excellent': 0}
-                
-                if behavior['category'] == '违纪':
-                    date_stats[date]['violations'] += 1
-                else:
-                    date_stats[date]['excellent'] += 1
-            
-            # 转换为时间序列数据
-            for date in sorted(date_stats.keys()):
-                violation_trend.append([date, date_stats[date]['violations']])
-                excellent_trend.append([date, date_stats[date]['excellent']])
-        
-        return jsonify({
-            'total_violations': len(violation_behaviors),
-            'total_excellent': len(excellent_behaviors),
-            'violation_students': violation_students,
-            'excellent_students': excellent_students,
-            'behavior_type_distribution': behavior_type_distribution,
-            'grade_violations': grade_violations,
-            'grade_excellent': grade_excellent,
-            'time_trend': {
-                'violations': violation_trend,
-                'excellent': excellent_trend
-            }
+            LEFT JOIN behavior_types bt ON b.behavior_type_id = bt.id{where}
+            ORDER BY b.date, b.id
+        ''', query_params)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+    finally:
+        get_pool().release(db)
+
+def export_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM使Excel按UTF-8打开中文内容
+    buffer.write('\ufeff')
+    writer.writerow([title for title, _ in EXPORT_COLUMNS])
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def export_xlsx(batches):
+    # write-only模式逐行写入临时文件，内存占用与记录数无关；保存后分块读出
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('行为记录')
+    ws.append([title for title, _ in EXPORT_COLUMNS])
+    for rows in batches:
+        for row in rows:
+            ws.append(row)
+    with tempfile.TemporaryFile() as output:
+        wb.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(EXPORT_FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+@app.route('/api/behaviors/export', methods=['GET'])
+@jwt_required()
+def export_behaviors():
+    try:
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'message': f'不支持的导出格式: {export_format}'}), 400
+
+        batches = export_rows(
+            request.args.get('grade'),
+            request.args.get('start_date'),
+            request.args.get('end_date')
+        )
+        body = export_csv(batches) if export_format == 'csv' else export_xlsx(batches)
+        filename = f"behaviors_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return Response(body, mimetype=EXPORT_FORMATS[export_format], headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store'
         })
-        
     except Exception as e:
-        print('统计数据获取失败:', str(e))
-        return jsonify({'message': '获取统计数据失败'}), 500
+        print('导出行为记录失败:', str(e))
+        return jsonify({'message': '导出行为记录失败'}), 500
+
+# 按内容存储的上传文件：uploads/<哈希前2位>/<哈希3-4位>/<哈希><扩展名>
+UPLOAD_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$')
+
+def upload_path(name):
+    """上传文件名（哈希+扩展名）对应的相对存储路径"""
+    return os.path.join(name[:2], name[2:4], name)
+
+class UploadRejected(Exception):
+    """上传的文件类型不符或超过大小限制"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+def sniff_upload_type(kind, head):
+    """按文件头判断类型（与分块上传相同），返回 (MIME类型, 扩展名)；与 kind 不符时抛出 UploadRejected"""
+    detected = detect_upload_type(kind, head)
+    if detected is None:
+        raise UploadRejected('文件内容与类型不符', 415)
+    return detected
+
+def receive_upload(file, kind):
+    """把上传的文件流写入临时文件，同时计算SHA-256并按 kind 校验文件头和大小
+
+    返回 (临时文件路径, 哈希, 大小, MIME类型, 扩展名)；校验失败时删除临时文件并抛出 UploadRejected。
+    """
+    tmp_dir = os.path.join(app.config['UPLOAD_FOLDER'], '.tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    limit = UPLOAD_SIZE_LIMITS[kind]
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    detected = None
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = file.stream.read(UPLOAD_HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise UploadRejected(f'文件大小不能超过 {limit // (1024 * 1024)}MB', 413)
+                if detected is None:
+                    head += chunk[:UPLOAD_SIGNATURE_LENGTH - len(head)]
+                    # 文件头读满后立即检查，类型不符时不再接收后续数据
+                    if len(head) >= UPLOAD_SIGNATURE_LENGTH:
+                        detected = sniff_upload_type(kind, head)
+                digest.update(chunk)
+                tmp.write(chunk)
+        mimetype, ext = detected or sniff_upload_type(kind, head)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size, mimetype, ext
+
+def store_upload(db, file):
+    """接收并校验上传的图片；内容已存在时复用已有文件。返回 (文件名, 是否重复)"""
+    tmp_path, file_hash, size, mimetype, ext = receive_upload(file, 'image')
+    try:
+        result = commit_upload(db, tmp_path, file_hash, size, ext, mimetype, file.filename)
+        tmp_path = None
+        return result
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+def commit_upload(db, tmp_path, file_hash, size, ext, mimetype, original_name):
+    """把已计算哈希的临时文件移入按内容存储的位置（内容已存在时删除临时文件）。返回 (文件名, 是否重复)
+
+    在写事务中完成查重、刷新时间和移入文件，清理任务（collect_orphan_uploads）不能在两步之间删除同一文件。
+    """
+    cur = db.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        existing = cur.execute('SELECT name, path FROM uploads WHERE hash = ?', (file_hash,)).fetchone()
+        if existing:
+            target = os.path.join(app.config['UPLOAD_FOLDER'], existing['path'])
+            if os.path.exists(target):
+                os.remove(tmp_path)
+            else:
+                # 记录还在但文件已被删除（清理任务删除文件后提交失败）：用本次上传的内容恢复
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+            # 重复上传：刷新时间，避免刚被再次使用的文件被清理
+            cur.execute('UPDATE uploads SET touched_at = CURRENT_TIMESTAMP WHERE hash = ?', (file_hash,))
+            db.commit()
+            return existing['name'], True
+
+        name = file_hash + ext
+        target = os.path.join(app.config['UPLOAD_FOLDER'], upload_path(name))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 同一目录树内的原子重命名
+        os.replace(tmp_path, target)
+        cur.execute('''
+            INSERT INTO uploads (hash, name, path, size, mimetype, original_name)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (file_hash, name, upload_path(name), size, mimetype, original_name))
+        db.commit()
+        return name, False
+    except Exception:
+        db.rollback()
+        raise
+
+def collect_orphan_uploads(db, grace=UPLOAD_GC_GRACE_SECONDS):
+    """删除没有任何引用、且超过保留时间未被使用的上传文件，返回 (文件数, 字节数)"""
+    cur = db.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        rebuild_upload_ref_counts(cur)
+        orphans = cur.execute('''
+            SELECT hash, path, size FROM uploads
+            WHERE ref_count <= 0 AND touched_at <= datetime('now', ?)
+        ''', (f'-{max(0, int(grace))} seconds',)).fetchall()
+        cur.executemany('DELETE FROM uploads WHERE hash = ?', [(row['hash'],) for row in orphans])
+        # 持有写锁时删除文件，同时进行的相同内容上传（commit_upload）等到提交后才会重新写入；
+        # 提交失败时留下的记录没有引用，由 commit_upload 在重复上传时恢复文件
+        freed = 0
+        for row in orphans:
+            try:
+                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], row['path']))
+                freed += row['size']
+            except FileNotFoundError:
+                pass
+            for size in DERIVATIVE_SIZES:
+                derivative = os.path.join(app.config['UPLOAD_FOLDER'], '.derivatives', size, row['path'])
+                for path in (derivative, derivative + DERIVATIVE_FAILED_SUFFIX):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(orphans), freed
+
+def derivative_path(name, size):
+    """缩略图在上传目录中的相对路径：.derivatives/<尺寸>/<与原图相同的相对路径>"""
+    source = upload_path(name) if UPLOAD_NAME_PATTERN.match(name) else name
+    return os.path.join('.derivatives', size, source)
+
+def generate_derivative(source, target, max_size, quality=DERIVATIVE_QUALITY):
+    """在后台进程中把原图缩放到最长边不超过 max_size，写入 target；不是图片时写入失败标记并返回False"""
+    try:
+        with Image.open(source) as image:
+            output_format = image.format
+            # 按EXIF方向旋转手机照片，再缩放
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_size, max_size))
+            if output_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    image.save(tmp, format=output_format, quality=quality, optimize=True)
+                os.replace(tmp_path, target)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        return True
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # 原文件内容不会改变，记录下来，之后的请求直接返回原图而不再提交到进程池
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            open(target + DERIVATIVE_FAILED_SUFFIX, 'wb').close()
+        except OSError:
+            pass
+        return False
+
+_derivative_executor = None
+_derivative_executor_pid = None
+_derivative_executor_lock = threading.Lock()
+_derivative_pending = {}  # 目标路径 -> 正在生成的future，同一缩略图同时只提交一次
+_derivative_pending_lock = threading.Lock()
+
+def derivative_mp_context():
+    # worker进程中有多个线程，直接fork可能复制到被其他线程持有的锁而死锁；
+    # forkserver（Windows上为spawn）从单线程的服务进程或全新解释器创建子进程
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def get_derivative_executor():
+    """返回当前进程的缩略图进程池；fork出的worker进程会重新创建自己的进程池"""
+    global _derivative_executor, _derivative_executor_pid
+    if _derivative_executor is None or _derivative_executor_pid != os.getpid():
+        with _derivative_executor_lock:
+            if _derivative_executor is None or _derivative_executor_pid != os.getpid():
+                _derivative_executor = ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS,
+                                                           mp_context=derivative_mp_context())
+                _derivative_executor_pid = os.getpid()
+    return _derivative_executor
+
+def forget_pending_derivative(target, future):
+    with _derivative_pending_lock:
+        if _derivative_pending.get(target) is future:
+            del _derivative_pending[target]
+
+def submit_derivatives(name, sizes=DERIVATIVE_SIZES):
+    """把尚未生成、也未记录为无法生成的缩略图提交到进程池，返回 {尺寸: future}；正在生成的返回已有的future"""
+    if Image is None:
+        return {}
+    folder = app.config['UPLOAD_FOLDER']
+    source = os.path.join(folder, upload_path(name) if UPLOAD_NAME_PATTERN.match(name) else name)
+    if not os.path.isfile(source):
+        return {}
+    futures = {}
+    for size in sizes:
+        target = os.path.abspath(os.path.join(folder, derivative_path(name, size)))
+        if os.path.exists(target) or os.path.exists(target + DERIVATIVE_FAILED_SUFFIX):
+            continue
+        with _derivative_pending_lock:
+            future = _derivative_pending.get(target)
+            submitted = future is None
+            if submitted:
+                future = get_derivative_executor().submit(
+                    generate_derivative, os.path.abspath(source), target, DERIVATIVE_SIZES[size])
+                _derivative_pending[target] = future
+        if submitted:
+            # 已完成的future会立即在当前线程调用回调，因此在锁外注册
+            future.add_done_callback(lambda done, target=target: forget_pending_derivative(target, done))
+        futures[size] = future
+    return futures
 
 # 文件上传路由
 @app.route('/api/upload', methods=['POST'])
@@ -779,35 +2878,395 @@ def upload_file():
         file = request.files['file']
         if file.filename == '':
             return jsonify({'message': '没有选择文件'}), 400
-            
-        if file:
-            # 确保文件名安全
-            filename = secure_filename(file.filename)
-            # 生成唯一的文件名
-            unique_filename = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-            # 确保上传目录存在
-            if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                os.makedirs(app.config['UPLOAD_FOLDER'])
-            # 保存文件
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-            # 返回完整的URL路径
-            file_url = f'/api/uploads/{unique_filename}'
-            return jsonify({'url': file_url})
+
+        name, deduplicated = store_upload(get_db(), file)
+        if not deduplicated:
+            # 上传后立即在后台生成各尺寸的缩略图，不阻塞上传请求
+            submit_derivatives(name)
+        # 返回完整的URL路径；内容相同的文件返回已有的URL
+        return jsonify({'url': f'/api/uploads/{name}', 'deduplicated': deduplicated})
+    except UploadRejected as e:
+        return jsonify({'message': str(e)}), e.status
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print('文件上传失败:', str(e))
         return jsonify({'message': '文件上传失败'}), 500
 
+def send_upload(path, etag=None, immutable=False):
+    """发送上传目录中的文件：设置缓存头和ETag，支持 If-None-Match 和 Range，可交给前端服务器发送"""
+    folder = app.config['UPLOAD_FOLDER']
+    max_age = UPLOAD_IMMUTABLE_MAX_AGE if immutable else UPLOAD_MAX_AGE
+    if UPLOAD_SENDFILE == 'x-accel':
+        full_path = safe_join(folder, path)
+        if full_path is None or not os.path.isfile(full_path):
+            raise NotFound()
+        if etag is None:
+            stat = os.stat(full_path)
+            etag = f'{int(stat.st_mtime)}-{stat.st_size}'
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+        else:
+            # nginx收到后自行读取文件并处理Range，Python worker不再传输文件内容
+            response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX.rstrip('/') + '/' + path.replace(os.sep, '/')
+    else:
+        # send_file 处理 If-None-Match / If-Modified-Since 和 Range；USE_X_SENDFILE 时只返回X-Sendfile头
+        response = send_from_directory(folder, path, etag=etag or True, max_age=max_age)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
 # 提供上传文件的访问路由
 @app.route('/api/uploads/<filename>')
 def uploaded_file(filename):
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        size = request.args.get('size')
+        if size:
+            if size not in DERIVATIVE_SIZES:
+                return jsonify({'message': f'不支持的图片尺寸: {size}'}), 400
+            derivative = derivative_path(filename, size)
+            if Image is not None and not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], derivative)):
+                # 缩略图缺失（如旧文件或生成失败）时按需生成
+                future = submit_derivatives(filename, (size,)).get(size)
+                try:
+                    if future is not None and not future.result(timeout=DERIVATIVE_TIMEOUT):
+                        derivative = None
+                except FuturesTimeoutError:
+                    derivative = None
+            if derivative and os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], derivative)):
+                if UPLOAD_NAME_PATTERN.match(filename):
+                    # 同一原图、同一尺寸参数生成的缩略图内容不变
+                    etag = f'{filename[:64]}-{size}{DERIVATIVE_SIZES[size]}q{DERIVATIVE_QUALITY}'
+                    return send_upload(derivative, etag, immutable=True)
+                return send_upload(derivative)
+            # 不是图片或未安装Pillow时返回原图；之后可能生成缩略图，因此不使用长期缓存
+            if UPLOAD_NAME_PATTERN.match(filename):
+                return send_upload(upload_path(filename), filename[:64])
+            return send_upload(filename)
+        if UPLOAD_NAME_PATTERN.match(filename):
+            # 文件名即内容的SHA-256，直接作为强ETag
+            return send_upload(upload_path(filename), filename[:64], immutable=True)
+        # 按内容存储之前上传的文件仍在上传目录根下
+        return send_upload(filename)
+    except RequestedRangeNotSatisfiable:
+        raise
     except Exception as e:
         print('文件访问失败:', str(e))
         return jsonify({'message': '文件不存在'}), 404
 
-# 学生导入路由
+# 学生导入：Excel列名与students表字段的对应关系
+IMPORT_REQUIRED_COLUMNS = {'学号': 'student_id', '姓名': 'name', '年级': 'grade'}
+IMPORT_OPTIONAL_COLUMNS = {'班级': 'class', '家庭住址': 'address', '紧急联系人': 'emergency_contact', '联系人电话': 'emergency_phone'}
+IMPORT_CHUNK_SIZE = 500
+
+def normalize_import_column(series):
+    """把一列单元格统一转换为去除首尾空白的字符串，空单元格为空字符串"""
+    text = series.where(series.notna(), '').astype(str).str.strip()
+    # 数字单元格可能被读成浮点数，去掉多余的 .0（如学号 1001.0）
+    return text.str.replace(r'^(-?\d+)\.0$', r'\1', regex=True)
+
+def prepare_import_frame(df):
+    """向量化地规范化列并校验必填项，返回 (待导入的DataFrame, [(行号, 错误信息)])"""
+    frame = pd.DataFrame(index=df.index)
+    for column, field in {**IMPORT_REQUIRED_COLUMNS, **IMPORT_OPTIONAL_COLUMNS}.items():
+        if column in df.columns:
+            frame[field] = normalize_import_column(df[column])
+        else:
+            frame[field] = ''
+    # Excel第1行是表头，数据行号从2开始
+    frame['row_number'] = frame.index + 2
+
+    errors = []
+    missing = pd.Series(False, index=frame.index)
+    for column, field in IMPORT_REQUIRED_COLUMNS.items():
+        empty = frame[field] == ''
+        for row_number in frame.loc[empty & ~missing, 'row_number']:
+            errors.append((row_number, f'第{row_number}行: {column} 不能为空'))
+        missing |= empty
+    frame = frame[~missing]
+
+    # 文件内重复的学号只导入第一次出现的行
+    duplicated = frame['student_id'].duplicated(keep='first')
+    for row_number, student_id in frame.loc[duplicated, ['row_number', 'student_id']].itertuples(index=False):
+        errors.append((row_number, f'第{row_number}行: 学号 {student_id} 在文件中重复'))
+    return frame[~duplicated], errors
+
+def existing_student_ids(cur, student_ids):
+    existing = set()
+    for i in range(0, len(student_ids), IMPORT_CHUNK_SIZE):
+        chunk = student_ids[i:i + IMPORT_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        existing.update(row[0] for row in cur.execute(
+            f'SELECT student_id FROM students WHERE student_id IN ({placeholders})', chunk))
+    return existing
+
+def import_student_frame(db, df, seen_ids=None):
+    """批量导入学生，返回 (成功数量, 按行号排序的错误信息列表)；调用方负责提交事务
+
+    分块导入同一个文件时传入 seen_ids，用于识别与之前分块重复的学号
+    """
+    frame, errors = prepare_import_frame(df)
+    cur = db.cursor()
+
+    if seen_ids is not None:
+        repeated = frame['student_id'].isin(seen_ids)
+        for row_number, student_id in frame.loc[repeated, ['row_number', 'student_id']].itertuples(index=False):
+            errors.append((row_number, f'第{row_number}行: 学号 {student_id} 在文件中重复'))
+        frame = frame[~repeated]
+        seen_ids.update(frame['student_id'])
+
+    # 一次集合查询找出数据库中已存在的学号
+    existing = existing_student_ids(cur, frame['student_id'].tolist())
+    exists = frame['student_id'].isin(existing)
+    for row_number, student_id in frame.loc[exists, ['row_number', 'student_id']].itertuples(index=False):
+        errors.append((row_number, f'第{row_number}行: 学号 {student_id} 已存在'))
+    frame = frame[~exists]
+
+    insert_sql = '''
+        INSERT INTO students (
+            name, student_id, grade, class, 
+            address, emergency_contact, emergency_phone
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    columns = ['name', 'student_id', 'grade', 'class', 'address', 'emergency_contact', 'emergency_phone']
+    rows = list(frame[columns].itertuples(index=False, name=None))
+    row_numbers = frame['row_number'].tolist()
+
+    # 显式开启事务，保证各分块的保存点嵌套在同一个事务中
+    if not db.in_transaction:
+        cur.execute('BEGIN')
+    success_count = 0
+    for i in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        chunk = rows[i:i + IMPORT_CHUNK_SIZE]
+        cur.execute('SAVEPOINT import_chunk')
+        try:
+            cur.executemany(insert_sql, chunk)
+            cur.execute('RELEASE import_chunk')
+            success_count += len(chunk)
+        except sqlite3.Error:
+            # 整块失败时回退到逐行插入，以便定位出错的行
+            cur.execute('ROLLBACK TO import_chunk')
+            cur.execute('RELEASE import_chunk')
+            for row_number, row in zip(row_numbers[i:i + IMPORT_CHUNK_SIZE], chunk):
+                try:
+                    cur.execute(insert_sql, row)
+                    success_count += 1
+                except sqlite3.Error as e:
+                    errors.append((row_number, f'第{row_number}行: {str(e)}'))
+
+    errors.sort(key=lambda error: error[0])
+    return success_count, [message for _, message in errors]
+
+# 后台导入任务配置
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))
+IMPORT_JOB_RETENTION = int(os.environ.get('IMPORT_JOB_RETENTION', 3600))  # 已结束的任务保留秒数
+
+class ImportCancelled(Exception):
+    pass
+
+class ImportJob:
+    """一次学生导入任务的状态：执行任务的后台线程持有该对象，每处理完一个分块写回 import_jobs 表，
+    查询和取消接口直接读写数据库，请求落在任意worker进程上都能看到最新进度"""
+
+    def __init__(self, filename, path, created_by):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.created_by = created_by
+        self.status = 'pending'
+        self.message = '等待导入'
+        self.total_rows = None
+        self.rows_processed = 0
+        self.success_count = 0
+        self.error_messages = []
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def insert(self, db):
+        db.execute('''
+            INSERT INTO import_jobs (id, filename, created_by, status, message, owner_pid, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (self.id, self.filename, self.created_by, self.status, self.message, os.getpid(), self.created_at))
+
+    def save(self, db):
+        db.execute('''
+            UPDATE import_jobs SET status = ?, message = ?, total_rows = ?, rows_processed = ?,
+                success_count = ?, error_messages = ?, finished_at = ?
+            WHERE id = ?
+        ''', (self.status, self.message, self.total_rows, self.rows_processed, self.success_count,
+              json.dumps(self.error_messages, ensure_ascii=False), self.finished_at, self.id))
+
+    def cancel_requested(self, db):
+        row = db.execute('SELECT cancel_requested FROM import_jobs WHERE id = ?', (self.id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, db, status, message):
+        self.status = status
+        self.message = message
+        self.finished_at = time.time()
+        self.save(db)
+        db.commit()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'message': self.message,
+            'total_rows': self.total_rows,
+            'rows_processed': self.rows_processed,
+            'success_count': self.success_count,
+            'error_count': len(self.error_messages),
+            'error_messages': list(self.error_messages),
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+def import_job_to_dict(row):
+    error_messages = json.loads(row['error_messages'])
+    return {
+        'job_id': row['id'],
+        'filename': row['filename'],
+        'status': row['status'],
+        'message': row['message'],
+        'total_rows': row['total_rows'],
+        'rows_processed': row['rows_processed'],
+        'success_count': row['success_count'],
+        'error_count': len(error_messages),
+        'error_messages': error_messages,
+        'created_at': row['created_at'],
+        'finished_at': row['finished_at']
+    }
+
+import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix='student-import')
+
+def prune_import_jobs(db):
+    db.execute('DELETE FROM import_jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+               (time.time() - IMPORT_JOB_RETENTION,))
+
+def import_job_owner_alive(pid):
+    """执行任务的进程是否仍在运行（同一台机器上的worker进程）"""
+    if pid is None or pid == os.getpid() or os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def load_import_job(db, job_id):
+    """读取导入任务；执行任务的进程已退出（重启、崩溃）时把未结束的任务标记为失败"""
+    row = db.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+    if row and row['status'] in ('pending', 'running') and not import_job_owner_alive(row['owner_pid']):
+        db.execute("UPDATE import_jobs SET status = 'failed', message = ?, finished_at = ? WHERE id = ?",
+                   ('服务重启，导入已中断', time.time(), job_id))
+        db.commit()
+        row = db.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+    return row
+
+def read_import_chunks(path, job):
+    """按块读取Excel数据行，返回DataFrame，索引为 Excel行号 - 2（与 pd.read_excel 一致）"""
+    if path.endswith('.xls'):
+        # openpyxl不支持旧版.xls格式，只能整体读取后再分块
+        df = pd.read_excel(path)
+        job.total_rows = len(df)
+        missing = [field for field in IMPORT_REQUIRED_COLUMNS if field not in df.columns]
+        if missing:
+            raise ValueError(f'缺少必填字段: {missing[0]}')
+        for start in range(0, len(df), IMPORT_CHUNK_SIZE):
+            yield df.iloc[start:start + IMPORT_CHUNK_SIZE]
+        return
+
+    # 只读模式逐行流式读取，内存占用与文件大小无关
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = [str(value).strip() if value is not None else f'_column_{i}' for i, value in enumerate(header)]
+        missing = [field for field in IMPORT_REQUIRED_COLUMNS if field not in columns]
+        if missing:
+            raise ValueError(f'缺少必填字段: {missing[0]}')
+        if ws.max_row:
+            job.total_rows = max(ws.max_row - 1, 0)
+
+        chunk, index = [], []
+        for row_number, values in enumerate(rows, 2):
+            if all(value is None for value in values):
+                continue
+            values = tuple(values[:len(columns)]) + (None,) * (len(columns) - len(values))
+            chunk.append(values)
+            index.append(row_number - 2)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                yield pd.DataFrame(chunk, columns=columns, index=index)
+                chunk, index = [], []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, index=index)
+    finally:
+        wb.close()
+
+def run_import_job(job):
+    db = get_pool().acquire()
+    try:
+        job.status = 'running'
+        job.message = '正在导入'
+        job.save(db)
+        db.commit()
+        seen_ids = set()
+        for df in read_import_chunks(job.path, job):
+            if job.cancel_requested(db):
+                raise ImportCancelled()
+            # 每个分块连同任务进度单独提交，避免长时间占用写锁，并让进度对其他请求可见
+            progress = (job.rows_processed, job.success_count, len(job.error_messages))
+            try:
+                success_count, error_messages = import_student_frame(db, df, seen_ids)
+                job.rows_processed += len(df)
+                job.success_count += success_count
+                job.error_messages.extend(error_messages)
+                job.save(db)
+                db.commit()
+            except Exception:
+                db.rollback()
+                job.rows_processed, job.success_count = progress[:2]
+                del job.error_messages[progress[2]:]
+                raise
+
+        job.finish(db, 'completed', '导入完成')
+    except ImportCancelled:
+        job.finish(db, 'cancelled', f'导入已取消，已导入 {job.success_count} 条记录')
+    except Exception as e:
+        print('后台导入学生失败:', str(e))
+        try:
+            job.finish(db, 'failed', f'解析Excel文件失败: {str(e)}')
+        except sqlite3.Error as save_error:
+            db.rollback()
+            print('保存导入任务状态失败:', str(save_error))
+    finally:
+        get_pool().release(db)
+        if os.path.exists(job.path):
+            os.remove(job.path)
+
+def import_temp_path(extension):
+    return os.path.join(app.config['UPLOAD_FOLDER'], f'import_{uuid.uuid4().hex}{extension}')
+
+def start_import_job(filename, temp_path):
+    """登记导入任务并交给后台线程执行，任务结束后删除 temp_path"""
+    db = get_db()
+    prune_import_jobs(db)
+    job = ImportJob(secure_filename(filename), temp_path, get_jwt_identity())
+    job.insert(db)
+    db.commit()
+    import_executor.submit(run_import_job, job)
+    return job
+
+# 学生导入路由：保存文件后立即返回任务ID，由后台线程解析和导入
 @app.route('/api/students/import', methods=['POST'])
 @jwt_required()
 def import_students():
@@ -819,148 +3278,353 @@ def import_students():
         if file.filename == '':
             return jsonify({'message': '没有选择文件'}), 400
             
-        if file and file.filename.endswith(('.xlsx', '.xls')):
-            # 保存文件
-            filename = secure_filename(file.filename)
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(temp_path)
-            
-            try:
-                # 读取Excel文件
-                df = pd.read_excel(temp_path)
-                
-                # 验证必填字段
-                required_fields = ['学号', '姓名', '年级']
-                for field in required_fields:
-                    if field not in df.columns:
-                        return jsonify({'message': f'缺少必填字段: {field}'}), 400
-                
-                # 开始导入数据
-                success_count = 0
-                error_count = 0
-                error_messages = []
-                
-                cur = get_db().cursor()
-                
-                for index, row in df.iterrows():
-                    try:
-                        # 检查学号是否已存在
-                        existing = cur.execute('SELECT id FROM students WHERE student_id = ?', 
-                                            (str(row['学号']),)).fetchone()
-                        if existing:
-                            error_count += 1
-                            error_messages.append(f'第{index+2}行: 学号 {row["学号"]} 已存在')
-                            continue
-                        
-                        # 插入数据
-                        cur.execute('''
-                            INSERT INTO students (
-                                name, student_id, grade, class, 
-                                address, emergency_contact, emergency_phone
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            str(row['姓名']),
-                            str(row['学号']),
-                            str(row['年级']),
-                            str(row.get('班级', '')),
-                            str(row.get('家庭住址', '')),
-                            str(row.get('紧急联系人', '')),
-                            str(row.get('联系人电话', ''))
-                        ))
-                        success_count += 1
-                        
-                    except Exception as e:
-                        error_count += 1
-                        error_messages.append(f'第{index+2}行: {str(e)}')
-                
-                get_db().commit()
-                
-                # 删除临时文件
-                os.remove(temp_path)
-                
-                return jsonify({
-                    'message': '导入完成',
-                    'success_count': success_count,
-                    'error_count': error_count,
-                    'error_messages': error_messages
-                })
-                
-            except Exception as e:
-                return jsonify({'message': f'解析Excel文件失败: {str(e)}'}), 400
-            finally:
-                # 确保临时文件被删除
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    
-        return jsonify({'message': '不支持的文件格式'}), 400
+        # 与分块上传相同，按文件头判断xlsx/xls并限制大小；使用唯一文件名，避免并发导入同名文件时互相覆盖
+        tmp_path, _, _, _, extension = receive_upload(file, 'import')
+        temp_path = import_temp_path(extension)
+        os.replace(tmp_path, temp_path)
+
+        job = start_import_job(file.filename, temp_path)
+        return jsonify(job.to_dict()), 202
         
+    except UploadRejected as e:
+        return jsonify({'message': str(e)}), e.status
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         print('导入学生失败:', str(e))
         return jsonify({'message': '导入学生失败'}), 500
 
+@app.route('/api/students/import/<job_id>', methods=['GET'])
+@jwt_required()
+def get_import_job(job_id):
+    row = load_import_job(get_db(), job_id)
+    if not row:
+        return jsonify({'message': '导入任务不存在'}), 404
+    return jsonify(import_job_to_dict(row))
+
+@app.route('/api/students/import/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_import_job(job_id):
+    # 执行任务的进程在处理下一个分块前读取取消标记
+    db = get_db()
+    db.execute("UPDATE import_jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('pending', 'running')",
+               (job_id,))
+    db.commit()
+    row = load_import_job(db, job_id)
+    if not row:
+        return jsonify({'message': '导入任务不存在'}), 404
+    return jsonify(import_job_to_dict(row))
+
+# 上传允许的文件类型：文件头特征 ((偏移, 字节), ...)、MIME类型和保存的扩展名
+UPLOAD_SIGNATURES = {
+    'image': [
+        (((0, b'\xff\xd8\xff'),), 'image/jpeg', '.jpg'),
+        (((0, b'\x89PNG\r\n\x1a\n'),), 'image/png', '.png'),
+        (((0, b'GIF87a'),), 'image/gif', '.gif'),
+        (((0, b'GIF89a'),), 'image/gif', '.gif'),
+        (((0, b'RIFF'), (8, b'WEBP')), 'image/webp', '.webp'),
+        (((0, b'BM'),), 'image/bmp', '.bmp')
+    ],
+    'import': [
+        (((0, b'PK\x03\x04'),), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx'),
+        (((0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),), 'application/vnd.ms-excel', '.xls')
+    ]
+}
+UPLOAD_SIGNATURE_LENGTH = 16
+
+def detect_upload_type(kind, head):
+    """按文件头判断类型，返回 (MIME类型, 扩展名)；与 kind 不符时返回None"""
+    for parts, mimetype, ext in UPLOAD_SIGNATURES[kind]:
+        if all(head[offset:offset + len(magic)] == magic for offset, magic in parts):
+            return mimetype, ext
+    return None
+
+def upload_session_path(upload_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], '.tmp', f'{upload_id}.part')
+
+def chunk_length(session, index):
+    """第 index 个分块应有的字节数（最后一块可能较短）"""
+    return min(session['chunk_size'], session['size'] - index * session['chunk_size'])
+
+def prune_upload_sessions(db):
+    """删除超过保留时间未继续的上传会话及其临时文件"""
+    expired = [row['id'] for row in db.execute(
+        "SELECT id FROM upload_sessions WHERE updated_at < datetime('now', ?)",
+        (f'-{UPLOAD_SESSION_TTL} seconds',))]
+    for upload_id in expired:
+        delete_upload_session(db, upload_id)
+    db.commit()
+
+def delete_upload_session(db, upload_id):
+    db.execute('DELETE FROM upload_session_chunks WHERE session_id = ?', (upload_id,))
+    db.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+    try:
+        os.remove(upload_session_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+def get_upload_session(db, upload_id):
+    """返回当前用户的上传会话，不存在或属于其他用户时返回None"""
+    session = db.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    if session is None or session['created_by'] != get_jwt_identity():
+        return None
+    return session
+
+def upload_session_dict(db, session):
+    received = [row[0] for row in db.execute(
+        'SELECT chunk_index FROM upload_session_chunks WHERE session_id = ? ORDER BY chunk_index',
+        (session['id'],))]
+    received_set = set(received)
+    next_chunk = next((i for i in range(session['total_chunks']) if i not in received_set), None)
+    return {
+        'upload_id': session['id'],
+        'kind': session['kind'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'chunk_size': session['chunk_size'],
+        'total_chunks': session['total_chunks'],
+        'received_chunks': received,
+        'next_chunk': next_chunk
+    }
+
+@app.errorhandler(413)
+def request_entity_too_large(error):
+    return jsonify({'message': '上传的文件过大'}), 413
+
+# 分块上传：创建会话 -> 逐块PUT（可断点续传）-> 完成
+@app.route('/api/uploads/sessions', methods=['POST'])
+@jwt_required()
+def create_upload_session():
+    try:
+        data = request.get_json() or {}
+        kind = data.get('kind')
+        if kind not in UPLOAD_SIZE_LIMITS:
+            return jsonify({'message': f'不支持的上传类型: {kind}'}), 400
+        filename = data.get('filename')
+        if not filename:
+            return jsonify({'message': 'filename 是必填项'}), 400
+        try:
+            size = int(data.get('size'))
+            chunk_size = int(data.get('chunk_size') or UPLOAD_CHUNK_SIZE)
+        except (TypeError, ValueError):
+            return jsonify({'message': '无效的文件大小'}), 400
+        if size <= 0:
+            return jsonify({'message': '无效的文件大小'}), 400
+        # 在接收任何数据之前按声明的大小拒绝超限文件
+        if size > UPLOAD_SIZE_LIMITS[kind]:
+            return jsonify({'message': f'文件大小不能超过 {UPLOAD_SIZE_LIMITS[kind] // (1024 * 1024)}MB'}), 413
+        chunk_size = max(UPLOAD_MIN_CHUNK_SIZE, min(chunk_size, UPLOAD_MAX_CHUNK_SIZE))
+
+        db = get_db()
+        prune_upload_sessions(db)
+        upload_id = uuid.uuid4().hex
+        path = upload_session_path(upload_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 预先创建完整大小的（稀疏）临时文件，各分块直接写入各自的位置
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        db.execute('''
+            INSERT INTO upload_sessions (id, kind, filename, size, chunk_size, total_chunks, created_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (upload_id, kind, filename, size, chunk_size, -(-size // chunk_size), get_jwt_identity()))
+        db.commit()
+        session = db.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+        return jsonify(upload_session_dict(db, session)), 201
+    except Exception as e:
+        print('创建上传会话失败:', str(e))
+        return jsonify({'message': '创建上传会话失败'}), 500
+
+@app.route('/api/uploads/sessions/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session_status(upload_id):
+    db = get_db()
+    session = get_upload_session(db, upload_id)
+    if session is None:
+        return jsonify({'message': '上传会话不存在'}), 404
+    # 客户端断线后据此从第一个缺失的分块继续上传
+    return jsonify(upload_session_dict(db, session))
+
+@app.route('/api/uploads/sessions/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id, index):
+    try:
+        db = get_db()
+        session = get_upload_session(db, upload_id)
+        if session is None:
+            return jsonify({'message': '上传会话不存在'}), 404
+        if index < 0 or index >= session['total_chunks']:
+            return jsonify({'message': '无效的分块序号'}), 400
+        expected = chunk_length(session, index)
+        if request.content_length is not None and request.content_length != expected:
+            return jsonify({'message': f'分块大小应为 {expected} 字节'}), 400
+
+        stream = request.stream
+        received = 0
+        with open(upload_session_path(upload_id), 'r+b') as f:
+            f.seek(index * session['chunk_size'])
+            if index == 0:
+                # 第一个分块先检查文件头，类型不符时不再接收后续数据
+                head = b''
+                while len(head) < min(UPLOAD_SIGNATURE_LENGTH, expected):
+                    data = stream.read(min(UPLOAD_SIGNATURE_LENGTH, expected) - len(head))
+                    if not data:
+                        break
+                    head += data
+                if detect_upload_type(session['kind'], head) is None:
+                    return jsonify({'message': '文件内容与类型不符'}), 415
+                f.write(head)
+                received += len(head)
+            while True:
+                data = stream.read(UPLOAD_HASH_CHUNK_SIZE)
+                if not data:
+                    break
+                received += len(data)
+                if received > expected:
+                    return jsonify({'message': f'分块大小应为 {expected} 字节'}), 400
+                f.write(data)
+        if received != expected:
+            # 连接中断等导致分块不完整：不记录，客户端重新上传该分块
+            return jsonify({'message': f'分块大小应为 {expected} 字节'}), 400
+
+        db.execute('INSERT OR IGNORE INTO upload_session_chunks (session_id, chunk_index) VALUES (?, ?)',
+                   (upload_id, index))
+        db.execute('UPDATE upload_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (upload_id,))
+        db.commit()
+        return jsonify(upload_session_dict(db, session))
+    except FileNotFoundError:
+        return jsonify({'message': '上传会话不存在'}), 404
+    except Exception as e:
+        print('上传分块失败:', str(e))
+        return jsonify({'message': '上传分块失败'}), 500
+
+@app.route('/api/uploads/sessions/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload_session(upload_id):
+    try:
+        db = get_db()
+        session = get_upload_session(db, upload_id)
+        if session is None:
+            return jsonify({'message': '上传会话不存在'}), 404
+
+        # 写锁内检查并删除会话，同一会话只会被完成一次
+        db.execute('BEGIN IMMEDIATE')
+        status = upload_session_dict(db, session)
+        if status['next_chunk'] is not None:
+            db.rollback()
+            return jsonify({'message': '还有分块未上传', **status}), 409
+        db.execute('DELETE FROM upload_session_chunks WHERE session_id = ?', (upload_id,))
+        db.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+        db.commit()
+
+        path = upload_session_path(upload_id)
+        try:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                head = f.read(UPLOAD_SIGNATURE_LENGTH)
+                digest.update(head)
+                for data in iter(lambda: f.read(UPLOAD_HASH_CHUNK_SIZE), b''):
+                    digest.update(data)
+            mimetype, ext = detect_upload_type(session['kind'], head)
+
+            if session['kind'] == 'import':
+                import_path = import_temp_path(ext)
+                os.replace(path, import_path)
+                path = None
+                job = start_import_job(session['filename'], import_path)
+                return jsonify(job.to_dict()), 202
+
+            name, deduplicated = commit_upload(db, path, digest.hexdigest(), session['size'],
+                                               ext, mimetype, session['filename'])
+            path = None
+            if not deduplicated:
+                submit_derivatives(name)
+            return jsonify({'url': f'/api/uploads/{name}', 'deduplicated': deduplicated})
+        finally:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+    except Exception as e:
+        print('完成上传失败:', str(e))
+        return jsonify({'message': '完成上传失败'}), 500
+
+@app.route('/api/uploads/sessions/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_upload_session(upload_id):
+    db = get_db()
+    if get_upload_session(db, upload_id) is None:
+        return jsonify({'message': '上传会话不存在'}), 404
+    delete_upload_session(db, upload_id)
+    db.commit()
+    return jsonify({'message': '已取消上传'})
+
+# 学生导入模板定义；修改后首次下载时会自动重新生成
+TEMPLATE_HEADERS = ['学号', '姓名', '年级', '班级', '家庭住址', '紧急联系人', '联系人电话', '备注']
+TEMPLATE_EXAMPLE_DATA = [
+    ['S001', '张三', '高一', '1班', '北京市海淀区', '张父', '13800138000', '品学兼优'],
+    ['S002', '李四', '高二', '2班', '北京市朝阳区', '李母', '13900139000', '积极向上']
+]
+
+# 生成好的模板保存在内存中：(定义指纹, 文件内容, 修改时间)
+# xlsx内容包含生成时间，ETag使用定义指纹，多个worker进程生成的模板ETag一致
+_template_cache = None
+_template_lock = threading.Lock()
+
+def build_template():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "学生信息"
+
+    # 添加表头
+    for col, header in enumerate(TEMPLATE_HEADERS, 1):
+        cell = ws.cell(row=1, column=col)
+        cell.value = header
+        cell.font = openpyxl.styles.Font(bold=True)
+        cell.fill = openpyxl.styles.PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+
+    # 添加示例数据
+    for row_idx, row_data in enumerate(TEMPLATE_EXAMPLE_DATA, 2):
+        for col_idx, value in enumerate(row_data, 1):
+            ws.cell(row=row_idx, column=col_idx, value=value)
+
+    # 调整列宽
+    for col_idx, header in enumerate(TEMPLATE_HEADERS, 1):
+        max_length = max(len(str(value)) for value in [header] + [row[col_idx - 1] for row in TEMPLATE_EXAMPLE_DATA])
+        ws.column_dimensions[openpyxl.utils.get_column_letter(col_idx)].width = max_length + 2
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def get_template():
+    global _template_cache
+    fingerprint = hashlib.sha256(
+        json.dumps([TEMPLATE_HEADERS, TEMPLATE_EXAMPLE_DATA], ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+    with _template_lock:
+        if _template_cache is None or _template_cache[0] != fingerprint:
+            print("生成学生导入模板...")
+            # 模板定义写在本文件中，定义变化时文件修改时间必然随之变化
+            _template_cache = (fingerprint, build_template(), int(os.path.getmtime(__file__)))
+        return _template_cache
+
 # 添加模板下载路由
 @app.route('/api/students/template', methods=['GET'])
 @jwt_required()
 def download_template():
-    print("\n=== 开始生成学生导入模板 ===")
     try:
-        print("创建新的Excel工作簿...")
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "学生信息"
-
-        print("添加表头...")
-        headers = ['学号', '姓名', '年级', '班级', '家庭住址', '紧急联系人', '联系人电话', '备注']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col)
-            cell.value = header
-            cell.font = openpyxl.styles.Font(bold=True)
-            cell.fill = openpyxl.styles.PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-
-        print("添加示例数据...")
-        example_data = [
-            ['S001', '张三', '高一', '1班', '北京市海淀区', '张父', '13800138000', '品学兼优'],
-            ['S002', '李四', '高二', '2班', '北京市朝阳区', '李母', '13900139000', '积极向上']
-        ]
-        for row_idx, row_data in enumerate(example_data, 2):
-            for col_idx, value in enumerate(row_data, 1):
-                ws.cell(row=row_idx, column=col_idx, value=value)
-
-        print("调整列宽...")
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column].width = adjusted_width
-
-        print("保存模板文件...")
-        # 使用绝对路径
-        temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-            
-        temp_file = os.path.join(temp_dir, 'student_import_template.xlsx')
-        wb.save(temp_file)
-
-        print("发送文件...")
-        response = send_from_directory(temp_dir, 'student_import_template.xlsx', as_attachment=True)
-        
-        # 添加清理代码
-        @response.call_on_close
-        def cleanup():
-            try:
-                os.remove(temp_file)
-                print(f"临时文件已删除: {temp_file}")
-            except Exception as e:
-                print(f"清理临时文件失败: {str(e)}")
-                
-        print("=== 模板生成完成 ===\n")
+        etag, data, last_modified = get_template()
+        # conditional=True 时根据 If-None-Match / If-Modified-Since 返回304
+        response = send_file(
+            io.BytesIO(data),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name='student_import_template.xlsx',
+            conditional=True,
+            etag=etag[:32],
+            last_modified=last_modified,
+            max_age=0
+        )
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
         return response
         
     except Exception as e:
@@ -973,110 +3637,395 @@ def download_template():
             'error': str(e)
         }), 500
 
-@app.route('/api/statistics/behavior-trends')
-@jwt_required()
-def get_behavior_trends():
-    days = request.args.get('days', '7')
-    days = int(days)
-    
-    db = get_db()
-    cur = db.cursor()
-    
-    # 获取指定天数内的行为记录
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-    
-    # 生成日期列表
-    dates = []
-    violations = []
-    excellents = []
-    current_date = start_date
-    
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        dates.append(date_str)
-        
-        # 获取违纪行为数量
-        cur.execute('''
-            SELECT COUNT(*) FROM behaviors b
-            JOIN behavior_types bt ON b.type_id = bt.id
-            WHERE DATE(b.created_at) = ? AND bt.is_violation = 1
-        ''', (date_str,))
-        violations.append(cur.fetchone()[0])
-        
-        # 获取优秀表现数量
-        cur.execute('''
-            SELECT COUNT(*) FROM behaviors b
-            JOIN behavior_types bt ON b.type_id = bt.id
-            WHERE DATE(b.created_at) = ? AND bt.is_violation = 0
-        ''', (date_str,))
-        excellents.append(cur.fetchone()[0])
-        
-        current_date += timedelta(days=1)
-    
-    return jsonify({
+# 趋势统计的时间粒度：SQL中的分桶表达式和Python中对应的分桶函数
+TREND_BUCKETS = {
+    'day': ("r.day", lambda d: d.isoformat()),
+    'week': ("date(r.day, 'weekday 0', '-6 days')", lambda d: (d - timedelta(days=d.weekday())).isoformat()),
+    'month': ("substr(r.day, 1, 7)", lambda d: d.strftime('%Y-%m'))
+}
+
+TREND_SERIES = {
+    'grade': 'r.grade',
+    'type': '(SELECT name FROM behavior_types WHERE id = r.behavior_type_id)'
+}
+
+MAX_TREND_DAYS = 3660
+
+def trend_buckets(start, end, bucket_of):
+    """生成 [start, end] 范围内按顺序排列的全部分桶，用于补零"""
+    buckets = []
+    current = start
+    while current <= end:
+        key = bucket_of(current)
+        if not buckets or buckets[-1] != key:
+            buckets.append(key)
+        current += timedelta(days=1)
+    return buckets
+
+def compute_behavior_trends(cur, start_date, end_date, bucket='day', series=None, grade=None):
+    bucket_sql, bucket_of = TREND_BUCKETS[bucket]
+    series_sql = TREND_SERIES[series] if series else "''"
+
+    where_conditions = ["r.day BETWEEN ? AND ?"]
+    query_params = [start_date.isoformat(), end_date.isoformat()]
+    if grade:
+        where_conditions.append("r.grade = ?")
+        query_params.append(grade)
+
+    # 一次分组查询得到所有分桶（以及分组序列）的计数
+    rows = cur.execute(f'''
+        SELECT {bucket_sql} as bucket,
+               {series_sql} as series,
+               SUM(CASE WHEN r.category = '违纪' THEN r.count ELSE 0 END) as violations,
+               SUM(CASE WHEN r.category <> '违纪' THEN r.count ELSE 0 END) as excellents
+        FROM behavior_daily_rollup r
+        WHERE {' AND '.join(where_conditions)}
+        GROUP BY bucket, series
+    ''', query_params).fetchall()
+
+    dates = trend_buckets(start_date, end_date, bucket_of)
+    index = {d: i for i, d in enumerate(dates)}
+    violations = [0] * len(dates)
+    excellents = [0] * len(dates)
+    series_data = {}
+    for row in rows:
+        i = index.get(row['bucket'])
+        if i is None:
+            continue
+        violations[i] += row['violations']
+        excellents[i] += row['excellents']
+        if series:
+            entry = series_data.setdefault(row['series'], {
+                'name': row['series'],
+                'violations': [0] * len(dates),
+                'excellents': [0] * len(dates)
+            })
+            entry['violations'][i] += row['violations']
+            entry['excellents'][i] += row['excellents']
+
+    result = {
         'dates': dates,
         'violations': violations,
         'excellents': excellents
-    })
+    }
+    if series:
+        result['series'] = [series_data[name] for name in sorted(series_data)]
+    return result
 
-@app.route('/api/statistics/behavior-types')
+@app.route('/api/statistics/behavior-trends')
 @jwt_required()
-def get_behavior_type_distribution():
-    db = get_db()
-    cur = db.cursor()
-    
-    cur.execute('''
-        SELECT bt.name, bt.is_violation, COUNT(b.id) as count
+def get_behavior_trends():
+    try:
+        bucket = request.args.get('bucket', 'day')
+        series = request.args.get('series')
+        if bucket not in TREND_BUCKETS:
+            return jsonify({'message': f'不支持的时间粒度: {bucket}'}), 400
+        if series and series not in TREND_SERIES:
+            return jsonify({'message': f'不支持的分组方式: {series}'}), 400
+
+        # 时间范围：优先使用 start_date/end_date，否则取最近 days 天
+        try:
+            if request.args.get('end_date'):
+                end_date = datetime.date.fromisoformat(request.args['end_date'][:10])
+            else:
+                end_date = datetime.date.today()
+            if request.args.get('start_date'):
+                start_date = datetime.date.fromisoformat(request.args['start_date'][:10])
+            else:
+                start_date = end_date - timedelta(days=int(request.args.get('days', '7')))
+        except ValueError:
+            return jsonify({'message': '无效的日期范围'}), 400
+        if start_date > end_date or (end_date - start_date).days > MAX_TREND_DAYS:
+            return jsonify({'message': '无效的日期范围'}), 400
+
+        params = {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'bucket': bucket,
+            'series': series,
+            'grade': request.args.get('grade')
+        }
+        result = stats_cache.get_or_compute(
+            'behavior-trends', params,
+            lambda: compute_behavior_trends(get_db().cursor(), start_date, end_date, bucket, series, params['grade'])
+        )
+        return jsonify(result)
+    except Exception as e:
+        print('获取行为趋势失败:', str(e))
+        return jsonify({'message': '获取行为趋势失败'}), 500
+
+def compute_behavior_type_distribution(cur, grade=None, start_date=None, end_date=None):
+    where, query_params = rollup_filter(grade, start_date, end_date)
+    # 筛选条件放在JOIN条件中，保证没有记录的行为类型也返回0
+    join_condition = where.replace(' WHERE ', ' AND ', 1)
+
+    cur.execute(f'''
+        SELECT bt.name, bt.category, COALESCE(SUM(r.count), 0) as count
         FROM behavior_types bt
-        LEFT JOIN behaviors b ON bt.id = b.type_id
+        LEFT JOIN behavior_daily_rollup r ON r.behavior_type_id = bt.id{join_condition}
         GROUP BY bt.id
         ORDER BY count DESC
-    ''')
-    
+    ''', query_params)
+
     results = []
     for row in cur.fetchall():
         results.append({
-            'type_name': row[0],
-            'is_violation': bool(row[1]),
-            'count': row[2]
+            'type_name': row['name'],
+            'is_violation': row['category'] == '违纪',
+            'count': row['count']
         })
-    
-    return jsonify(results)
+    return results
+
+def compute_grade_comparison(cur, start_date=None, end_date=None):
+    where, query_params = rollup_filter(None, start_date, end_date)
+
+    counts = {}
+    for row in cur.execute(f'''
+        SELECT r.grade, r.category = '违纪' as is_violation, SUM(r.count) as count
+        FROM behavior_daily_rollup r{where}
+        GROUP BY r.grade, is_violation
+    ''', query_params):
+        counts[(row['grade'], bool(row['is_violation']))] = row['count']
+
+    grades = ['高一', '高二', '高三']
+    return {
+        'violations': [counts.get((grade, True), 0) for grade in grades],
+        'excellents': [counts.get((grade, False), 0) for grade in grades]
+    }
+
+@app.route('/api/statistics/behavior-types')
+@jwt_required()
+def get_behavior_type_distribution():
+    try:
+        grade = request.args.get('grade')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        results = stats_cache.get_or_compute(
+            'behavior-type-distribution',
+            {'grade': grade, 'start_date': normalize_day(start_date), 'end_date': normalize_day(end_date)},
+            lambda: compute_behavior_type_distribution(get_db().cursor(), grade, start_date, end_date)
+        )
+        return jsonify(results)
+    except Exception as e:
+        print('获取行为类型分布失败:', str(e))
+        return jsonify({'message': '获取行为类型分布失败'}), 500
 
 @app.route('/api/statistics/grade-comparison')
 @jwt_required()
 def get_grade_comparison():
-    db = get_db()
-    cur = db.cursor()
-    
-    grades = ['高一', '高二', '高三']
-    violations = []
-    excellents = []
-    
-    for grade in grades:
-        # 获取违纪行为数量
-        cur.execute('''
-            SELECT COUNT(*) FROM behaviors b
-            JOIN behavior_types bt ON b.type_id = bt.id
-            JOIN students s ON b.student_id = s.id
-            WHERE s.grade = ? AND bt.is_violation = 1
-        ''', (grade,))
-        violations.append(cur.fetchone()[0])
-        
-        # 获取优秀表现数量
-        cur.execute('''
-            SELECT COUNT(*) FROM behaviors b
-            JOIN behavior_types bt ON b.type_id = bt.id
-            JOIN students s ON b.student_id = s.id
-            WHERE s.grade = ? AND bt.is_violation = 0
-        ''', (grade,))
-        excellents.append(cur.fetchone()[0])
-    
-    return jsonify({
-        'violations': violations,
-        'excellents': excellents
-    })
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        result = stats_cache.get_or_compute(
+            'grade-comparison',
+            {'start_date': normalize_day(start_date), 'end_date': normalize_day(end_date)},
+            lambda: compute_grade_comparison(get_db().cursor(), start_date, end_date)
+        )
+        return jsonify(result)
+    except Exception as e:
+        print('获取年级对比数据失败:', str(e))
+        return jsonify({'message': '获取年级对比数据失败'}), 500
+
+# 首页概览：最近记录条数、行为类型排行条数和趋势天数的默认值与上限
+DASHBOARD_RECENT_DEFAULT = 10
+DASHBOARD_RECENT_MAX = 50
+DASHBOARD_TOP_TYPES_DEFAULT = 5
+DASHBOARD_TOP_TYPES_MAX = 20
+DASHBOARD_TREND_DAYS_DEFAULT = 30
+DASHBOARD_TREND_DAYS_MAX = 366
+
+def category_counts(cur, where='', query_params=()):
+    """汇总表上按类别统计的 (违纪数, 优秀数)"""
+    violations = excellent = 0
+    for row in cur.execute(f'''
+        SELECT r.category, SUM(r.count) as total
+        FROM behavior_daily_rollup r{where}
+        GROUP BY r.category
+    ''', query_params):
+        if row['category'] == '违纪':
+            violations += row['total']
+        else:
+            excellent += row['total']
+    return violations, excellent
+
+def compute_dashboard(cur, today, recent_limit, top_limit, trend_days):
+    total_students = cur.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+    students_by_grade = {
+        row['grade']: row['count']
+        for row in cur.execute('SELECT grade, COUNT(*) as count FROM students GROUP BY grade')
+    }
+    total_behavior_types = cur.execute('SELECT COUNT(*) FROM behavior_types').fetchone()[0]
+
+    # 行为计数都取自每日汇总表（主键以day开头，按日期范围的查询走主键索引）
+    total_violations, total_excellent = category_counts(cur)
+    today_violations, today_excellent = category_counts(
+        cur, ' WHERE r.day = ?', (today.isoformat(),))
+    week_start = today - timedelta(days=today.weekday())
+    week_violations, week_excellent = category_counts(
+        cur, ' WHERE r.day BETWEEN ? AND ?', (week_start.isoformat(), today.isoformat()))
+
+    top_behavior_types = [
+        {'name': row['name'], 'category': row['category'], 'count': row['count']}
+        for row in cur.execute('''
+            SELECT bt.name, bt.category, SUM(r.count) as count
+            FROM behavior_daily_rollup r
+            JOIN behavior_types bt ON bt.id = r.behavior_type_id
+            GROUP BY r.behavior_type_id
+            HAVING count > 0
+            ORDER BY count DESC, bt.name
+            LIMIT ?
+        ''', (top_limit,))
+    ]
+
+    recent_behaviors = [
+        behavior_to_dict(row)
+        for row in cur.execute(BEHAVIOR_SELECT + ' ORDER BY b.date DESC, b.id DESC LIMIT ?', (recent_limit,))
+    ]
+
+    return {
+        'total_students': total_students,
+        'students_by_grade': students_by_grade,
+        'total_behavior_types': total_behavior_types,
+        'total_violations': total_violations,
+        'total_excellent': total_excellent,
+        'today': {'date': today.isoformat(), 'violations': today_violations, 'excellent': today_excellent},
+        'this_week': {'start_date': week_start.isoformat(), 'violations': week_violations, 'excellent': week_excellent},
+        'top_behavior_types': top_behavior_types,
+        'recent_behaviors': recent_behaviors,
+        'trend': compute_behavior_trends(cur, today - timedelta(days=trend_days - 1), today)
+    }
+
+@app.route('/api/dashboard')
+@jwt_required()
+def get_dashboard():
+    try:
+        try:
+            recent_limit = int(request.args.get('recent', DASHBOARD_RECENT_DEFAULT))
+            top_limit = int(request.args.get('top', DASHBOARD_TOP_TYPES_DEFAULT))
+            trend_days = int(request.args.get('days', DASHBOARD_TREND_DAYS_DEFAULT))
+        except ValueError:
+            return jsonify({'message': '无效的参数'}), 400
+        recent_limit = max(0, min(recent_limit, DASHBOARD_RECENT_MAX))
+        top_limit = max(0, min(top_limit, DASHBOARD_TOP_TYPES_MAX))
+        trend_days = max(1, min(trend_days, DASHBOARD_TREND_DAYS_MAX))
+
+        # 当天日期也是缓存键的一部分，跨天后今日/本周数据不会沿用旧结果
+        today = datetime.date.today()
+        result = stats_cache.get_or_compute(
+            'dashboard',
+            {'today': today.isoformat(), 'recent': recent_limit, 'top': top_limit, 'days': trend_days},
+            lambda: compute_dashboard(get_db().cursor(), today, recent_limit, top_limit, trend_days)
+        )
+        return jsonify(result)
+    except Exception as e:
+        print('获取首页概览失败:', str(e))
+        return jsonify({'message': '获取首页概览失败'}), 500
+
+# 增量同步配置
+CHANGE_FEED_LIMIT = int(os.environ.get('CHANGE_FEED_LIMIT', 1000))  # 每次最多返回的变更记录条数
+
+class ChangesExpired(Exception):
+    """请求的版本号早于已清理的变更日志"""
+
+def get_change_version(db):
+    row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def fetch_changed_rows(db, table, ids):
+    """按ID读取变更行的当前内容，字段与各列表接口一致"""
+    if table == 'students':
+        query = f'SELECT {parse_fields(None, STUDENT_FIELDS)}{STUDENT_FROM} WHERE s.id IN'
+        to_dict = dict
+    elif table == 'behaviors':
+        query = BEHAVIOR_SELECT + ' WHERE b.id IN'
+        to_dict = behavior_to_dict
+    else:
+        query = 'SELECT * FROM behavior_types WHERE id IN'
+        to_dict = dict
+    rows = {}
+    for i in range(0, len(ids), IMPORT_CHUNK_SIZE):
+        chunk = ids[i:i + IMPORT_CHUNK_SIZE]
+        for row in db.execute(f"{query} ({','.join('?' * len(chunk))})", chunk):
+            rows[row['id']] = to_dict(row)
+    return rows
+
+def compute_changes(db, since, limit=CHANGE_FEED_LIMIT):
+    """返回版本号 since 之后的变更：每行只出现一次，按首次和最后一次操作归为新增、修改或删除"""
+    floor = db.execute('SELECT MIN(version) - 1 FROM change_log').fetchone()[0]
+    if floor is None:
+        floor = get_change_version(db)
+    if since < floor:
+        raise ChangesExpired()
+
+    log = db.execute('''
+        SELECT version, table_name, row_id, operation
+        FROM change_log
+        WHERE version > ?
+        ORDER BY version
+        LIMIT ?
+    ''', (since, limit + 1)).fetchall()
+    has_more = len(log) > limit
+    log = log[:limit]
+    version = log[-1]['version'] if log else max(since, get_change_version(db))
+
+    operations = {}
+    for entry in log:
+        key = (entry['table_name'], entry['row_id'])
+        first, _ = operations.get(key, (entry['operation'], None))
+        operations[key] = (first, entry['operation'])
+
+    changes = {table: {'inserted': [], 'updated': [], 'deleted': []} for table in CHANGE_LOG_TABLES}
+    live = {table: [] for table in CHANGE_LOG_TABLES}
+    for (table, row_id), (first, last) in operations.items():
+        if last == 'delete':
+            # 在这段时间内新增又删除的行客户端从未见过，直接省略
+            if first != 'insert':
+                changes[table]['deleted'].append(row_id)
+        else:
+            live[table].append(row_id)
+
+    for table, ids in live.items():
+        rows = fetch_changed_rows(db, table, sorted(ids))
+        for row_id in sorted(ids):
+            first, _ = operations[(table, row_id)]
+            if row_id not in rows:
+                # 列表接口中不可见的行（如学生已删除的行为记录）按删除处理
+                if first != 'insert':
+                    changes[table]['deleted'].append(row_id)
+            elif first == 'insert':
+                changes[table]['inserted'].append(rows[row_id])
+            else:
+                changes[table]['updated'].append(rows[row_id])
+    for table_changes in changes.values():
+        table_changes['deleted'].sort()
+
+    return {'version': version, 'has_more': has_more, 'changes': changes}
+
+@app.route('/api/changes')
+@jwt_required()
+def get_changes():
+    try:
+        try:
+            since = int(request.args.get('since', 0))
+            limit = max(1, min(int(request.args.get('limit', CHANGE_FEED_LIMIT)), CHANGE_FEED_LIMIT))
+        except ValueError:
+            return jsonify({'message': '无效的参数'}), 400
+        return jsonify(compute_changes(get_db(), since, limit))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except ChangesExpired:
+        return jsonify({
+            'message': '变更记录已清理，请重新加载完整数据',
+            'version': get_change_version(get_db())
+        }), 410
+    except Exception as e:
+        print('获取变更记录失败:', str(e))
+        return jsonify({'message': '获取变更记录失败'}), 500
 
+# 开发服务器（单进程）；生产环境使用 gunicorn -c gunicorn.conf.py wsgi:app
 if __name__ == '__main__':
-    app.run(debug=True, port=5002, host='0.0.0.0') 
\ No newline at end of file
+    create_app().run(
+        debug=os.environ.get('FLASK_DEBUG') == '1',
+        port=int(os.environ.get('PORT', 5002)),
+        host=os.environ.get('HOST', '0.0.0.0')
+    ) 
\ No newline at end of file
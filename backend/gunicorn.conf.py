@@ -0,0 +1,37 @@
+"""gunicorn 配置：多进程 + 多线程运行后端，所有参数都可以通过环境变量调整
+
+    cd backend
+    JWT_SECRET_KEY=... gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5002')
+
+# SQLite同一时间只允许一个写入者，worker数不宜过多；每个worker的线程数不要超过 DB_POOL_SIZE。
+# app.py 也读取 WEB_THREADS，同时进行的密码哈希数比线程数少一，登录高峰时仍有线程处理其他接口
+workers = int(os.environ.get('WEB_WORKERS', min(multiprocessing.cpu_count() * 2, 8)))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+# 主进程导入应用并完成一次性初始化（迁移数据库、创建上传目录）后再fork出worker
+preload_app = True
+
+# 请求超时、优雅退出等待时间（秒）
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('KEEPALIVE', 5))
+
+# 处理一定数量的请求后重启worker以限制内存增长（默认不重启）；jitter避免所有worker同时重启
+max_requests = int(os.environ.get('MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.environ.get('ACCESS_LOG', '-')
+errorlog = os.environ.get('ERROR_LOG', '-')
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def worker_exit(server, worker):
+    # 已不再接收新请求：等待后台导入任务等完成后再退出
+    import app as backend
+    backend.shutdown_app()
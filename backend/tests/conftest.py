@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+# 导入 app 之前设置：降低密码哈希迭代次数加快登录（数据库由 app 夹具指向临时目录）
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret-key-for-the-pytest-suite')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as backend  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """每个测试使用一个新的数据库和上传目录"""
+    backend.DATABASE = str(tmp_path / 'database.sqlite')
+    backend._pool = None
+    backend._pool_pid = None
+    backend._initialized = False
+    backend.app.config['UPLOAD_FOLDER'] = str(tmp_path / 'uploads')
+    backend.app.config['TESTING'] = True
+    backend.stats_cache.clear()
+    backend.reference_cache.invalidate_types()
+    backend.token_blocklist = backend.TokenBlocklist()
+    backend.login_throttle = backend.LoginThrottle()
+    backend.create_app()
+    yield backend.app
+    if backend._pool is not None:
+        backend._pool.close_all()
+        backend._pool = None
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post('/api/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 200
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+@pytest.fixture
+def db(app):
+    """直接访问测试数据库的连接（与接口使用同一个连接池）"""
+    conn = backend.get_pool().acquire()
+    yield conn
+    backend.get_pool().release(conn)
@@ -0,0 +1,48 @@
+"""登录限流和令牌吊销：他人无法把用户锁定在外，退出登录后的令牌被拒绝"""
+import app as backend
+
+
+def attempt(client, password, ip='10.0.0.1'):
+    return client.post('/api/login', json={'username': 'admin', 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def login(client):
+    response = attempt(client, 'admin123')
+    assert response.status_code == 200
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+def test_throttled_username_still_logs_in_with_right_password(client):
+    limit = backend.login_throttle.max_failures_per_user
+    statuses = [attempt(client, 'wrong', ip='10.0.0.66').status_code for _ in range(limit + 1)]
+    assert statuses == [401] * (limit - 1) + [429, 429]
+
+    # 失败过的IP在窗口内不能继续尝试，其他IP的错误密码仍被拒绝
+    assert attempt(client, 'admin123', ip='10.0.0.66').status_code == 429
+    assert attempt(client, 'wrong', ip='10.0.0.2').status_code == 429
+
+    # 没有失败记录的IP输入正确密码可以登录，之后失败记录清零
+    assert attempt(client, 'admin123', ip='10.0.0.3').status_code == 200
+    assert attempt(client, 'wrong', ip='10.0.0.4').status_code == 401
+
+
+def test_token_rejected_after_logout(client):
+    headers = login(client)
+    other = login(client)
+    assert client.get('/api/verify-token', headers=headers).status_code == 200
+
+    assert client.post('/api/logout', headers=headers).status_code == 200
+
+    assert client.get('/api/verify-token', headers=headers).status_code == 401
+    assert client.get('/api/students', headers=headers).status_code == 401
+    assert client.get('/api/verify-token', headers=other).status_code == 200
+
+
+def test_logout_seen_by_other_workers_after_sync(client):
+    headers = login(client)
+    assert client.post('/api/logout', headers=headers).status_code == 200
+
+    # 其他worker进程的内存中没有这条吊销记录，到同步时间后从数据库读取
+    backend.token_blocklist = backend.TokenBlocklist()
+    assert client.get('/api/verify-token', headers=headers).status_code == 401
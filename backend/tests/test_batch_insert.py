@@ -0,0 +1,88 @@
+"""批量添加行为记录：有效记录一次性插入，返回的ID与逐条结果对应"""
+
+
+def test_batch_insert_reports_each_record(client, auth_headers, db):
+    records = [
+        {'student_id': 1, 'behavior_type': '迟到', 'description': '第一条', 'date': '2024-06-01'},
+        {'student_id': 999, 'behavior_type': '迟到', 'description': '学生不存在', 'date': '2024-06-01'},
+        {'student_id': 2, 'behavior_type': '不存在的类型', 'description': '类型不存在', 'date': '2024-06-01'},
+        {'student_id': 3, 'behavior_type': '获奖', 'description': '', 'date': '2024-06-01'},
+        {'student_id': 'abc', 'behavior_type': '获奖', 'description': 'ID无效', 'date': '2024-06-01'},
+        {'student_id': 2, 'behavior_type': '获奖', 'description': '第二条', 'date': '2024-06-02'},
+    ]
+
+    response = client.post('/api/behaviors/batch', headers=auth_headers, json={'records': records})
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['success_count'] == 2
+    assert result['error_count'] == 4
+    assert [r['success'] for r in result['results']] == [True, False, False, False, False, True]
+    assert result['results'][1]['message'] == '学生不存在'
+    assert result['results'][2]['message'] == '行为类型不存在'
+    for index in (0, 5):
+        row = db.execute('''
+            SELECT b.student_id, bt.name, b.description FROM behaviors b
+            JOIN behavior_types bt ON bt.id = b.behavior_type_id WHERE b.id = ?
+        ''', (result['results'][index]['id'],)).fetchone()
+        record = records[index]
+        assert tuple(row) == (record['student_id'], record['behavior_type'], record['description'])
+
+
+def test_batch_insert_for_many_students_updates_counts(client, auth_headers, db):
+    before = dict(db.execute("SELECT student_id, count FROM student_behavior_counts WHERE category = '违纪'"))
+
+    response = client.post('/api/behaviors/batch', headers=auth_headers, json={
+        'student_ids': [1, 2, 3], 'behavior_type': '迟到', 'description': '集体迟到', 'date': '2024-06-03'
+    })
+
+    assert response.status_code == 200
+    assert response.get_json()['success_count'] == 3
+    after = dict(db.execute("SELECT student_id, count FROM student_behavior_counts WHERE category = '违纪'"))
+    assert all(after[student_id] == before.get(student_id, 0) + 1 for student_id in (1, 2, 3))
+
+
+def test_batch_insert_rejects_oversized_batches(client, auth_headers):
+    records = [{'student_id': 1, 'behavior_type': '迟到', 'description': 'x', 'date': '2024-06-01'}] * 1001
+
+    response = client.post('/api/behaviors/batch', headers=auth_headers, json={'records': records})
+
+    assert response.status_code == 400
+
+
+def test_batch_insert_rejects_malformed_input(client, auth_headers, db):
+    before = db.execute('SELECT COUNT(*) FROM behaviors').fetchone()[0]
+
+    # 字符串会被逐字符当作学生ID
+    response = client.post('/api/behaviors/batch', headers=auth_headers, json={
+        'student_ids': '123', 'behavior_type': '迟到', 'description': 'x', 'date': '2024-06-01'
+    })
+    assert response.status_code == 400
+
+    response = client.post('/api/behaviors/batch', headers=auth_headers, json={'records': [
+        {'student_id': 1, 'behavior_type': ['迟到'], 'description': 'x', 'date': '2024-06-01'},
+        {'student_id': 1, 'behavior_type': {'name': '迟到'}, 'description': 'x', 'date': '2024-06-01'},
+        {'student_id': 1, 'behavior_type': '迟到', 'description': 'x', 'date': '2024-06-01'},
+    ]})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert [r['success'] for r in result['results']] == [False, False, True]
+    assert result['results'][0]['message'] == '无效的行为类型'
+    assert db.execute('SELECT COUNT(*) FROM behaviors').fetchone()[0] == before + 1
+
+
+def test_batch_insert_rejects_non_string_fields(client, auth_headers, db):
+    before = db.execute('SELECT COUNT(*) FROM behaviors').fetchone()[0]
+
+    response = client.post('/api/behaviors/batch', headers=auth_headers, json={'records': [
+        {'student_id': 1, 'behavior_type': '迟到', 'description': {'a': 1}, 'date': '2024-06-01'},
+        {'student_id': 1, 'behavior_type': '迟到', 'description': 'x', 'date': ['2024-06-01']},
+        {'student_id': 1, 'behavior_type': '迟到', 'description': 'x', 'date': '2024-06-01', 'image_url': {}},
+        {'student_id': 1, 'behavior_type': '迟到', 'description': 'x', 'date': '2024-06-01', 'image_url': None},
+    ]})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert [r['success'] for r in result['results']] == [False, False, False, True]
+    assert [r.get('message') for r in result['results'][:3]] == [
+        'description 必须是字符串', 'date 必须是字符串', 'image_url 必须是字符串']
+    assert db.execute('SELECT COUNT(*) FROM behaviors').fetchone()[0] == before + 1
@@ -0,0 +1,14 @@
+"""增量同步接口的变更记录"""
+
+
+def test_change_log_covers_dependent_rows(client, auth_headers, db):
+    version = client.get('/api/changes', headers=auth_headers, query_string={'since': 0}).get_json()['version']
+
+    db.execute("UPDATE students SET name = '新名字' WHERE id = 1")
+    db.commit()
+    changes = client.get('/api/changes', headers=auth_headers, query_string={'since': version}).get_json()
+
+    behaviors = changes['changes']['behaviors']['updated']
+    expected = {row[0] for row in db.execute('SELECT id FROM behaviors WHERE student_id = 1')}
+    assert expected and {row['id'] for row in behaviors} == expected
+    assert {row['student_name'] for row in behaviors} == {'新名字'}
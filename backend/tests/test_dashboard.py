@@ -0,0 +1,79 @@
+"""/api/dashboard 与直接从行为记录计算的结果对比（生成数据）"""
+import datetime
+import random
+from collections import Counter
+
+GRADES = ['高一', '高二', '高三']
+
+
+def generate_recent_data(db, seed, students=40, behaviors=400):
+    """生成最近45天内的行为记录（含今天），日期格式混用"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    type_ids = [row[0] for row in db.execute('SELECT id FROM behavior_types')]
+    db.executemany(
+        'INSERT INTO students (name, student_id, grade, class) VALUES (?, ?, ?, ?)',
+        [(f'学生{i}', f'D{seed}-{i:04d}', rng.choice(GRADES), '1班') for i in range(students)]
+    )
+    student_ids = [row[0] for row in db.execute('SELECT id FROM students')]
+    rows = []
+    for _ in range(behaviors):
+        day = today - datetime.timedelta(days=rng.randint(0, 45))
+        date = day.isoformat() if rng.random() < 0.5 else f'{day.isoformat()}T{rng.randint(0, 23):02d}:00:00'
+        rows.append((rng.choice(student_ids), rng.choice(type_ids), '生成数据', date))
+    db.executemany('INSERT INTO behaviors (student_id, behavior_type_id, description, date) VALUES (?, ?, ?, ?)', rows)
+    db.commit()
+
+
+def raw_behaviors(db):
+    return [dict(row) for row in db.execute('''
+        SELECT b.id, b.date, bt.name, bt.category FROM behaviors b
+        JOIN behavior_types bt ON bt.id = b.behavior_type_id
+    ''')]
+
+
+def split(behaviors):
+    violations = sum(1 for b in behaviors if b['category'] == '违纪')
+    return violations, len(behaviors) - violations
+
+
+def test_dashboard_matches_raw_records(client, auth_headers, db):
+    generate_recent_data(db, seed=11)
+    today = datetime.date.today()
+    week_start = today - datetime.timedelta(days=today.weekday())
+
+    response = client.get('/api/dashboard', headers=auth_headers, query_string={'recent': 5, 'top': 3, 'days': 30})
+
+    assert response.status_code == 200
+    result = response.get_json()
+    behaviors = raw_behaviors(db)
+    grades = Counter(row[0] for row in db.execute('SELECT grade FROM students'))
+    assert result['total_students'] == sum(grades.values())
+    assert result['students_by_grade'] == dict(grades)
+    assert result['total_behavior_types'] == db.execute('SELECT COUNT(*) FROM behavior_types').fetchone()[0]
+    assert (result['total_violations'], result['total_excellent']) == split(behaviors)
+
+    todays = [b for b in behaviors if b['date'][:10] == today.isoformat()]
+    assert result['today'] == dict(zip(('violations', 'excellent'), split(todays)), date=today.isoformat())
+    this_week = [b for b in behaviors if week_start.isoformat() <= b['date'][:10] <= today.isoformat()]
+    assert result['this_week'] == dict(zip(('violations', 'excellent'), split(this_week)),
+                                       start_date=week_start.isoformat())
+
+    counts = Counter(b['name'] for b in behaviors)
+    categories = {b['name']: b['category'] for b in behaviors}
+    top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:3]
+    assert result['top_behavior_types'] == [
+        {'name': name, 'category': categories[name], 'count': count} for name, count in top]
+
+    recent = sorted(behaviors, key=lambda b: (b['date'], b['id']), reverse=True)[:5]
+    assert [b['id'] for b in result['recent_behaviors']] == [b['id'] for b in recent]
+
+    days = [(today - datetime.timedelta(days=i)).isoformat() for i in range(29, -1, -1)]
+    assert result['trend']['dates'] == days
+    for i, day in enumerate(days):
+        expected = split([b for b in behaviors if b['date'][:10] == day])
+        assert (result['trend']['violations'][i], result['trend']['excellents'][i]) == expected
+
+
+def test_dashboard_rejects_invalid_parameters(client, auth_headers):
+    assert client.get('/api/dashboard', headers=auth_headers, query_string={'days': 'x'}).status_code == 400
@@ -0,0 +1,109 @@
+"""/api/behaviors/export 导出内容与行为记录逐行对比（生成数据）"""
+import csv
+import io
+import random
+
+import openpyxl
+import pytest
+
+import app as backend
+
+GRADES = ['高一', '高二', '高三']
+HEADER = ['记录ID', '学号', '姓名', '年级', '班级', '行为类型', '类别', '描述', '时间', '图片']
+
+
+def generate_data(db, seed, students=30, behaviors=300):
+    """描述中混入逗号、引号和换行，检验CSV转义；部分记录带图片"""
+    rng = random.Random(seed)
+    type_ids = [row[0] for row in db.execute('SELECT id FROM behavior_types')]
+    db.executemany(
+        'INSERT INTO students (name, student_id, grade, class) VALUES (?, ?, ?, ?)',
+        [(f'学生{i}', f'E{seed}-{i:04d}', rng.choice(GRADES), f'{rng.randint(1, 4)}班') for i in range(students)]
+    )
+    student_ids = [row[0] for row in db.execute('SELECT id FROM students')]
+    descriptions = ['生成数据', '迟到, 早退', '说"不"', '第一行\n第二行']
+    db.executemany(
+        'INSERT INTO behaviors (student_id, behavior_type_id, description, date, image_url) VALUES (?, ?, ?, ?, ?)',
+        [(rng.choice(student_ids), rng.choice(type_ids), rng.choice(descriptions),
+          f'2024-03-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00',
+          rng.choice([None, '/uploads/a.jpg']))
+         for _ in range(behaviors)]
+    )
+    db.commit()
+
+
+def expected_rows(db, grade=None, start_date=None, end_date=None):
+    """逐条取出记录在Python中筛选，按时间、ID排序"""
+    students = {row['id']: row for row in db.execute('SELECT * FROM students')}
+    types = {row['id']: row for row in db.execute('SELECT * FROM behavior_types')}
+    rows = []
+    for b in db.execute('SELECT * FROM behaviors'):
+        s, bt = students[b['student_id']], types[b['behavior_type_id']]
+        if grade and s['grade'] != grade:
+            continue
+        if start_date and b['date'][:10] < start_date[:10]:
+            continue
+        if end_date and b['date'][:10] > end_date[:10]:
+            continue
+        rows.append((b['id'], s['student_id'], s['name'], s['grade'], s['class'],
+                     bt['name'], bt['category'], b['description'], b['date'], b['image_url']))
+    return sorted(rows, key=lambda row: (row[8], row[0]))
+
+
+FILTERS = [
+    {},
+    {'grade': '高二'},
+    {'start_date': '2024-03-10', 'end_date': '2024-03-12'},
+    {'grade': '高三', 'end_date': '2024-03-15T00:00:00.000Z'},
+    {'start_date': '2025-01-01'},
+]
+
+
+@pytest.mark.parametrize('params', FILTERS)
+def test_csv_export_matches_records(client, auth_headers, db, params):
+    generate_data(db, seed=3)
+
+    response = client.get('/api/behaviors/export', headers=auth_headers,
+                          query_string={'format': 'csv', **params})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'attachment; filename="behaviors_' in response.headers['Content-Disposition']
+    assert response.data.startswith(b'\xef\xbb\xbf')
+    rows = list(csv.reader(io.StringIO(response.data.decode('utf-8-sig'), newline='')))
+    assert rows[0] == HEADER
+    expected = [['' if value is None else str(value) for value in row] for row in expected_rows(db, **params)]
+    assert rows[1:] == expected
+
+
+def test_csv_export_spans_batches(client, auth_headers, db, monkeypatch):
+    # 多个批次拼接后不能丢行或重复表头
+    monkeypatch.setattr(backend, 'EXPORT_BATCH_SIZE', 7)
+    generate_data(db, seed=4, behaviors=50)
+
+    response = client.get('/api/behaviors/export', headers=auth_headers, query_string={'format': 'csv'})
+
+    rows = list(csv.reader(io.StringIO(response.data.decode('utf-8-sig'), newline='')))
+    assert rows[0] == HEADER
+    assert [int(row[0]) for row in rows[1:]] == [row[0] for row in expected_rows(db)]
+
+
+@pytest.mark.parametrize('params', FILTERS[:3])
+def test_xlsx_export_matches_records(client, auth_headers, db, params):
+    generate_data(db, seed=5)
+
+    response = client.get('/api/behaviors/export', headers=auth_headers,
+                          query_string={'format': 'xlsx', **params})
+
+    assert response.status_code == 200
+    assert response.mimetype == backend.EXPORT_FORMATS['xlsx']
+    ws = openpyxl.load_workbook(io.BytesIO(response.data))['行为记录']
+    rows = list(ws.iter_rows(values_only=True))
+    assert list(rows[0]) == HEADER
+    assert rows[1:] == expected_rows(db, **params)
+
+
+def test_export_rejects_unknown_format(client, auth_headers):
+    response = client.get('/api/behaviors/export', headers=auth_headers, query_string={'format': 'pdf'})
+
+    assert response.status_code == 400
@@ -0,0 +1,117 @@
+"""学生导入：上传校验、逐行校验和分块插入，以及导入模板的缓存"""
+import io
+import os
+
+import openpyxl
+import pandas as pd
+
+import app as backend
+
+
+def post_import(client, auth_headers, data, filename):
+    return client.post('/api/students/import', headers=auth_headers,
+                       data={'file': (io.BytesIO(data), filename)})
+
+
+def test_import_rejects_non_spreadsheets_and_oversized_files(app, client, auth_headers, monkeypatch):
+    # 扩展名正确但内容不是xlsx/xls
+    assert post_import(client, auth_headers, b'name,student_id\n', 'students.xlsx').status_code == 415
+
+    monkeypatch.setitem(backend.UPLOAD_SIZE_LIMITS, 'import', 1024)
+    data = b'PK\x03\x04' + b'\x00' * 2048
+    assert post_import(client, auth_headers, data, 'students.xlsx').status_code == 413
+
+    # 被拒绝的文件不留在上传目录中
+    folder = app.config['UPLOAD_FOLDER']
+    assert not [name for name in os.listdir(folder) if name.startswith('import_')]
+    assert os.listdir(os.path.join(folder, '.tmp')) == []
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['学号', '姓名', '年级', '班级'])
+
+
+def student_ids(db):
+    return {row[0] for row in db.execute('SELECT student_id FROM students')}
+
+
+def test_import_frame_reports_invalid_and_duplicate_rows(db):
+    df = frame([
+        [1001.0, ' 赵一 ', '高一', '1班'],    # 第2行：数字学号去掉 .0，去除空白
+        [None, '钱二', '高一', '1班'],        # 第3行：缺学号
+        ['1003', '', '高一', None],          # 第4行：缺姓名
+        ['1001', '孙三', '高二', '2班'],      # 第5行：文件内重复
+        ['S001', '李四', '高二', '2班'],      # 第6行：数据库中已存在
+        ['1006', '周五', '高三', None],
+    ])
+
+    success_count, errors = backend.import_student_frame(db, df)
+    db.commit()
+
+    assert success_count == 2
+    assert errors == [
+        '第3行: 学号 不能为空',
+        '第4行: 姓名 不能为空',
+        '第5行: 学号 1001 在文件中重复',
+        '第6行: 学号 S001 已存在',
+    ]
+    row = db.execute("SELECT name, grade, class FROM students WHERE student_id = '1001'").fetchone()
+    assert tuple(row) == ('赵一', '高一', '1班')
+    assert {'1001', '1006'} <= student_ids(db)
+    assert '1003' not in student_ids(db)
+
+
+def test_import_frame_repeats_across_chunks(db):
+    seen_ids = set()
+    assert backend.import_student_frame(db, frame([['2001', '甲', '高一', '']]), seen_ids) == (1, [])
+    df = frame([['2001', '乙', '高一', ''], ['2002', '丙', '高一', '']])
+    df.index = [500, 501]
+    assert backend.import_student_frame(db, df, seen_ids) == (1, ['第502行: 学号 2001 在文件中重复'])
+    db.commit()
+    assert db.execute("SELECT name FROM students WHERE student_id = '2001'").fetchone()[0] == '甲'
+
+
+def test_failed_chunk_rolls_back_and_retries_row_by_row(db, monkeypatch):
+    monkeypatch.setattr(backend, 'IMPORT_CHUNK_SIZE', 2)
+    db.execute("""
+        CREATE TRIGGER reject_bad_student BEFORE INSERT ON students WHEN NEW.name = '坏数据'
+        BEGIN SELECT RAISE(ABORT, '不允许的姓名'); END
+    """)
+    db.commit()
+    df = frame([['3001', '一', '高一', ''], ['3002', '坏数据', '高一', ''],
+                ['3003', '三', '高一', ''], ['3004', '四', '高一', '']])
+
+    success_count, errors = backend.import_student_frame(db, df)
+    db.commit()
+
+    # 第一块整体失败后回滚到保存点逐行插入，只有出错的行被跳过；第二块正常批量插入
+    assert success_count == 3
+    assert errors == ['第3行: 不允许的姓名']
+    assert {'3001', '3003', '3004'} <= student_ids(db)
+    assert '3002' not in student_ids(db)
+    assert db.execute("SELECT COUNT(*) FROM students WHERE student_id = '3001'").fetchone()[0] == 1
+
+
+def test_template_served_from_cache_with_etag(client, auth_headers, monkeypatch):
+    builds = []
+    build_template = backend.build_template
+
+    def counted():
+        builds.append(1)
+        return build_template()
+
+    monkeypatch.setattr(backend, '_template_cache', None)
+    monkeypatch.setattr(backend, 'build_template', counted)
+
+    response = client.get('/api/students/template', headers=auth_headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    ws = openpyxl.load_workbook(io.BytesIO(response.data)).active
+    rows = [list(row) for row in ws.iter_rows(values_only=True)]
+    assert rows == [backend.TEMPLATE_HEADERS] + backend.TEMPLATE_EXAMPLE_DATA
+
+    # 再次下载不重新生成；带 If-None-Match 时返回304
+    again = client.get('/api/students/template', headers=auth_headers)
+    assert again.data == response.data and again.headers['ETag'] == etag
+    assert client.get('/api/students/template', headers={**auth_headers, 'If-None-Match': etag}).status_code == 304
+    assert len(builds) == 1
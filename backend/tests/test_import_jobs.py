@@ -0,0 +1,118 @@
+"""后台导入任务：状态流转、失败和取消，以及执行进程退出后的恢复"""
+import io
+import os
+import subprocess
+import sys
+import time
+
+import openpyxl
+
+import app as backend
+
+
+def workbook(rows, header=('学号', '姓名', '年级', '班级')):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def create_job(db, data):
+    path = backend.import_temp_path('.xlsx')
+    with open(path, 'wb') as f:
+        f.write(data)
+    job = backend.ImportJob('students.xlsx', path, 'admin')
+    job.insert(db)
+    db.commit()
+    return job
+
+
+def get_job(client, auth_headers, job_id):
+    response = client.get(f'/api/students/import/{job_id}', headers=auth_headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_job_moves_from_pending_through_running_to_completed(client, auth_headers, db, monkeypatch):
+    job = create_job(db, workbook([('4001', '甲', '高一', '1班'), ('S001', '重复', '高一', '1班'),
+                                        ('4002', '乙', '高二', None)]))
+    assert get_job(client, auth_headers, job.id)['status'] == 'pending'
+
+    # 处理分块时其他请求看到的状态
+    seen = []
+    read_chunks = backend.read_import_chunks
+
+    def observed(path, current):
+        for df in read_chunks(path, current):
+            seen.append(db.execute('SELECT status FROM import_jobs WHERE id = ?', (current.id,)).fetchone()[0])
+            yield df
+
+    monkeypatch.setattr(backend, 'read_import_chunks', observed)
+    backend.run_import_job(job)
+
+    assert seen == ['running']
+    result = get_job(client, auth_headers, job.id)
+    assert result['status'] == 'completed'
+    assert (result['total_rows'], result['rows_processed'], result['success_count']) == (3, 3, 2)
+    assert result['error_messages'] == ['第3行: 学号 S001 已存在']
+    assert result['finished_at'] is not None
+    names = dict(db.execute("SELECT student_id, name FROM students WHERE student_id IN ('4001', '4002')"))
+    assert names == {'4001': '甲', '4002': '乙'}
+    assert not os.path.exists(job.path)
+
+
+def test_uploaded_import_completes_in_background(client, auth_headers, db):
+    response = client.post('/api/students/import', headers=auth_headers, data={
+        'file': (io.BytesIO(workbook([('5001', '丙', '高一', '2班')])), 'students.xlsx')})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    deadline = time.monotonic() + 10
+    while (result := get_job(client, auth_headers, job_id))['status'] in ('pending', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert result['status'] == 'completed'
+    assert result['success_count'] == 1
+    assert db.execute("SELECT name FROM students WHERE student_id = '5001'").fetchone()[0] == '丙'
+
+
+def test_job_fails_on_missing_column_and_stops_when_cancelled(client, auth_headers, db):
+    job = create_job(db, workbook([('甲', '高一')], header=('姓名', '年级')))
+    backend.run_import_job(job)
+    result = get_job(client, auth_headers, job.id)
+    assert result['status'] == 'failed'
+    assert result['message'] == '解析Excel文件失败: 缺少必填字段: 学号'
+
+    job = create_job(db, workbook([('6001', '丁', '高一', '1班')]))
+    response = client.post(f'/api/students/import/{job.id}/cancel', headers=auth_headers)
+    assert response.status_code == 200
+    backend.run_import_job(job)
+    result = get_job(client, auth_headers, job.id)
+    assert result['status'] == 'cancelled'
+    assert result['success_count'] == 0
+    assert db.execute("SELECT COUNT(*) FROM students WHERE student_id = '6001'").fetchone()[0] == 0
+
+    # 已结束的任务不能再取消
+    response = client.post(f'/api/students/import/{job.id}/cancel', headers=auth_headers)
+    assert response.get_json()['status'] == 'cancelled'
+
+
+def test_job_of_exited_process_marked_failed(client, auth_headers, db):
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    db.execute('''
+        INSERT INTO import_jobs (id, filename, status, message, owner_pid, created_at)
+        VALUES ('orphan', 'students.xlsx', 'running', '正在导入', ?, ?)
+    ''', (process.pid, time.time()))
+    db.commit()
+
+    result = get_job(client, auth_headers, 'orphan')
+
+    assert result['status'] == 'failed'
+    assert result['message'] == '服务重启，导入已中断'
+    assert result['finished_at'] is not None
+    assert client.get('/api/students/import/missing', headers=auth_headers).status_code == 404
@@ -0,0 +1,77 @@
+"""列表接口的键集分页：逐页遍历得到的结果与不分页时一致，无重复、无遗漏"""
+import pytest
+
+import app as backend
+
+
+def collect_pages(client, headers, url, params):
+    items, cursor = [], None
+    while True:
+        query = dict(params)
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get(url, headers=headers, query_string=query)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['items']) <= query['limit']
+        items.extend(page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            return items
+
+
+@pytest.fixture
+def many_behaviors(db):
+    # 大量记录日期相同，检验按 (date, id) 排序时相同日期之间的翻页
+    type_id = db.execute('SELECT id FROM behavior_types LIMIT 1').fetchone()[0]
+    db.executemany('INSERT INTO behaviors (student_id, behavior_type_id, description, date) VALUES (?, ?, ?, ?)',
+                   [((i % 3) + 1, type_id, f'记录{i}', f'2024-04-{(i % 4) + 1:02d}') for i in range(137)])
+    db.commit()
+
+
+@pytest.mark.parametrize('sort', ['-date', 'date', 'id', '-id'])
+def test_behavior_pages_match_unpaginated_list(client, auth_headers, many_behaviors, sort):
+    full = client.get('/api/behaviors', headers=auth_headers, query_string={'sort': sort}).get_json()
+
+    paged = collect_pages(client, auth_headers, '/api/behaviors', {'sort': sort, 'limit': 10})
+
+    assert [row['id'] for row in paged] == [row['id'] for row in full]
+    assert len({row['id'] for row in paged}) == len(full) == 140
+
+
+def test_behavior_pages_with_filter(client, auth_headers, many_behaviors):
+    params = {'student_id': 2, 'sort': '-date'}
+    full = client.get('/api/behaviors', headers=auth_headers, query_string=params).get_json()
+
+    paged = collect_pages(client, auth_headers, '/api/behaviors', dict(params, limit=7))
+
+    assert [row['id'] for row in paged] == [row['id'] for row in full]
+    assert {row['student_id'] for row in paged} == {2}
+
+
+def test_student_pages_and_total(client, auth_headers, db):
+    db.executemany('INSERT INTO students (name, student_id, grade, class) VALUES (?, ?, ?, ?)',
+                   [(f'学生{i}', f'P{i:03d}', '高一', '1班') for i in range(45)])
+    db.commit()
+
+    paged = collect_pages(client, auth_headers, '/api/students', {'sort': 'name', 'limit': 8})
+    first = client.get('/api/students', headers=auth_headers,
+                       query_string={'limit': 8, 'include_total': 1}).get_json()
+
+    assert [row['name'] for row in paged] == sorted(row['name'] for row in paged)
+    assert len({row['id'] for row in paged}) == 48
+    assert first['total'] == 48
+
+
+def test_invalid_cursor_rejected(client, auth_headers):
+    response = client.get('/api/behaviors', headers=auth_headers, query_string={'limit': 5, 'cursor': 'not-a-cursor'})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('values', [[{'a': 1}, 5], ['2024-06-01', '5'], ['2024-06-01', None], [[1], 5]])
+def test_forged_cursor_rejected(client, auth_headers, values):
+    response = client.get('/api/behaviors', headers=auth_headers,
+                          query_string={'limit': 5, 'cursor': backend.encode_cursor(values)})
+
+    assert response.status_code == 400
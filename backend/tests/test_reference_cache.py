@@ -0,0 +1,44 @@
+"""行为记录写入校验：引用在写入语句中按数据库校验，学生和行为类型被其他进程删除后不能再写入"""
+
+
+def behavior(student_id=1, behavior_type='迟到'):
+    return {'student_id': student_id, 'behavior_type': behavior_type, 'description': '缓存', 'date': '2024-06-01'}
+
+
+def test_add_behavior_rechecks_deleted_references(client, auth_headers, db):
+    # 先写入成功，再删除引用后重试
+    assert client.post('/api/behaviors', headers=auth_headers, json=behavior()).status_code == 200
+    assert client.post('/api/behaviors', headers=auth_headers, json=behavior(2, '早退')).status_code == 200
+    before = db.execute('SELECT COUNT(*) FROM behaviors').fetchone()[0]
+
+    # 不经过接口直接删除（相当于其他worker进程）
+    db.execute('DELETE FROM students WHERE id = 1')
+    db.execute("DELETE FROM behavior_types WHERE name = '早退'")
+    db.commit()
+
+    response = client.post('/api/behaviors', headers=auth_headers, json=behavior())
+    assert response.status_code == 400
+    assert response.get_json()['message'] == '学生不存在'
+    response = client.post('/api/behaviors', headers=auth_headers, json=behavior(2, '早退'))
+    assert response.status_code == 400
+    assert response.get_json()['message'] == '行为类型不存在'
+    assert db.execute('SELECT COUNT(*) FROM behaviors').fetchone()[0] == before
+
+
+def test_update_behavior_rechecks_deleted_references(client, auth_headers, db):
+    behavior_id = client.post('/api/behaviors', headers=auth_headers, json=behavior(3)).get_json()['id']
+    assert client.put(f'/api/behaviors/{behavior_id}', headers=auth_headers, json=behavior(2)).status_code == 200
+
+    db.execute('DELETE FROM students WHERE id = 3')
+    db.commit()
+
+    response = client.put(f'/api/behaviors/{behavior_id}', headers=auth_headers, json=behavior(3))
+    assert response.status_code == 400
+    assert response.get_json()['message'] == '学生不存在'
+    assert db.execute('SELECT student_id FROM behaviors WHERE id = ?', (behavior_id,)).fetchone()[0] == 2
+
+
+def test_update_missing_behavior_returns_404(client, auth_headers):
+    response = client.put('/api/behaviors/999999', headers=auth_headers, json=behavior())
+    assert response.status_code == 404
+    assert response.get_json()['message'] == '行为记录不存在'
@@ -0,0 +1,88 @@
+"""列表接口的字段筛选（fields 参数）和响应压缩"""
+import gzip
+import json
+import random
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def many_records(db):
+    rng = random.Random(3)
+    type_ids = [row[0] for row in db.execute('SELECT id FROM behavior_types')]
+    db.executemany('INSERT INTO behaviors (student_id, behavior_type_id, description, date) VALUES (?, ?, ?, ?)',
+                   [(rng.randint(1, 3), rng.choice(type_ids), f'记录{i}', f'2024-04-{rng.randint(1, 28):02d}')
+                    for i in range(200)])
+    db.commit()
+
+
+def test_student_fields_projection_matches_db(client, auth_headers, db, many_records):
+    response = client.get('/api/students', headers=auth_headers, query_string={'fields': 'name,violation_count'})
+
+    assert response.status_code == 200
+    students = response.get_json()
+    # 游标需要的 id 总是返回，其他字段按请求筛选
+    assert all(set(student) == {'id', 'name', 'violation_count'} for student in students)
+    expected = {row['id']: (row['name'], row['violations']) for row in db.execute('''
+        SELECT s.id, s.name, COUNT(bt.id) as violations FROM students s
+        LEFT JOIN behaviors b ON b.student_id = s.id
+        LEFT JOIN behavior_types bt ON bt.id = b.behavior_type_id AND bt.category = '违纪'
+        GROUP BY s.id
+    ''')}
+    assert {s['id']: (s['name'], s['violation_count']) for s in students} == expected
+
+
+def test_behavior_fields_projection_matches_db(client, auth_headers, db, many_records):
+    response = client.get('/api/behaviors', headers=auth_headers,
+                          query_string={'fields': 'behavior_type,student_name', 'limit': 500})
+
+    assert response.status_code == 200
+    items = response.get_json()['items']
+    # 默认按 -date 排序，date 也作为游标字段返回
+    assert all(set(item) == {'id', 'date', 'behavior_type', 'student_name'} for item in items)
+    expected = {row['id']: dict(row) for row in db.execute('''
+        SELECT b.id, b.date, bt.name as behavior_type, s.name as student_name FROM behaviors b
+        JOIN students s ON s.id = b.student_id JOIN behavior_types bt ON bt.id = b.behavior_type_id
+    ''')}
+    assert {item['id']: item for item in items} == expected
+
+
+def test_unknown_field_rejected(client, auth_headers):
+    response = client.get('/api/students', headers=auth_headers, query_string={'fields': 'name,password'})
+
+    assert response.status_code == 400
+
+
+def test_large_responses_compressed_by_accept_encoding(client, auth_headers, many_records, monkeypatch):
+    plain = client.get('/api/behaviors', headers=auth_headers)
+    assert 'Content-Encoding' not in plain.headers
+    # 紧凑编码：没有缩进和分隔符后的空格
+    assert b'\n' not in plain.data.rstrip() and b'", "' not in plain.data
+
+    compressed = client.get('/api/behaviors', headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+    # 未安装brotli时 br 不可用，回退到gzip
+    monkeypatch.setattr(backend, 'brotli', None)
+    fallback = client.get('/api/behaviors', headers={**auth_headers, 'Accept-Encoding': 'br, gzip'})
+    assert fallback.headers['Content-Encoding'] == 'gzip'
+
+    # 小响应不压缩
+    small = client.get('/api/test', headers={'Accept-Encoding': 'gzip'})
+    assert len(small.data) < backend.COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_brotli_preferred_when_available(client, auth_headers, many_records):
+    brotli = pytest.importorskip('brotli')
+    plain = client.get('/api/behaviors', headers=auth_headers)
+
+    response = client.get('/api/behaviors', headers={**auth_headers, 'Accept-Encoding': 'gzip, br'})
+
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.data)) == plain.get_json()
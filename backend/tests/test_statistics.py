@@ -0,0 +1,192 @@
+"""/api/statistics 与改写前逐行在Python中统计的实现对比（生成数据）"""
+import datetime
+import random
+
+import pytest
+
+GRADES = ['高一', '高二', '高三']
+
+
+def legacy_statistics(db, grade=None, start_date=None, end_date=None):
+    """改写前的统计实现：取出全部匹配的行为记录后在Python中统计
+
+    日期筛选与现在的接口一致，按天比较（含首尾两天）；日期取前10个字符，
+    旧代码的 split('T') 会把 'YYYY-MM-DD HH:MM:SS' 格式（默认的 CURRENT_TIMESTAMP）整个当作日期。
+    """
+    query = '''
+        SELECT b.*, s.grade, bt.name as behavior_type, bt.category
+        FROM behaviors b
+        JOIN students s ON b.student_id = s.id
+        JOIN behavior_types bt ON b.behavior_type_id = bt.id
+    '''
+    behaviors = [dict(row) for row in db.execute(query)]
+    if grade:
+        behaviors = [b for b in behaviors if b['grade'] == grade]
+    if start_date:
+        behaviors = [b for b in behaviors if b['date'][:10] >= start_date[:10]]
+    if end_date:
+        behaviors = [b for b in behaviors if b['date'][:10] <= end_date[:10]]
+
+    violation_behaviors = [b for b in behaviors if b['category'] == '违纪']
+    excellent_behaviors = [b for b in behaviors if b['category'] == '优秀']
+
+    behavior_type_count = {}
+    for behavior in behaviors:
+        behavior_type_count[behavior['behavior_type']] = behavior_type_count.get(behavior['behavior_type'], 0) + 1
+
+    date_stats = {}
+    for behavior in behaviors:
+        date = behavior['date'][:10]
+        stats = date_stats.setdefault(date, {'violations': 0, 'excellent': 0})
+        if behavior['category'] == '违纪':
+            stats['violations'] += 1
+        else:
+            stats['excellent'] += 1
+
+    return {
+        'total_violations': len(violation_behaviors),
+        'total_excellent': len(excellent_behaviors),
+        'violation_students': len({b['student_id'] for b in violation_behaviors}),
+        'excellent_students': len({b['student_id'] for b in excellent_behaviors}),
+        'behavior_type_distribution': [
+            {'name': name, 'value': count} for name, count in behavior_type_count.items()
+        ],
+        'grade_violations': [len([b for b in violation_behaviors if b['grade'] == g]) for g in GRADES],
+        'grade_excellent': [len([b for b in excellent_behaviors if b['grade'] == g]) for g in GRADES],
+        'time_trend': {
+            'violations': [[date, date_stats[date]['violations']] for date in sorted(date_stats)],
+            'excellent': [[date, date_stats[date]['excellent']] for date in sorted(date_stats)]
+        }
+    }
+
+
+def normalize(result):
+    # 新实现按数量倒序返回行为类型分布，旧实现无固定顺序
+    result = dict(result)
+    result['behavior_type_distribution'] = sorted(
+        result['behavior_type_distribution'], key=lambda item: item['name'])
+    return result
+
+
+def generate_data(db, seed, students=60, behaviors=1500):
+    rng = random.Random(seed)
+    type_ids = [row[0] for row in db.execute('SELECT id FROM behavior_types')]
+    db.executemany(
+        'INSERT INTO students (name, student_id, grade, class) VALUES (?, ?, ?, ?)',
+        [(f'学生{i}', f'G{seed}-{i:04d}', rng.choice(GRADES), f'{rng.randint(1, 4)}班') for i in range(students)]
+    )
+    student_ids = [row[0] for row in db.execute('SELECT id FROM students')]
+    db.executemany(
+        'INSERT INTO behaviors (student_id, behavior_type_id, description, date) VALUES (?, ?, ?, ?)',
+        [(rng.choice(student_ids), rng.choice(type_ids), '生成数据',
+          f'2024-03-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00')
+         for _ in range(behaviors)]
+    )
+    db.commit()
+
+    # 修改和删除部分数据，汇总表由触发器维护，也一并检验
+    behavior_ids = [row[0] for row in db.execute('SELECT id FROM behaviors')]
+    for behavior_id in rng.sample(behavior_ids, 100):
+        db.execute('UPDATE behaviors SET behavior_type_id = ?, date = ? WHERE id = ?',
+                   (rng.choice(type_ids), f'2024-03-{rng.randint(1, 28):02d}T08:00:00', behavior_id))
+    for behavior_id in rng.sample(behavior_ids, 100):
+        db.execute('DELETE FROM behaviors WHERE id = ?', (behavior_id,))
+    for student_id in rng.sample(student_ids, 5):
+        db.execute('UPDATE students SET grade = ? WHERE id = ?', (rng.choice(GRADES), student_id))
+    db.commit()
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'grade': '高一'},
+    {'grade': '高三', 'start_date': '2024-03-05'},
+    {'start_date': '2024-03-10', 'end_date': '2024-03-12'},
+    {'end_date': '2024-03-12T00:00:00.000Z'},
+    {'grade': '高二', 'start_date': '2024-03-20', 'end_date': '2024-03-20'},
+    {'start_date': '2025-01-01'},
+])
+def test_statistics_match_legacy_implementation(client, auth_headers, db, params):
+    generate_data(db, seed=5)
+
+    response = client.get('/api/statistics', headers=auth_headers, query_string=params)
+
+    assert response.status_code == 200
+    assert normalize(response.get_json()) == normalize(legacy_statistics(db, **params))
+
+
+def test_statistics_cache_invalidated_by_writes(client, auth_headers, db):
+    generate_data(db, seed=7, behaviors=200)
+    before = client.get('/api/statistics', headers=auth_headers).get_json()
+
+    # 不经过接口直接写入（相当于其他worker进程），缓存的结果也必须失效
+    db.execute('DELETE FROM behaviors WHERE id IN (SELECT id FROM behaviors LIMIT 10)')
+    db.commit()
+    after = client.get('/api/statistics', headers=auth_headers).get_json()
+
+    assert after != before
+    assert normalize(after) == normalize(legacy_statistics(db))
+
+
+def expected_trends(db, start, end, bucket_of, grade=None):
+    """逐条记录按分桶计数，范围内没有记录的分桶补零"""
+    query = '''
+        SELECT b.date, s.grade, bt.category FROM behaviors b
+        JOIN students s ON b.student_id = s.id
+        JOIN behavior_types bt ON b.behavior_type_id = bt.id
+    '''
+    dates = []
+    day = start
+    while day <= end:
+        if bucket_of(day) not in dates:
+            dates.append(bucket_of(day))
+        day += datetime.timedelta(days=1)
+    violations, excellents = [0] * len(dates), [0] * len(dates)
+    for row in db.execute(query):
+        day = datetime.date.fromisoformat(row['date'][:10])
+        if not start <= day <= end or (grade and row['grade'] != grade):
+            continue
+        counts = violations if row['category'] == '违纪' else excellents
+        counts[dates.index(bucket_of(day))] += 1
+    return {'dates': dates, 'violations': violations, 'excellents': excellents}
+
+
+@pytest.mark.parametrize('bucket, bucket_of', [
+    ('day', lambda d: d.isoformat()),
+    ('week', lambda d: (d - datetime.timedelta(days=d.weekday())).isoformat()),
+    ('month', lambda d: d.strftime('%Y-%m')),
+])
+@pytest.mark.parametrize('grade', [None, '高二'])
+def test_behavior_trends_buckets_match_records(client, auth_headers, db, bucket, bucket_of, grade):
+    generate_data(db, seed=9, behaviors=600)
+    start, end = datetime.date(2024, 2, 20), datetime.date(2024, 3, 17)
+    params = {'start_date': start.isoformat(), 'end_date': end.isoformat(), 'bucket': bucket}
+    if grade:
+        params['grade'] = grade
+
+    response = client.get('/api/statistics/behavior-trends', headers=auth_headers, query_string=params)
+
+    assert response.status_code == 200
+    assert response.get_json() == expected_trends(db, start, end, bucket_of, grade)
+
+
+def test_behavior_trends_series_sum_to_totals(client, auth_headers, db):
+    generate_data(db, seed=10, behaviors=300)
+    result = client.get('/api/statistics/behavior-trends', headers=auth_headers, query_string={
+        'start_date': '2024-03-01', 'end_date': '2024-03-31', 'bucket': 'week', 'series': 'grade'}).get_json()
+
+    assert [series['name'] for series in result['series']] == sorted(GRADES)
+    for key in ('violations', 'excellents'):
+        assert [sum(values) for values in zip(*(series[key] for series in result['series']))] == result[key]
+
+
+@pytest.mark.parametrize('params', [
+    {'start_date': '2014-01-01', 'end_date': '2024-12-31'},  # 超过 MAX_TREND_DAYS
+    {'start_date': '2024-03-10', 'end_date': '2024-03-01'},
+    {'start_date': 'not-a-date'},
+    {'bucket': 'year'},
+    {'series': 'student'},
+])
+def test_behavior_trends_rejects_invalid_ranges(client, auth_headers, params):
+    response = client.get('/api/statistics/behavior-trends', headers=auth_headers, query_string=params)
+
+    assert response.status_code == 400
@@ -0,0 +1,62 @@
+"""触发器维护的汇总表（学生行为计数、每日汇总）与重新计算的结果一致"""
+import random
+
+import app as backend
+
+GRADES = ['高一', '高二', '高三']
+
+
+def snapshot(db, table, order_by):
+    # 触发器在计数减为0时保留行，重建时不会生成，比较时忽略
+    return [tuple(row) for row in db.execute(f'SELECT * FROM {table} WHERE count > 0 ORDER BY {order_by}')]
+
+
+def summary_snapshots(db):
+    return {
+        'student_behavior_counts': snapshot(db, 'student_behavior_counts', 'student_id, category'),
+        'behavior_daily_rollup': snapshot(db, 'behavior_daily_rollup', 'day, grade, class, behavior_type_id'),
+        'behavior_daily_students': snapshot(db, 'behavior_daily_students', 'day, category, grade, class, student_id'),
+    }
+
+
+def random_writes(db, rng, steps):
+    type_ids = [row[0] for row in db.execute('SELECT id FROM behavior_types')]
+    for step in range(steps):
+        student_ids = [row[0] for row in db.execute('SELECT id FROM students')]
+        behavior_ids = [row[0] for row in db.execute('SELECT id FROM behaviors')]
+        action = rng.random()
+        if action < 0.45 or not behavior_ids:
+            db.execute('INSERT INTO behaviors (student_id, behavior_type_id, description, date) VALUES (?, ?, ?, ?)',
+                       (rng.choice(student_ids), rng.choice(type_ids), '随机',
+                        f'2024-05-{rng.randint(1, 5):02d}T10:00:00'))
+        elif action < 0.65:
+            db.execute('UPDATE behaviors SET student_id = ?, behavior_type_id = ?, date = ? WHERE id = ?',
+                       (rng.choice(student_ids), rng.choice(type_ids),
+                        f'2024-05-{rng.randint(1, 5):02d} 08:00:00', rng.choice(behavior_ids)))
+        elif action < 0.8:
+            db.execute('DELETE FROM behaviors WHERE id = ?', (rng.choice(behavior_ids),))
+        elif action < 0.9:
+            db.execute('UPDATE students SET grade = ?, class = ? WHERE id = ?',
+                       (rng.choice(GRADES), f'{rng.randint(1, 3)}班', rng.choice(student_ids)))
+        else:
+            db.execute('UPDATE behavior_types SET category = ? WHERE id = ?',
+                       (rng.choice(['违纪', '优秀']), rng.choice(type_ids)))
+        if step % 10 == 0:
+            db.commit()
+    db.commit()
+
+
+def test_summary_tables_match_rebuild_after_random_writes(db):
+    rng = random.Random(14)
+    db.executemany('INSERT INTO students (name, student_id, grade, class) VALUES (?, ?, ?, ?)',
+                   [(f'学生{i}', f'T{i:03d}', rng.choice(GRADES), '1班') for i in range(12)])
+    db.commit()
+    random_writes(db, rng, 400)
+
+    maintained = summary_snapshots(db)
+    cur = db.cursor()
+    backend.rebuild_student_behavior_counts(cur)
+    backend.rebuild_behavior_daily_rollup(cur)
+    db.commit()
+
+    assert maintained == summary_snapshots(db)
@@ -0,0 +1,111 @@
+"""分块上传会话：乱序和重复分块、缺块时完成、取消，与数据库中的会话和上传记录对比"""
+import hashlib
+import os
+
+import pytest
+
+import app as backend
+
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00' + bytes(range(256)) * 2
+CHUNK = 100
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(backend, 'UPLOAD_MIN_CHUNK_SIZE', CHUNK)
+
+
+def create_session(client, auth_headers, data, kind='image', filename='photo.jpg'):
+    response = client.post('/api/uploads/sessions', headers=auth_headers, json={
+        'kind': kind, 'filename': filename, 'size': len(data), 'chunk_size': CHUNK})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def put_chunk(client, auth_headers, upload_id, index, body):
+    return client.put(f'/api/uploads/sessions/{upload_id}/chunks/{index}', headers=auth_headers, data=body)
+
+
+def chunk(data, index):
+    return data[index * CHUNK:(index + 1) * CHUNK]
+
+
+def received_in_db(db, upload_id):
+    return [row[0] for row in db.execute(
+        'SELECT chunk_index FROM upload_session_chunks WHERE session_id = ? ORDER BY chunk_index', (upload_id,))]
+
+
+def test_out_of_order_and_repeated_chunks_assemble_the_file(client, auth_headers, db, small_chunks):
+    session = create_session(client, auth_headers, JPEG)
+    upload_id, total = session['upload_id'], session['total_chunks']
+    assert total == -(-len(JPEG) // CHUNK)
+    assert session['received_chunks'] == [] and session['next_chunk'] == 0
+
+    for index in [3, 1, 3, 0, 1]:
+        response = put_chunk(client, auth_headers, upload_id, index, chunk(JPEG, index))
+        assert response.status_code == 200
+    status = client.get(f'/api/uploads/sessions/{upload_id}', headers=auth_headers).get_json()
+    assert status['received_chunks'] == received_in_db(db, upload_id) == [0, 1, 3]
+    assert status['next_chunk'] == 2
+
+    # 缺少分块时不能完成，会话保留，返回客户端续传所需的状态
+    response = client.post(f'/api/uploads/sessions/{upload_id}/complete', headers=auth_headers)
+    assert response.status_code == 409
+    assert response.get_json()['next_chunk'] == 2
+    assert db.execute('SELECT COUNT(*) FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()[0] == 1
+
+    for index in range(total - 1, 1, -1):
+        assert put_chunk(client, auth_headers, upload_id, index, chunk(JPEG, index)).status_code == 200
+    response = client.post(f'/api/uploads/sessions/{upload_id}/complete', headers=auth_headers)
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['deduplicated'] is False
+    name = result['url'].rsplit('/', 1)[1]
+    row = db.execute('SELECT hash, size, mimetype, name FROM uploads WHERE name = ?', (name,)).fetchone()
+    assert tuple(row) == (hashlib.sha256(JPEG).hexdigest(), len(JPEG), 'image/jpeg', name)
+    served = client.get(result['url'])
+    assert served.status_code == 200 and served.data == JPEG
+    # 会话和临时文件已清理，不能再次完成
+    assert db.execute('SELECT COUNT(*) FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()[0] == 0
+    assert received_in_db(db, upload_id) == []
+    assert not os.path.exists(backend.upload_session_path(upload_id))
+    response = client.post(f'/api/uploads/sessions/{upload_id}/complete', headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_chunks_with_wrong_size_or_content_are_not_recorded(client, auth_headers, db, small_chunks):
+    session = create_session(client, auth_headers, JPEG)
+    upload_id = session['upload_id']
+
+    assert put_chunk(client, auth_headers, upload_id, 1, chunk(JPEG, 1)[:-1]).status_code == 400
+    assert put_chunk(client, auth_headers, upload_id, 0, b'%PDF-1.4' + chunk(JPEG, 0)[8:]).status_code == 415
+    assert put_chunk(client, auth_headers, upload_id, session['total_chunks'], b'x').status_code == 400
+
+    assert received_in_db(db, upload_id) == []
+
+
+def test_sessions_reject_oversized_or_unknown_uploads(client, auth_headers):
+    response = client.post('/api/uploads/sessions', headers=auth_headers, json={
+        'kind': 'image', 'filename': 'big.jpg', 'size': backend.UPLOAD_SIZE_LIMITS['image'] + 1})
+    assert response.status_code == 413
+    response = client.post('/api/uploads/sessions', headers=auth_headers, json={
+        'kind': 'video', 'filename': 'a.mp4', 'size': 10})
+    assert response.status_code == 400
+
+
+def test_cancel_removes_session_and_temp_file(client, auth_headers, db, small_chunks):
+    session = create_session(client, auth_headers, JPEG)
+    upload_id = session['upload_id']
+    assert put_chunk(client, auth_headers, upload_id, 0, chunk(JPEG, 0)).status_code == 200
+    assert os.path.exists(backend.upload_session_path(upload_id))
+
+    response = client.delete(f'/api/uploads/sessions/{upload_id}', headers=auth_headers)
+
+    assert response.status_code == 200
+    assert db.execute('SELECT COUNT(*) FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()[0] == 0
+    assert received_in_db(db, upload_id) == []
+    assert not os.path.exists(backend.upload_session_path(upload_id))
+    assert client.get(f'/api/uploads/sessions/{upload_id}', headers=auth_headers).status_code == 404
+    assert put_chunk(client, auth_headers, upload_id, 1, chunk(JPEG, 1)).status_code == 404
+    assert client.delete(f'/api/uploads/sessions/{upload_id}', headers=auth_headers).status_code == 404
@@ -0,0 +1,126 @@
+"""按内容存储的上传文件：类型和大小校验、引用计数、扩展名与发送时的Content-Type"""
+import hashlib
+import io
+import os
+
+import pytest
+
+import app as backend
+
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00' + b'\x00' * 64
+
+
+def upload(client, auth_headers, data, filename, content_type='application/octet-stream'):
+    response = client.post('/api/upload', headers=auth_headers,
+                           data={'file': (io.BytesIO(data), filename, content_type)})
+    assert response.status_code == 200
+    return response.get_json()['url']
+
+
+def test_upload_ref_counts_follow_references(client, auth_headers, db):
+    db.executemany('INSERT INTO uploads (hash, name, path, size, mimetype) VALUES (?, ?, ?, 1, ?)',
+                   [(name[0] * 64, name, name, 'image/png') for name in ('a.png', 'b.png')])
+    db.commit()
+
+    response = client.post('/api/behaviors', headers=auth_headers, json={
+        'student_id': 1, 'behavior_type': '迟到', 'description': '图片', 'date': '2024-05-01',
+        'image_url': '/api/uploads/a.png'
+    })
+    assert response.status_code in (200, 201)
+    db.execute("UPDATE students SET photo_url = '/api/uploads/a.png' WHERE id = 2")
+    db.execute("UPDATE students SET photo_url = 'http://localhost/api/uploads/b.png' WHERE id = 3")
+    db.commit()
+    counts = dict(db.execute('SELECT name, ref_count FROM uploads'))
+    assert counts == {'a.png': 2, 'b.png': 1}
+
+    db.execute("UPDATE students SET photo_url = NULL WHERE id IN (2, 3)")
+    db.commit()
+    assert dict(db.execute('SELECT name, ref_count FROM uploads')) == {'a.png': 1, 'b.png': 0}
+
+    backend.rebuild_upload_ref_counts(db.cursor())
+    db.commit()
+    assert dict(db.execute('SELECT name, ref_count FROM uploads')) == {'a.png': 1, 'b.png': 0}
+
+
+def test_non_ascii_image_name_keeps_extension(client, auth_headers):
+    # secure_filename('照片.jpg') == 'jpg'：扩展名按文件头判断，不受文件名影响
+    url = upload(client, auth_headers, JPEG, '照片.jpg')
+    assert url == f'/api/uploads/{hashlib.sha256(JPEG).hexdigest()}.jpg'
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert response.data == JPEG
+
+
+def test_upload_rejects_non_images_and_oversized_files(client, auth_headers, db, monkeypatch):
+    # 与分块上传相同：按文件头判断类型，图片大小受 UPLOAD_SIZE_LIMITS 限制
+    for data, filename in [(b'%PDF-1.4 test', '学生名单.PDF'), (b'<svg onload="alert(1)"/>', 'a.jpg'), (b'\xff', 'a.jpg')]:
+        response = client.post('/api/upload', headers=auth_headers,
+                               data={'file': (io.BytesIO(data), filename, 'image/jpeg')})
+        assert response.status_code == 415
+
+    monkeypatch.setitem(backend.UPLOAD_SIZE_LIMITS, 'image', len(JPEG) - 1)
+    response = client.post('/api/upload', headers=auth_headers,
+                           data={'file': (io.BytesIO(JPEG), 'big.jpg', 'image/jpeg')})
+    assert response.status_code == 413
+    assert db.execute('SELECT COUNT(*) FROM uploads').fetchone()[0] == 0
+
+
+
+def test_undecodable_image_is_not_resubmitted(app):
+    # 无法解码的图片只尝试一次：写入失败标记后不再提交到进程池
+    pytest.importorskip('PIL')
+    name = hashlib.sha256(JPEG).hexdigest() + '.jpg'
+    source = os.path.join(app.config['UPLOAD_FOLDER'], backend.upload_path(name))
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    with open(source, 'wb') as f:
+        f.write(JPEG)
+    target = os.path.join(app.config['UPLOAD_FOLDER'], backend.derivative_path(name, 'thumb'))
+
+    assert backend.generate_derivative(source, target, backend.DERIVATIVE_SIZES['thumb']) is False
+    assert os.path.exists(target + backend.DERIVATIVE_FAILED_SUFFIX)
+    assert backend.submit_derivatives(name, ('thumb',)) == {}
+
+
+def test_reupload_after_gc_and_missing_file_restored(app, client, auth_headers, db):
+    url = upload(client, auth_headers, JPEG, 'a.jpg')
+    name = url.rsplit('/', 1)[1]
+    path = os.path.join(app.config['UPLOAD_FOLDER'], backend.upload_path(name))
+
+    # 没有引用的文件被清理后，再次上传相同内容重新写入
+    assert backend.collect_orphan_uploads(db, grace=0) == (1, len(JPEG))
+    assert not os.path.exists(path)
+    assert upload(client, auth_headers, JPEG, 'a.jpg') == url
+    assert client.get(url).data == JPEG
+
+    # 记录还在而文件已删除时，重复上传恢复文件
+    os.remove(path)
+    response = client.post('/api/upload', headers=auth_headers,
+                           data={'file': (io.BytesIO(JPEG), 'a.jpg', 'image/jpeg')})
+    assert response.get_json() == {'url': url, 'deduplicated': True}
+    assert client.get(url).data == JPEG
+
+
+def test_thumbnail_generated_and_served(app, client, auth_headers):
+    Image = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 320), (200, 30, 30)).save(buffer, 'JPEG')
+    url = upload(client, auth_headers, buffer.getvalue(), 'photo.jpg')
+    name = url.rsplit('/', 1)[1]
+
+    response = client.get(url, query_string={'size': 'thumb'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    with Image.open(io.BytesIO(response.data)) as thumb:
+        assert thumb.size == (160, 80)
+    target = os.path.join(app.config['UPLOAD_FOLDER'], backend.derivative_path(name, 'thumb'))
+    with open(target, 'rb') as f:
+        assert f.read() == response.data
+
+    # 之后的请求直接发送已生成的缩略图，支持条件请求
+    etag = response.headers['ETag']
+    again = client.get(url, query_string={'size': 'thumb'})
+    assert again.data == response.data and again.headers['ETag'] == etag
+    assert 'immutable' in again.headers['Cache-Control']
+    assert client.get(url, query_string={'size': 'thumb'}, headers={'If-None-Match': etag}).status_code == 304
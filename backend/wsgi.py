@@ -0,0 +1,20 @@
+"""生产环境的WSGI入口
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+在nginx等反向代理之后运行时，把 TRUSTED_PROXIES 设置为代理的层数，
+客户端IP（登录限流使用）、协议和主机名从 X-Forwarded-* 请求头中读取。
+只有代理会覆盖这些请求头时才能设置，否则客户端可以伪造IP。
+"""
+import os
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from app import create_app
+
+app = create_app()
+
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES,
+                            x_host=TRUSTED_PROXIES)
@@ -0,0 +1,40 @@
+import axios from 'axios'
+
+// 从版本号 since 开始拉取全部增量变更（分页直到 has_more 为 false）
+// 变更日志已被清理时返回 null，调用方需要重新加载完整列表
+export const fetchChanges = async (since) => {
+  const merged = {}
+  let version = since
+  try {
+    while (true) {
+      const { data } = await axios.get('/api/changes', { params: { since: version } })
+      for (const [table, changes] of Object.entries(data.changes)) {
+        const target = merged[table] || (merged[table] = { inserted: [], updated: [], deleted: [] })
+        target.inserted.push(...changes.inserted)
+        target.updated.push(...changes.updated)
+        target.deleted.push(...changes.deleted)
+      }
+      version = data.version
+      if (!data.has_more) break
+    }
+  } catch (error) {
+    if (error.response?.status === 410) return null
+    throw error
+  }
+  return { version, changes: merged }
+}
+
+// 把一张表的增量变更合并到本地列表，新增的记录放在最前面
+export const applyChanges = (list, changes) => {
+  if (!changes) return list
+  const deleted = new Set(changes.deleted)
+  const replaced = new Map([...changes.updated, ...changes.inserted].map(row => [row.id, row]))
+  const result = list
+    .filter(row => !deleted.has(row.id))
+    .map(row => {
+      const updated = replaced.get(row.id)
+      if (updated) replaced.delete(row.id)
+      return updated || row
+    })
+  return [...replaced.values()].reverse().concat(result)
+}
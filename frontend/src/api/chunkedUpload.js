@@ -0,0 +1,58 @@
+import axios from 'axios'
+
+const CHUNK_SIZE = 1024 * 1024
+const MAX_RETRIES = 3
+
+// 同一文件再次上传时复用未完成的会话（断点续传）
+const sessionKey = (file, kind) => `upload:${kind}:${file.name}:${file.size}:${file.lastModified}`
+
+// 分块上传：创建（或恢复）会话，逐块上传缺失的分块，最后完成上传并返回服务端的结果
+export const chunkedUpload = async (file, kind, onProgress) => {
+  const key = sessionKey(file, kind)
+  let session = null
+  const savedId = localStorage.getItem(key)
+  if (savedId) {
+    try {
+      session = (await axios.get(`/api/uploads/sessions/${savedId}`)).data
+    } catch (error) {
+      localStorage.removeItem(key)
+    }
+  }
+  if (!session) {
+    session = (await axios.post('/api/uploads/sessions', {
+      kind,
+      filename: file.name,
+      size: file.size,
+      chunk_size: CHUNK_SIZE
+    })).data
+    localStorage.setItem(key, session.upload_id)
+  }
+
+  const received = new Set(session.received_chunks)
+  for (let index = 0; index < session.total_chunks; index++) {
+    if (received.has(index)) continue
+    const start = index * session.chunk_size
+    const chunk = file.slice(start, Math.min(start + session.chunk_size, file.size))
+    for (let attempt = 1; ; attempt++) {
+      try {
+        await axios.put(`/api/uploads/sessions/${session.upload_id}/chunks/${index}`, chunk, {
+          headers: { 'Content-Type': 'application/octet-stream' }
+        })
+        break
+      } catch (error) {
+        // 服务端拒绝（文件类型不符等）时放弃该会话；网络中断时重试，仍失败则保留会话以便下次续传
+        if (error.response) {
+          localStorage.removeItem(key)
+          throw error
+        }
+        if (attempt >= MAX_RETRIES) throw error
+      }
+    }
+    received.add(index)
+    onProgress?.(Math.round(received.size / session.total_chunks * 100))
+  }
+
+  const response = await axios.post(`/api/uploads/sessions/${session.upload_id}/complete`)
+  localStorage.removeItem(key)
+  return response.data
+}
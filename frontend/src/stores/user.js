@@ -1,4 +1,5 @@
 import { defineStore } from 'pinia'
+import axios from 'axios'
 import api from '../api'
 import router from '../router'
 
@@ -52,6 +53,20 @@ export const useUserStore = defineStore('user', {
       }
     },
 
+    // 主动退出：先通知服务端吊销当前令牌，失败时（如网络中断）仍清除本地登录状态
+    async signOut() {
+      if (this.token) {
+        try {
+          await axios.post('/api/logout', null, {
+            headers: { Authorization: `Bearer ${this.token}` }
+          })
+        } catch (error) {
+          console.error('Logout request failed:', error.message)
+        }
+      }
+      this.logout()
+    },
+
     logout() {
       this.token = ''
       this.userInfo = null